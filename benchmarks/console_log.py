@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Measure console log ingestion with many runs in progress.
+
+--runners simulated runners post --chunk byte chunks of console output to
+their own console.log under --dir for --seconds seconds from --threads
+threads, the way run_update does. This is done first by opening, appending
+to, and closing the log for each chunk and then for each of the given
+jobserv.console_log.Writer flush intervals.
+
+Point --dir at the JOBS_DIR filesystem, eg an NFS mount, to get meaningful
+numbers.
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jobserv.console_log import Writer  # NOQA
+
+
+def _open_append_close(path, data):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+def _post(append, paths, chunk, deadline, counts):
+    data = b'x' * (chunk - 1) + b'\n'
+    posted = 0
+    while time.time() < deadline:
+        for p in paths:
+            append(p, data)
+            posted += 1
+    counts.append(posted)
+
+
+def _run(args, name, append, finish=None):
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        paths = [os.path.join(workdir, 'run%d' % x, 'console.log')
+                 for x in range(args.runners)]
+        counts = []
+        threads = []
+        start = time.time()
+        for x in range(args.threads):
+            t = threading.Thread(
+                target=_post,
+                args=(append, paths[x::args.threads], args.chunk,
+                      start + args.seconds, counts))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        if finish:
+            finish()
+        elapsed = time.time() - start
+        posted = sum(counts)
+        size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        assert size == posted * args.chunk, 'lost %d bytes' % (
+            posted * args.chunk - size)
+        print('%-24s %8d chunks  %8.1f MB/s' % (
+              name, posted, size / elapsed / 1048576))
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main(args):
+    print('%d runners posting %d byte chunks from %d threads for %ds' % (
+          args.runners, args.chunk, args.threads, args.seconds))
+    _run(args, 'open/append/close', _open_append_close)
+    for interval in args.intervals:
+        w = Writer(interval, args.flush_size, args.fsync, args.runners, 60)
+        _run(args, 'writer interval=%gs' % interval, w.append, w.close_all)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', default=tempfile.gettempdir(),
+                        help='Where to write logs. default=%(default)s')
+    parser.add_argument('--runners', type=int, default=500,
+                        help='Runs in progress. default=%(default)d')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='Concurrent requests. default=%(default)d')
+    parser.add_argument('--chunk', type=int, default=4096,
+                        help='Bytes per post. default=%(default)d')
+    parser.add_argument('--seconds', type=int, default=10,
+                        help='Length of each test. default=%(default)d')
+    parser.add_argument('--intervals', type=float, nargs='+',
+                        default=[0, 1],
+                        help='Writer flush intervals to test. '
+                             'default=%(default)s')
+    parser.add_argument('--flush-size', type=int, default=65536,
+                        help='Writer flush size. default=%(default)d')
+    parser.add_argument('--fsync', default='none',
+                        choices=('none', 'write', 'close'))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(get_args())
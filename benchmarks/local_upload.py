@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Measure how fast local_storage can write an artifact upload to disk.
+
+A --size MB upload is read from a werkzeug LimitedStream, like the one
+run_upload_artifact gets, and written under --dir. This is done with the old
+4096 byte read/write loop and then with
+jobserv.storage.local_storage.receive_upload with and without a checksum.
+
+Point --dir at the LOCAL_ARTIFACTS_DIR filesystem to get meaningful numbers.
+'''
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from werkzeug.wsgi import LimitedStream
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jobserv.storage.local_storage import receive_upload  # NOQA
+
+
+def _loop_4096(stream, dst, tmpdir, length, sha256):
+    with open(dst, 'wb') as f:
+        while True:
+            chunk = stream.read(4096)
+            if len(chunk) == 0:
+                break
+            f.write(chunk)
+
+
+def _receive(stream, dst, tmpdir, length, sha256):
+    receive_upload(stream, dst, tmpdir, length)
+
+
+def _receive_sha256(stream, dst, tmpdir, length, sha256):
+    receive_upload(stream, dst, tmpdir, length, sha256=sha256)
+
+
+def _run(args, name, upload, src, sha256):
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        elapsed = []
+        for x in range(args.iterations):
+            dst = os.path.join(workdir, 'upload%d' % x)
+            with open(src, 'rb') as f:
+                stream = LimitedStream(f, args.size * 1048576)
+                start = time.time()
+                upload(stream, dst, workdir, args.size * 1048576, sha256)
+                elapsed.append(time.time() - start)
+            os.unlink(dst)
+        print('%-24s %8.1f MB/s' % (name, args.size / min(elapsed)))
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main(args):
+    print('%d MB upload, best of %d' % (args.size, args.iterations))
+    with tempfile.NamedTemporaryFile(dir=args.dir) as src:
+        sha256 = hashlib.sha256()
+        for _ in range(args.size):
+            chunk = os.urandom(1048576)
+            sha256.update(chunk)
+            src.write(chunk)
+        src.flush()
+        _run(args, '4096 byte loop', _loop_4096, src.name, None)
+        _run(args, 'receive_upload', _receive, src.name, None)
+        _run(args, 'receive_upload sha256', _receive_sha256, src.name,
+             sha256.hexdigest())
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', default=tempfile.gettempdir(),
+                        help='Where to write uploads. default=%(default)s')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Upload size in MB. default=%(default)d')
+    parser.add_argument('--iterations', type=int, default=3,
+                        help='Uploads per test. default=%(default)d')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(get_args())
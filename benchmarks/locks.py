@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Compare the LOCK_PROVIDERs used by StatusMixin.locked under contention.
+
+--threads threads repeatedly lock one of --builds builds and increment a
+counter kept in the build's name. This is the pattern used when run
+completions for a build are handled. The counter is checked at the end to
+prove every update was serialized, and lock latency is reported for each
+provider.
+
+This is meant to be pointed at a scratch MySQL database. THE TABLES IN THE
+DATABASE ARE DROPPED AND RE-CREATED.
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jobserv.models  # NOQA
+from jobserv import settings  # NOQA
+from jobserv.flask import create_app  # NOQA
+from jobserv.models import db, Build, Project  # NOQA
+
+
+def _populate(args):
+    db.drop_all()
+    db.create_all()
+    db.session.add(Project('bench'))
+    db.session.commit()
+    p = Project.query.first()
+    ids = []
+    for x in range(args.builds):
+        b = Build.create(p)
+        b.name = '0'
+        ids.append(b.id)
+    db.session.commit()
+    return ids
+
+
+def _locker(app, build_id, count, hold, timings):
+    with app.app_context():
+        b = Build.query.get(build_id)
+        for _ in range(count):
+            start = time.time()
+            with b.locked():
+                timings.append(time.time() - start)
+                b.name = str(int(b.name) + 1)
+                if hold:
+                    time.sleep(hold)
+        db.session.remove()
+
+
+def _bench(app, args, provider, build_ids):
+    jobserv.models.LOCK_PROVIDER = provider
+    timings = []
+    threads = []
+    start = time.time()
+    for x in range(args.threads):
+        t = threading.Thread(
+            target=_locker,
+            args=(app, build_ids[x % len(build_ids)], args.iterations,
+                  args.hold / 1000, timings))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    with app.app_context():
+        total = sum(int(b.name) for b in Build.query.all())
+        for b in Build.query.all():
+            b.name = '0'
+        db.session.commit()
+        db.session.remove()
+
+    timings.sort()
+    print('%-6s %6d locks in %6.2fs (%7.1f/s)  wait: avg %.2fms  '
+          'p99 %.2fms  max %.2fms' % (
+              provider, len(timings), elapsed, len(timings) / elapsed,
+              1000 * sum(timings) / len(timings),
+              1000 * timings[int(len(timings) * .99)],
+              1000 * timings[-1]))
+    expected = args.threads * args.iterations
+    if total != expected:
+        print('  ERROR: %d updates were lost' % (expected - total))
+
+
+def main(args):
+    app = create_app(settings)
+    jobs_dir = args.jobs_dir
+    if not jobs_dir:
+        jobs_dir = tempfile.mkdtemp()
+    jobserv.models.JOBS_DIR = jobs_dir
+
+    try:
+        with app.app_context():
+            build_ids = _populate(args)
+            db.session.remove()
+
+        print('%d threads x %d iterations over %d build(s), %dms hold' % (
+              args.threads, args.iterations, args.builds, args.hold))
+        for provider in args.providers.split(','):
+            _bench(app, args, provider, build_ids)
+    finally:
+        if not args.jobs_dir:
+            shutil.rmtree(jobs_dir)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--providers', default='file,db,mysql',
+                        help='Comma separated providers. default=%(default)s')
+    parser.add_argument('--jobs-dir',
+                        help='''Where "file" locks are created. eg a shared
+                             NFS mount. default=a temporary directory''')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='default=%(default)d')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Locks taken per thread. default=%(default)d')
+    parser.add_argument('--builds', type=int, default=1,
+                        help='Builds the threads contend on. '
+                             'default=%(default)d')
+    parser.add_argument('--hold', type=int, default=0,
+                        help='Milliseconds to hold each lock. '
+                             'default=%(default)d')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(get_args())
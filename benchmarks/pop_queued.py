@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Load test Run.pop_queued, the query behind every worker check-in.
+
+The database given by SQLALCHEMY_DATABASE_URI(_FMT) is populated with a runs
+table of --history completed runs plus --queued QUEUED runs spread over
+--tags host-tags. --workers simulated workers then check in from --threads
+threads. Every run a worker claims is put back in the queue so the queue
+depth stays constant for the length of the test.
+
+This is meant to be pointed at a scratch MySQL database. THE TABLES IN THE
+DATABASE ARE DROPPED AND RE-CREATED.
+'''
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jobserv import settings  # NOQA
+from jobserv.flask import create_app  # NOQA
+from jobserv.models import (  # NOQA
+    db, Build, BuildStatus, Project, Run, Worker)
+
+
+def _populate(args):
+    db.drop_all()
+    db.create_all()
+
+    db.session.add(Project('bench'))
+    db.session.commit()
+    p = Project.query.first()
+
+    num_builds = max(1, (args.history + args.queued) // args.runs_per_build)
+    db.session.execute(Build.__table__.insert(), [
+        {'build_id': x, 'proj_id': p.id, '_status': BuildStatus.PASSED.value}
+        for x in range(1, num_builds + 1)])
+
+    workers = []
+    for x in range(args.workers):
+        tag = 'tag%d' % (x % args.tags)
+        w = Worker('worker%d' % x, 'bench', 1, 1, 'amd64', 'key', 1, tag)
+        w.enlisted = True
+        db.session.add(w)
+        workers.append((w.name, tag))
+    db.session.commit()
+
+    total = args.history + args.queued
+    batch = []
+    for x in range(total):
+        status = BuildStatus.PASSED.value
+        if x >= args.history:
+            status = BuildStatus.QUEUED.value
+        batch.append({
+            'build_id': (x // args.runs_per_build) + 1,
+            'name': 'run%d' % x,
+            '_status': status,
+            'api_key': 'key',
+            'host_tag': 'tag%d' % (x % args.tags),
+            'worker_name': random.choice(workers)[0],
+        })
+        if len(batch) == 10000:
+            db.session.execute(Run.__table__.insert(), batch)
+            db.session.commit()
+            batch = []
+            print('  created %d runs' % (x + 1), end='\r')
+    if batch:
+        db.session.execute(Run.__table__.insert(), batch)
+    db.session.commit()
+    print('  created %d runs' % total)
+    return workers
+
+
+def _check_ins(app, workers, count, batch, timings):
+    with app.app_context():
+        for _ in range(count):
+            name, tag = random.choice(workers)
+            w = Worker.query.get(name)
+            start = time.time()
+            runs = Run.pop_queued(w, batch)
+            timings.append(time.time() - start)
+            if runs:
+                # put them back so the queue depth stays the same
+                for r in runs:
+                    r.status = BuildStatus.QUEUED
+                db.session.commit()
+        db.session.remove()
+
+
+def main(args):
+    app = create_app(settings)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        Run.in_test_mode = True
+
+    with app.app_context():
+        print('Populating database')
+        workers = _populate(args)
+        db.session.remove()
+
+    print('Running %d check-ins from %d threads' % (
+          args.check_ins, args.threads))
+    timings = []
+    threads = []
+    start = time.time()
+    for x in range(args.threads):
+        t = threading.Thread(
+            target=_check_ins,
+            args=(app, workers, args.check_ins // args.threads, args.batch,
+                  timings))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    timings.sort()
+    print('check-ins:   %d in %.2fs (%.1f/s)' % (
+          len(timings), elapsed, len(timings) / elapsed))
+    print('pop_queued:  avg %.2fms  p50 %.2fms  p99 %.2fms  max %.2fms' % (
+          1000 * sum(timings) / len(timings),
+          1000 * timings[len(timings) // 2],
+          1000 * timings[int(len(timings) * .99)],
+          1000 * timings[-1]))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, default=1000000,
+                        help='Completed runs to create. default=%(default)d')
+    parser.add_argument('--queued', type=int, default=200,
+                        help='Queued runs to create. default=%(default)d')
+    parser.add_argument('--runs-per-build', type=int, default=20,
+                        help='default=%(default)d')
+    parser.add_argument('--tags', type=int, default=4,
+                        help='Number of host-tags. default=%(default)d')
+    parser.add_argument('--workers', type=int, default=300,
+                        help='Number of workers. default=%(default)d')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Concurrent check-ins. default=%(default)d')
+    parser.add_argument('--check-ins', type=int, default=5000,
+                        help='Total check-ins. default=%(default)d')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='''Runs requested per check-in, ie the worker's
+                             available_runners. default=%(default)d''')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(get_args())
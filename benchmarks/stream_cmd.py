@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Measure the CPU cost and throughput of the runner's stream_cmd.
+
+A command emitting --size bytes of output is streamed through stream_cmd with
+a callback that discards the data. The CPU time reported is for this process
+only, ie what the runner spends streaming rather than what the command costs.
+'''
+
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../runner'))
+
+from jobserv_runner.cmd import READ_SIZE, stream_cmd  # NOQA
+
+
+def main(args):
+    total = [0, 0]  # bytes, callbacks
+
+    def cb(buff):
+        total[0] += len(buff)
+        total[1] += 1
+        return True
+
+    cmd = ['head', '-c', str(args.size), '/dev/zero']
+    if args.rate:
+        # emit output in small bursts so the command is mostly idle
+        chunk = max(args.rate // 100, 1)
+        cmd = ['/bin/sh', '-c',
+               'for i in $(seq %d); do head -c %d /dev/zero; sleep 0.01; done'
+               % (args.size // chunk, chunk)]
+
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    stream_cmd(cb, cmd, read_size=args.read_size)
+    elapsed = time.time() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (usage.ru_utime - start_usage.ru_utime) + \
+        (usage.ru_stime - start_usage.ru_stime)
+    print('bytes streamed:  %d' % total[0])
+    print('callbacks:       %d' % total[1])
+    print('wall time:       %.2fs' % elapsed)
+    print('cpu time:        %.2fs (%.1f%% of a core)' % (
+          cpu, 100 * cpu / elapsed))
+    print('throughput:      %.1f MB/s' % (total[0] / elapsed / 1048576))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1024 * 1024 * 1024,
+                        help='Bytes of output to stream. default=%(default)d')
+    parser.add_argument('--read-size', type=int, default=READ_SIZE,
+                        help='stream_cmd read size. default=%(default)d')
+    parser.add_argument('--rate', type=int, default=0,
+                        help='''Throttle the command to roughly this many
+                             bytes/second to measure the cost of an idle
+                             command''')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(get_args())
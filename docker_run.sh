@@ -31,7 +31,12 @@ if [ -z "$FLASK_DEBUG" ] ; then
 	if [ -n "$STATSD_HOST" ] ; then
 		STATSD="--statsd-host $STATSD_HOST"
 	fi
-	exec /usr/bin/gunicorn $STATSD -n jobserv -w4 -b 0.0.0.0:8000 $FLASK_APP
+	# Threads allow worker check-ins to long-poll without starving the API.
+	# See WORKER_LONG_POLL_MAX in jobserv/settings.py
+	if [ -n "$GUNICORN_THREADS" ] ; then
+		THREADS="--threads $GUNICORN_THREADS"
+	fi
+	exec /usr/bin/gunicorn $STATSD $THREADS -n jobserv -w4 -b 0.0.0.0:8000 $FLASK_APP
 fi
 
 exec /usr/bin/flask run -h 0.0.0.0 -p 8000
@@ -2,13 +2,22 @@
 # Author: Andy Doan <andy.doan@linaro.org>
 
 from flask import Blueprint, request, url_for
+from sqlalchemy.orm import selectinload
 
+from jobserv.api.run import list_artifacts
 from jobserv.storage import Storage
 from jobserv.internal_requests import internal_api
 from jobserv.jsend import (
-    ApiError, get_or_404, jsendify, paginate, paginate_custom
+    ApiError,
+    get_or_404,
+    jsendify,
+    jsendify_cached,
+    paginate,
+    paginate_custom,
+    uncache,
 )
-from jobserv.models import Build, BuildStatus, Project, db
+from jobserv.models import (
+    Build, BuildStatus, Project, Run, RunManifest, Test, db)
 from jobserv.trigger import trigger_build
 
 blueprint = Blueprint(
@@ -18,8 +27,9 @@ blueprint = Blueprint(
 @blueprint.route('/builds/', methods=('GET',))
 def build_list(proj):
     p = get_or_404(Project.query.filter(Project.name == proj))
-    q = Build.query.filter_by(proj_id=p.id).order_by(Build.id.desc())
-    return paginate('builds', q)
+    q = Build.query.filter_by(proj_id=p.id).order_by(
+        Build.build_id.desc()).options(*Build.serialize_options())
+    return paginate('builds', q, Build.build_id)
 
 
 @blueprint.route('/builds/', methods=('POST',))
@@ -40,7 +50,13 @@ def build_get(proj, build_id):
     p = get_or_404(Project.query.filter(Project.name == proj))
     b = get_or_404(
         Build.query.filter(Build.project == p, Build.build_id == build_id))
-    return jsendify({'build': b.as_json(detailed=True)})
+
+    def create():
+        # b is already loaded, this just eager loads what as_json needs
+        Build.query.filter(Build.id == b.id).options(
+            *Build.serialize_options()).one()
+        return {'build': b.as_json(detailed=True)}
+    return jsendify_cached(b, create, b.name, b.annotation)
 
 
 @blueprint.route('/builds/<int:build_id>/project.yml', methods=('GET',))
@@ -63,7 +79,7 @@ def build_get_latest(proj):
             Build.status == BuildStatus.PASSED,
         ).order_by(
             Build.id.desc()
-        )
+        ).options(*Build.serialize_options())
     )
     return jsendify({'build': b.as_json(detailed=True)})
 
@@ -85,23 +101,33 @@ def build_promote(proj, build_id):
     b.name = data.get('name')
     b.annotation = data.get('annotation')
     db.session.commit()
+    uncache(b)
     return jsendify({}, 201)
 
 
-def _promoted_as_json(storage, build):
+def _promoted_as_json(storage, manifests, build):
     rv = build.as_json(detailed=True)
     rv['tests'] = []
     rv['artifacts'] = []
     for run in build.runs:
+        run_url = run.url(rv['url'])
         for t in run.tests:
-            test = t.as_json(detailed=True)
+            test = t.as_json(detailed=True, run_url=run_url)
             test['name'] = '%s-%s' % (run.name, test['name'])
             rv['tests'].append(test)
-        for a in storage.list_artifacts(run):
+        for a in list_artifacts(run, storage, manifests):
             rv['artifacts'].append('%s/%s' % (run.name, a))
     return rv
 
 
+def _promoted_options():
+    return Build.serialize_options() + (
+        selectinload(Build.runs).selectinload(Run.tests).selectinload(
+            Test.results),
+        selectinload(Build.runs).selectinload(Run.manifest),
+    )
+
+
 @blueprint.route('/promoted-builds/', methods=('GET',))
 def promoted_build_list(proj):
     p = get_or_404(Project.query.filter_by(name=proj))
@@ -109,10 +135,16 @@ def promoted_build_list(proj):
         Build.proj_id == p.id
     ).filter(
         Build.status == BuildStatus.PROMOTED
-    ).order_by(Build.id.desc())
+    ).order_by(Build.build_id.desc()).options(*_promoted_options())
 
     s = Storage()
-    return paginate_custom('builds', q, lambda x: _promoted_as_json(s, x))
+    manifests = []
+    resp = paginate_custom(
+        'builds', q, lambda x: _promoted_as_json(s, manifests, x),
+        Build.build_id)
+    if manifests:
+        RunManifest.save(manifests)
+    return resp
 
 
 @blueprint.route('/promoted-builds/<name>/', methods=('GET',))
@@ -121,5 +153,9 @@ def promoted_build_get(proj, name):
         Project.name == proj,
         Build.status == BuildStatus.PROMOTED,
         Build.name == name,
-    ))
-    return jsendify({'build': _promoted_as_json(Storage(), b)})
+    ).options(*_promoted_options()))
+    manifests = []
+    resp = jsendify({'build': _promoted_as_json(Storage(), manifests, b)})
+    if manifests:
+        RunManifest.save(manifests)
+    return resp
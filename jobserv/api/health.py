@@ -1,12 +1,18 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import datetime
+import threading
+import time
+
 from flask import Blueprint, url_for
 
 from sqlalchemy import func
+from werkzeug.urls import url_quote
 
 from jobserv.jsend import ApiError, jsendify
-from jobserv.models import BuildStatus, Run, db
+from jobserv.models import Build, BuildEvents, BuildStatus, Project, Run, db
+from jobserv.settings import HEALTH_SNAPSHOT_TTL
 
 blueprint = Blueprint('api_health', __name__, url_prefix='/health')
 
@@ -16,8 +22,37 @@ def api_error(e):
     return e.resp
 
 
-@blueprint.route('/runs/')
-def run_health():
+class _Snapshot(object):
+    '''Dashboards poll /health/runs every few seconds and generating it
+       means looking at every run in progress. Its generated at most every
+       HEALTH_SNAPSHOT_TTL seconds by one thread while others serve the
+       previous snapshot.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.data = None
+        self.expires = 0
+
+    def get(self, generate):
+        if self.data is None or time.time() >= self.expires:
+            # Only wait for the lock if we have nothing to serve
+            if self._lock.acquire(blocking=self.data is None):
+                try:
+                    if self.data is None or time.time() >= self.expires:
+                        self.data = generate()
+                        self.expires = time.time() + HEALTH_SNAPSHOT_TTL
+                finally:
+                    self._lock.release()
+        return self.data
+
+
+run_health_snapshot = _Snapshot()
+
+
+def _run_health():
     health = {}
     # get an overall count for each run state
     vals = db.session.query(
@@ -30,23 +65,54 @@ def run_health():
     health['QUEUED'] = []
 
     active = (BuildStatus.QUEUED, BuildStatus.RUNNING, BuildStatus.UPLOADING)
-    runs = Run.query.filter(Run.status.in_(active)).order_by(Run.id.desc())
-    for run in runs:
-        url = url_for('api_run.run_get', proj=run.build.project.name,
-                      build_id=run.build.build_id,
-                      run=run.name, _external=True)
+    runs = db.session.query(
+        Run.name, Run._status, Run.worker_name, Run.build_id,
+        Build.build_id, Project.name,
+    ).join(
+        Build, Run.build_id == Build.id
+    ).join(
+        Project, Build.proj_id == Project.id
+    ).filter(
+        Run.status.in_(active)
+    ).order_by(
+        Run.id.desc()
+    ).all()
+
+    created = {}
+    build_urls = {}
+    build_ids = set(x[3] for x in runs)
+    if build_ids:
+        created = dict(db.session.query(
+            BuildEvents.build_id, func.min(BuildEvents.time)
+        ).filter(
+            BuildEvents.build_id.in_(build_ids)
+        ).group_by(BuildEvents.build_id))
+
+    for name, status, worker, build_pk, build_id, project in runs:
+        build_url = build_urls.get(build_pk)
+        if not build_url:
+            build_url = build_urls[build_pk] = url_for(
+                'api_build.build_get', proj=project, build_id=build_id,
+                _external=True)
         item = {
-            'project': run.build.project.name,
-            'build': run.build.build_id,
-            'run': run.name,
-            'url': url,
-            'created': run.build.status_events[0].time
+            'project': project,
+            'build': build_id,
+            'run': name,
+            'url': '%sruns/%s/' % (build_url, url_quote(name)),
+            'created': created.get(build_pk),
         }
 
-        if run.status == BuildStatus.QUEUED:
+        if status == BuildStatus.QUEUED.value:
             health['QUEUED'].append(item)
         else:
-            worker = run.worker_name or '?'
-            health['RUNNING'].setdefault(worker, []).append(item)
+            health['RUNNING'].setdefault(worker or '?', []).append(item)
 
-    return jsendify({'health': health})
+    return {
+        'health': health,
+        'generated': datetime.datetime.utcnow(),
+    }
+
+
+@blueprint.route('/runs/')
+def run_health():
+    return jsendify(run_health_snapshot.get(_run_health))
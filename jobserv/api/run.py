@@ -3,21 +3,59 @@
 
 import json
 import re
+import time
 
 import yaml
 
-from flask import Blueprint, current_app, request, send_file, url_for
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    request,
+    stream_with_context,
+    url_for,
+)
+from sqlalchemy.orm import selectinload
+from werkzeug.urls import url_quote
 
+from jobserv.cache import LRUCache
 from jobserv.flask import permissions
 from jobserv.storage import Storage
-from jobserv.jsend import ApiError, get_or_404, jsendify
+from jobserv.storage.base import send_local_file
+from jobserv.jsend import (
+    ApiError, get_or_404, jsendify, jsendify_cached, uncache
+)
 from jobserv.models import (
-    db, Build, BuildStatus, Project, Run, Test, TestResult
+    db,
+    Build,
+    BuildStatus,
+    Project,
+    Run,
+    RunCompletion,
+    RunManifest,
+    Test,
+    TestResult,
 )
 from jobserv.project import ProjectDefinition
 from jobserv.sendmail import notify_build_complete
+from jobserv.settings import (
+    ASYNC_RUN_COMPLETION,
+    LOG_TAIL_INTERVAL,
+    LOG_TAIL_SSE,
+    LOG_TAIL_SSE_MAX,
+    PROJECT_DEFINITION_CACHE_SIZE,
+)
 from jobserv.trigger import trigger_runs
 
+# How many grepped test results are written to the DB at once
+TEST_GREP_BATCH_SIZE = 1000
+
+# The most console log data sent in one response or server-sent event
+LOG_TAIL_CHUNK_SIZE = 1048576
+
+# Parsed ProjectDefinitions keyed by Build.id
+projdef_cache = LRUCache(PROJECT_DEFINITION_CACHE_SIZE)
+
 prefix = '/projects/<project:proj>/builds/<int:build_id>/runs'
 blueprint = Blueprint('api_run', __name__, url_prefix=prefix)
 
@@ -26,7 +64,15 @@ blueprint = Blueprint('api_run', __name__, url_prefix=prefix)
 def run_list(proj, build_id):
     p = get_or_404(Project.query.filter_by(name=proj))
     b = get_or_404(Build.query.filter_by(project=p, build_id=build_id))
-    return jsendify({'runs': [x.as_json(detailed=False) for x in b.runs]})
+
+    def create():
+        url = url_for('api_build.build_get', proj=p.name,
+                      build_id=b.build_id, _external=True)
+        runs = Run.query.filter_by(build_id=b.id).order_by(Run.id).options(
+            selectinload(Run.status_events))
+        return {
+            'runs': [x.as_json(detailed=False, build_url=url) for x in runs]}
+    return jsendify_cached(b, create)
 
 
 def _get_run(proj, build_id, run):
@@ -39,23 +85,43 @@ def _get_run(proj, build_id, run):
     ).first_or_404()
 
 
+def list_artifacts(run, storage=None, manifests=None):
+    '''Return the paths of the run's artifacts. Storage is listed for runs in
+       progress. A completed run's artifacts are recorded in a RunManifest
+       the first time they are listed. Callers listing several runs can
+       pass a `manifests` list to collect them in and RunManifest.save them
+       once they are done.'''
+    if run.complete and run.manifest:
+        return run.manifest.paths
+    storage = storage or Storage()
+    if not run.complete:
+        return list(storage.list_artifacts(run))
+    artifacts = storage.list_artifact_details(run)
+    if manifests is None:
+        RunManifest.save([RunManifest(run, artifacts)])
+    else:
+        manifests.append(RunManifest(run, artifacts))
+    # recording can fail (eg a huge manifest) so use the listing directly
+    return sorted(x['path'] for x in artifacts)
+
+
 @blueprint.route('/<run>/', methods=('GET',))
 def run_get(proj, build_id, run):
     r = _get_run(proj, build_id, run)
-    data = r.as_json(detailed=True)
-    artifacts = []
-    for a in Storage().list_artifacts(r):
-        u = url_for('api_run.run_get_artifact', proj=proj, build_id=build_id,
-                    run=run, path=a, _external=True)
-        artifacts.append(u)
-    data['artifacts'] = artifacts
-    return jsendify({'run': data})
+
+    def create():
+        data = r.as_json(detailed=True)
+        data['artifacts'] = [
+            data['url'] + url_quote(a) for a in list_artifacts(r)]
+        return {'run': data}
+    return jsendify_cached(r, create)
 
 
 def _create_triggers(projdef, storage, build, params, secrets, triggers):
     for trigger in triggers:
         run_names = trigger.get('run-names')
-        trigger = projdef.get_trigger(trigger['name'])
+        # copy it, the projdef may be shared via the projdef_cache
+        trigger = projdef.get_trigger(trigger['name']).copy()
         trigger['run-names'] = run_names
         trigger_runs(storage, projdef, build, trigger, params, secrets)
 
@@ -82,12 +148,19 @@ def _handle_build_complete(projdef, storage, build, params, secrets, trigger):
             build.refresh_status()
 
 
+def _get_projdef(storage, build):
+    '''Every run completing in a build needs its project definition, so
+       cache them rather than downloading and parsing it each time.'''
+    return projdef_cache.get_or_create(
+        build.id, lambda: ProjectDefinition(
+            yaml.load(storage.get_project_definition(build))))
+
+
 def _handle_triggers(storage, run):
     if not run.complete or not run.trigger:
         return
 
-    projdef = ProjectDefinition(
-        yaml.load(storage.get_project_definition(run.build)))
+    projdef = _get_projdef(storage, run.build)
     rundef = json.loads(storage.get_run_definition(run))
     secrets = rundef.get('secrets')
     params = rundef.get('env', {})
@@ -112,9 +185,26 @@ def _handle_triggers(storage, run):
             f.write(content)
             f.write('\n\n== ERROR TRIGGERING RUN: %s\n' % e)
         storage.copy_log(run)
-
-
-def _failed_tests(storage, run):
+        run.manifest = None  # console.log has changed
+
+
+def _write_test_results(tests, results):
+    '''Write out the batch of Tests and TestResults found by failed_tests.
+       TestResults are bulk inserted since there can be a lot of them.'''
+    db.session.add_all(tests)
+    db.session.flush()  # get the IDs of the tests
+    if results:
+        db.session.execute(TestResult.__table__.insert(), [
+            {'test_id': test.id, 'name': name, 'context': None,
+             '_status': BuildStatus[status].value}
+            for test, name, status in results])
+    del tests[:]
+    del results[:]
+
+
+def failed_tests(storage, run):
+    '''Grep the run's console log for test results. Returns True if any
+       failed.'''
     failures = False
     rundef = json.loads(storage.get_run_definition(run))
     grepping = rundef.get('test-grepping')
@@ -125,20 +215,18 @@ def _failed_tests(storage, run):
         res_pat = re.compile(grepping['result-pattern'])
         fixups = grepping.get('fixupdict', {})
         cur_test = None
+        tests = []
+        results = []
         with storage.console_logfd(run, 'r') as f:
-            for line in f.readlines():
+            # iterate rather than readlines() since logs can be huge
+            for line in f:
                 if test_pat:
                     m = test_pat.match(line)
                     if m:
-                        if cur_test:
-                            statuses = [x.status for x in cur_test.results]
-                            if BuildStatus.FAILED in statuses:
-                                cur_test.status = BuildStatus.FAILED
                         cur_test = Test(
                             run, m.group('name'), grepping['test-pattern'],
                             BuildStatus.PASSED)
-                        db.session.add(cur_test)
-                        db.session.flush()
+                        tests.append(cur_test)
                 m = res_pat.match(line)
                 if m:
                     result = m.group('result')
@@ -149,10 +237,11 @@ def _failed_tests(storage, run):
                             cur_test.status = result
                     if not cur_test:
                         cur_test = Test(run, 'default', None, result)
-                        db.session.add(cur_test)
-                        db.session.flush()
-                    db.session.add(
-                        TestResult(cur_test, m.group('name'), None, result))
+                        tests.append(cur_test)
+                    results.append((cur_test, m.group('name'), result))
+                    if len(results) >= TEST_GREP_BATCH_SIZE:
+                        _write_test_results(tests, results)
+        _write_test_results(tests, results)
         db.session.commit()
     return failures
 
@@ -180,8 +269,7 @@ def run_update(proj, build_id, run):
 
     storage = Storage()
     if request.data:
-        with storage.console_logfd(r, 'ab') as f:
-            f.write(request.data)
+        storage.append_console_log(r, request.data)
 
     metadata = request.headers.get('X-RUN-METADATA')
     if metadata:
@@ -193,17 +281,28 @@ def run_update(proj, build_id, run):
         status = BuildStatus[status]
         if r.status != status:
             if status in (BuildStatus.PASSED, BuildStatus.FAILED):
-                if _failed_tests(storage, r):
+                if ASYNC_RUN_COMPLETION:
+                    # see jobserv.run_completion
+                    RunCompletion.queue(r, status, request.url)
+                    return jsendify({})
+                storage.flush_console_log(r)
+                if failed_tests(storage, r):
                     status = BuildStatus.FAILED
                 storage.copy_log(r)
-            with r.build.locked():
-                r.set_status(status)
-                if r.complete:
-                    _handle_triggers(storage, r)
+            set_run_status(storage, r, status)
 
     return jsendify({})
 
 
+def set_run_status(storage, run, status):
+    with run.build.locked():
+        run.set_status(status)
+        if run.complete:
+            _handle_triggers(storage, run)
+    uncache(run)
+    uncache(run.build)
+
+
 @blueprint.route('/<run>/.rundef.json', methods=('GET',))
 def run_get_definition(proj, build_id, run):
     r = _get_run(proj, build_id, run)
@@ -223,9 +322,105 @@ def run_get_definition(proj, build_id, run):
     return rundef, 200, {'Content-Type': 'application/json'}
 
 
+def _log_offset():
+    '''Return the offset requested by ?offset=N, a "Range: bytes=N-" header
+       or the Last-Event-ID of a server-sent event client.'''
+    offset = request.args.get('offset')
+    if offset is None:
+        offset = request.headers.get('Last-Event-ID')
+    if offset is None:
+        m = re.match(r'^bytes=(\d+)-$', request.headers.get('Range', ''))
+        if m:
+            offset = m.group(1)
+    if offset is None:
+        return None
+    if not offset.isdigit():
+        raise ApiError(400, {'message': 'Invalid log offset: ' + offset})
+    return int(offset)
+
+
+def _tail_console_log(run, offset):
+    '''Return the console log data past offset and the offset of the data
+       that comes after it.'''
+    try:
+        with Storage().console_logfd(run, 'rb') as f:
+            f.seek(offset)
+            data = f.read(LOG_TAIL_CHUNK_SIZE)
+    except FileNotFoundError:
+        data = b''
+    return data, offset + len(data)
+
+
+def _sse_event(data, offset):
+    # Lines are sent as separate "data:" fields which the client joins back
+    # together with newlines. Each event continues where the last left off.
+    lines = data.decode(errors='replace').split('\n')
+    return 'id: %d\n%s\n' % (offset, ''.join('data: %s\n' % x for x in lines))
+
+
+def _sse_console_log(run, offset):
+    '''Generate server-sent events with the log data appended to a run in
+       progress until it completes or we've been connected LOG_TAIL_SSE_MAX
+       seconds. Clients reconnect with the Last-Event-ID we send so they'll
+       pick up where they left off.'''
+    yield 'retry: %d\n\n' % (LOG_TAIL_INTERVAL * 1000)
+    storage = Storage()
+    start = last_sent = time.time()
+    db.session.commit()  # end the request's transaction to see new updates
+    f = None
+    try:
+        while True:
+            if not f:
+                try:
+                    f = storage.console_logfd(run, 'rb')
+                except FileNotFoundError:
+                    pass  # its queued, or completed and moved to storage
+            data = b''
+            if f:
+                f.seek(offset)
+                data = f.read(LOG_TAIL_CHUNK_SIZE)
+            if data:
+                # try not to split lines or multi-byte characters
+                end = data.rfind(b'\n') + 1
+                if end:
+                    data = data[:end]
+                offset += len(data)
+                last_sent = time.time()
+                yield _sse_event(data, offset)
+                continue
+
+            db.session.refresh(run)
+            complete, status = run.complete, run.status
+            # don't hold a transaction open while we sleep
+            db.session.commit()
+            if complete:
+                if f and f.read(1):
+                    continue  # data was written as it completed
+                yield 'event: complete\ndata: %s\n\n' % status.name
+                return
+            now = time.time()
+            if now - start >= LOG_TAIL_SSE_MAX:
+                return
+            if now - last_sent >= 15:
+                yield ': keep-alive\n\n'
+                last_sent = now
+            time.sleep(LOG_TAIL_INTERVAL)
+    finally:
+        if f:
+            f.close()
+
+
 @blueprint.route('/<run>/<path:path>', methods=('GET',))
 def run_get_artifact(proj, build_id, run, path):
     r = _get_run(proj, build_id, run)
+    sse = LOG_TAIL_SSE and path == 'console.log' and \
+        'text/event-stream' in request.headers.get('Accept', '')
+    if sse:
+        return Response(
+            stream_with_context(_sse_console_log(r, _log_offset() or 0)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
     if r.complete:
         storage = Storage()
         if path.endswith('.html'):
@@ -240,9 +435,27 @@ def run_get_artifact(proj, build_id, run, path):
         raise ApiError(
             404, {'message': 'Run in progress, no artifacts available'})
 
+    offset = _log_offset()
+    headers = {'Content-Type': 'text/plain'}
     if r.status == BuildStatus.QUEUED:
-        return '', 200, {'Content-Type': 'text/plain'}
-    return send_file(Storage().console_logfd(r, 'rb'), mimetype='text/plain')
+        if offset is not None:
+            headers['X-Next-Offset'] = str(offset)
+        return '', 200, headers
+    if offset is None:
+        path = Storage()._console_log_path(r)
+        try:
+            return send_local_file(path, 'text/plain')
+        except FileNotFoundError:
+            return '', 200, headers
+
+    data, next_offset = _tail_console_log(r, offset)
+    headers['X-Next-Offset'] = str(next_offset)
+    if 'Range' in request.headers:
+        if not data:
+            return '', 416, headers
+        headers['Content-Range'] = 'bytes %d-%d/*' % (offset, next_offset - 1)
+        return data, 206, headers
+    return data, 200, headers
 
 
 @blueprint.route('/<run>/create_signed', methods=('POST',))
@@ -1,10 +1,10 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
-from flask import Blueprint, request
+from flask import Blueprint, request, url_for
 
 from jobserv.api.run import _authenticate_runner, _get_run, _handle_triggers
-from jobserv.jsend import jsendify
+from jobserv.jsend import jsendify, jsendify_cached, uncache
 from jobserv.models import BuildStatus, Run, Test, TestResult, db
 from jobserv.storage import Storage
 
@@ -15,7 +15,13 @@ blueprint = Blueprint('api_test', __name__, url_prefix=prefix)
 @blueprint.route('/', methods=('GET',))
 def test_list(proj, build_id, run):
     r = _get_run(proj, build_id, run)
-    return jsendify({'tests': [x.as_json(detailed=False) for x in r.tests]})
+
+    def create():
+        url = url_for('api_run.run_get', proj=proj, build_id=build_id,
+                      run=run, _external=True)
+        return {'tests': [
+            x.as_json(detailed=False, run_url=url) for x in r.tests]}
+    return jsendify_cached(r, create)
 
 
 @blueprint.route('/<test>/', methods=('GET',))
@@ -60,8 +66,7 @@ def test_update(proj, build_id, run, test):
         storage = Storage()
 
         if msg:
-            with storage.console_logfd(r, 'a') as f:
-                f.write(msg)
+            storage.append_console_log(r, msg.encode())
         if results:
             for tr in results:
                 s = BuildStatus[tr['status']]
@@ -71,11 +76,14 @@ def test_update(proj, build_id, run, test):
             run_status = t.set_status(status)
             db.session.commit()
             if run_status in (BuildStatus.PASSED, BuildStatus.FAILED):
+                storage.flush_console_log(r)
                 storage.copy_log(r)
             if run_status is not None:
                 with r.build.locked():
                     t.run.set_status(run_status)
                     if r.complete:
                         _handle_triggers(storage, r)
+                uncache(r)
+                uncache(r.build)
 
     return jsendify({'complete': t.run.complete})
@@ -18,7 +18,9 @@ def test_find():
         raise ApiError(401, {'message': 'Missing "context" query argument'})
 
     tests = []
-    for t in Test.query.filter_by(context=context):
+    q = Test.query.filter_by(context=context).options(
+        *Test.serialize_options())
+    for t in q:
         tests.append(t.as_json(detailed=True))
         tests[-1]['metadata'] = t.run.meta
         tests[-1]['api_key'] = t.run.api_key
@@ -30,7 +32,9 @@ def test_find():
 def test_incomplete_list():
     tests = []
     complete = (BuildStatus.PASSED, BuildStatus.FAILED)
-    for t in Test.query.filter(~Test.status.in_(complete)):
+    q = Test.query.filter(~Test.status.in_(complete)).options(
+        *Test.serialize_options())
+    for t in q:
         tests.append(t.as_json(detailed=True))
         tests[-1]['metadata'] = t.run.meta
         tests[-1]['api_key'] = t.run.api_key
@@ -3,7 +3,9 @@
 
 import functools
 import json
+import math
 import os
+import time
 import urllib.parse
 
 from flask import Blueprint, request, send_file
@@ -11,10 +13,13 @@ from flask import Blueprint, request, send_file
 from jobserv.jsend import ApiError, get_or_404, jsendify, paginate
 from jobserv.models import Run, Worker, db
 from jobserv.project import ProjectDefinition
+from jobserv.queue_notify import wait_for_runs
 from jobserv.settings import (
     RUNNER,
     SIMULATOR_SCRIPT,
     SIMULATOR_SCRIPT_VERSION,
+    WORKER_LONG_POLL_INTERVAL,
+    WORKER_LONG_POLL_MAX,
     WORKER_SCRIPT,
     WORKER_SCRIPT_VERSION,
 )
@@ -22,6 +27,11 @@ from jobserv.storage import Storage
 
 blueprint = Blueprint('api_worker', __name__, url_prefix='/')
 
+# A check-in's ping is recorded before it waits. Workers are marked offline
+# after 80 seconds without one (see jobserv.worker), so waits are kept short
+# enough for the worker to check in again before then.
+LONG_POLL_LIMIT = 60
+
 
 def _is_worker_authenticated(host):
     key = request.headers.get('Authorization', None)
@@ -50,7 +60,8 @@ def worker_authenticated(f):
 
 @blueprint.route('workers/', methods=('GET',))
 def worker_list():
-    return paginate('workers', Worker.query)
+    return paginate('workers', Worker.query.order_by(Worker.name),
+                    Worker.name, descending=False)
 
 
 def _fix_run_urls(rundef):
@@ -70,6 +81,25 @@ def _fix_run_urls(rundef):
     return json.dumps(rundef)
 
 
+def _pop_queued(worker, runners):
+    '''Pop runs for the worker. If the worker asked to wait, hold the
+       check-in open until runs are queued for it or the wait expires.'''
+    try:
+        wait = float(request.args.get('wait', 0))
+        if math.isnan(wait):
+            raise ValueError()  # it would never expire
+    except ValueError:
+        raise ApiError(400, 'Invalid wait value')
+    wait = min(wait, WORKER_LONG_POLL_MAX, LONG_POLL_LIMIT)
+    deadline = time.time() + wait
+    while True:
+        runs = Run.pop_queued(worker, runners)
+        remaining = deadline - time.time()
+        if runs or remaining <= 0:
+            return runs
+        wait_for_runs(min(remaining, WORKER_LONG_POLL_INTERVAL))
+
+
 @blueprint.route('workers/<name>/', methods=('GET',))
 def worker_get(name):
     w = get_or_404(Worker.query.filter_by(name=name))
@@ -79,21 +109,26 @@ def worker_get(name):
         data['version'] = WORKER_SCRIPT_VERSION
 
         if w.enlisted:
-            w.ping(**request.args)
+            w.ping(**request.args.to_dict(flat=False))
 
         runners = int(request.args.get('available_runners', '0'))
         if runners > 0 and w.available:
-            r = Run.pop_queued(w)
-            if r:
+            runs = _pop_queued(w, runners)
+            if runs:
                 try:
                     s = Storage()
-                    with s.console_logfd(r, 'a') as f:
-                        f.write("# Run sent to worker: %s\n" % name)
-                    data['run-defs'] = [_fix_run_urls(s.get_run_definition(r))]
-                    r.build.refresh_status()
+                    data['run-defs'] = []
+                    for r in runs:
+                        s.append_console_log(
+                            r, b'# Run sent to worker: %s\n' % name.encode())
+                        data['run-defs'].append(
+                            _fix_run_urls(s.get_run_definition(r)))
+                    for b in set(r.build for r in runs):
+                        b.refresh_status()
                 except:
-                    r.worker = None
-                    r.status = 'QUEUED'
+                    for r in runs:
+                        r.worker = None
+                        r.status = 'QUEUED'
                     db.session.commit()
                     raise
 
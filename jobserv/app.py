@@ -17,7 +17,18 @@ from jobserv.flask import create_app
 from jobserv.git_poller import run
 from jobserv.lava_reactor import run_reaper
 from jobserv.models import (
-    Project, ProjectTrigger, TriggerTypes, Worker, db)
+    Build,
+    BuildRunCounts,
+    BuildStatus,
+    Project,
+    ProjectTrigger,
+    Run,
+    RunManifest,
+    TriggerTypes,
+    Worker,
+    db,
+)
+from jobserv.run_completion import run_completion_processor
 from jobserv.sendmail import email_on_exception
 from jobserv.storage import Storage
 from jobserv.worker import run_monitor_workers
@@ -40,6 +51,11 @@ def monitor_workers():
     run_monitor_workers()
 
 
+@app.cli.command()
+def process_run_completions():
+    run_completion_processor(app)
+
+
 @app.cli.group()
 def project():
     pass
@@ -218,6 +234,41 @@ def worker_enlist(name):
     db.session.commit()
 
 
+@app.cli.command('rebuild-run-counts')
+def rebuild_run_counts():
+    '''Recalculate the per-build run counters used for build status.'''
+    BuildRunCounts.rebuild()
+    db.session.commit()
+
+
+@app.cli.command('compress-logs')
+@click.option('--project', '-p', help='Only compress this project\'s logs')
+def compress_logs(project=None):
+    '''Compress the console logs copied to storage before
+       CONSOLE_LOG_COMPRESSION was set.'''
+    query = db.session.query(Run.id).filter(Run._status.in_(
+        (BuildStatus.PASSED.value, BuildStatus.FAILED.value)))
+    if project:
+        query = query.join(Build).join(Project).filter(Project.name == project)
+    run_ids = [x[0] for x in query.order_by(Run.id)]
+    db.session.commit()
+
+    storage = Storage()
+    compressed = 0
+    for run_id in run_ids:
+        run = Run.query.get(run_id)
+        try:
+            if storage.compress_log(run):
+                compressed += 1
+                # the log's size and checksum have changed
+                RunManifest.query.filter_by(run_id=run.id).delete()
+        except Exception as e:
+            click.echo('Unable to compress log of %r: %s' % (run, e))
+        db.session.commit()
+    click.echo('Compressed %d of %d console logs' % (
+        compressed, len(run_ids)))
+
+
 @app.cli.command('backup')
 @email_on_exception('jobserv: DB Backup Failed')
 def backup():
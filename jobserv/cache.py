@@ -0,0 +1,61 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''A small, thread-safe, process-wide cache that keeps the `size` most
+       recently used items. The hits and misses counters can be used to
+       see how effective it is.'''
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+    def put(self, key, value):
+        if self.size < 1:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        '''Return the cached item for key, calling create() to produce it if
+           its not cached. create is called without the lock held, so two
+           threads missing at once may both call it.'''
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            return self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
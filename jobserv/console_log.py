@@ -0,0 +1,218 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Appends the console output runners post to the console.log of their run.
+
+Opening, appending to, and closing console.log for every chunk is a lot of
+small file operations with hundreds of runs in progress, especially when
+JOBS_DIR is on NFS. When CONSOLE_LOG_MAX_OPEN is set, the Writer keeps an
+append handle open for each run in progress, and can optionally buffer
+appends so they are written out at most every CONSOLE_LOG_FLUSH_INTERVAL
+seconds.'''
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from jobserv.settings import (
+    CONSOLE_LOG_FLUSH_INTERVAL,
+    CONSOLE_LOG_FLUSH_SIZE,
+    CONSOLE_LOG_FSYNC,
+    CONSOLE_LOG_IDLE_TIMEOUT,
+    CONSOLE_LOG_MAX_OPEN,
+)
+
+log = logging.getLogger()
+
+FSYNC_POLICIES = ('none', 'write', 'close')
+
+
+class _Handle(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buf = bytearray()
+        self.buffered_at = 0
+        self.last_used = time.time()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+
+
+class Writer(object):
+    '''Appends to console logs through cached file descriptors.
+
+       With a flush_interval of 0, appends are written before append returns
+       and only the open/close is saved. Otherwise data is buffered until
+       flush_size bytes are pending or a background thread finds it has
+       been waiting for flush_interval seconds.
+
+       Handles idle for idle_timeout seconds are closed by the background
+       thread, and the least recently used handle is closed when more than
+       max_open are needed. A max_open of 0 disables caching, each append
+       opens, writes and closes the log. Closing is what makes a write
+       visible to other NFS clients, cached handles need an fsync of
+       "write" for that.'''
+
+    def __init__(self, flush_interval, flush_size, fsync, max_open,
+                 idle_timeout):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('Invalid CONSOLE_LOG_FSYNC: ' + fsync)
+        if flush_interval and not max_open:
+            raise ValueError(
+                'CONSOLE_LOG_FLUSH_INTERVAL requires CONSOLE_LOG_MAX_OPEN')
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        # Buffers are checked at twice the flush_interval's rate so none wait
+        # much more than flush_interval to be written
+        self.tick = min(x for x in (
+            flush_interval / 2, idle_timeout, 1) if x)
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # After a fork the parent's handles and thread are not ours
+                self._handles = collections.OrderedDict()
+                self._lock = threading.Lock()
+                t = threading.Thread(target=self._run, name='console-log')
+                t.daemon = True
+                t.start()
+                self._pid = os.getpid()
+
+    def _get(self, path):
+        '''Return the handle for path and a handle evicted to make room for
+           it. Never hold self._lock while acquiring a handle's lock.'''
+        evicted = None
+        with self._lock:
+            h = self._handles.get(path)
+            if h:
+                self._handles.move_to_end(path)
+            else:
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                h = self._handles[path] = _Handle(path)
+                if len(self._handles) > self.max_open:
+                    evicted = self._handles.popitem(last=False)[1]
+        return h, evicted
+
+    def _flush(self, h):
+        view = memoryview(h.buf)
+        while view:
+            view = view[os.write(h.fd, view):]
+        view.release()
+        del h.buf[:]
+        if self.fsync == 'write':
+            os.fsync(h.fd)
+
+    def _close(self, h):
+        if h.fd is not None:
+            try:
+                self._flush(h)
+                if self.fsync == 'close':
+                    os.fsync(h.fd)
+            finally:
+                os.close(h.fd)
+                h.fd = None
+
+    def _append_uncached(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        h = _Handle(path)
+        h.buf += data
+        self._close(h)
+
+    def append(self, path, data):
+        if not self.max_open:
+            return self._append_uncached(path, data)
+        if self._pid != os.getpid():
+            self._start()
+        while True:
+            h, evicted = self._get(path)
+            if evicted:
+                with evicted.lock:
+                    self._close(evicted)
+            with h.lock:
+                if h.fd is None:
+                    continue  # closed after we looked it up, get a new one
+                h.last_used = time.time()
+                if not h.buf:
+                    h.buffered_at = h.last_used
+                h.buf += data
+                if not self.flush_interval or len(h.buf) >= self.flush_size:
+                    self._flush(h)
+                return
+
+    def close(self, path):
+        '''Write out anything buffered for path and close its handle.'''
+        if self._pid != os.getpid():
+            return  # nothing's been appended by this process
+        with self._lock:
+            h = self._handles.pop(path, None)
+        if h:
+            with h.lock:
+                self._close(h)
+
+    def close_all(self):
+        if self._pid == os.getpid():
+            for path in list(self._handles.keys()):
+                self.close(path)
+
+    def wait_for_others(self):
+        '''Other processes may have data for a log buffered. Any of it
+           appended before this call will be written out by their background
+           threads within flush_interval + tick seconds. An extra tick is
+           allowed for those threads being scheduled late.'''
+        if self.flush_interval:
+            time.sleep(self.flush_interval + 2 * self.tick)
+
+    def _maintain(self):
+        now = time.time()
+        with self._lock:
+            handles = list(self._handles.values())
+        for h in handles:
+            with h.lock:
+                if h.fd is None:
+                    continue
+                try:
+                    if h.buf and now - h.buffered_at >= self.flush_interval:
+                        self._flush(h)
+                    if now - h.last_used < self.idle_timeout:
+                        continue
+                    self._close(h)
+                except OSError:
+                    log.exception('Unable to write %s, dropping %d bytes',
+                                  h.path, len(h.buf))
+                    del h.buf[:]
+                    if h.fd is not None:
+                        continue
+            with self._lock:
+                if self._handles.get(h.path) is h:
+                    del self._handles[h.path]
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                self._maintain()
+            except Exception:
+                log.exception('Unexpected error maintaining console logs')
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = Writer(CONSOLE_LOG_FLUSH_INTERVAL,
+                             CONSOLE_LOG_FLUSH_SIZE, CONSOLE_LOG_FSYNC,
+                             CONSOLE_LOG_MAX_OPEN, CONSOLE_LOG_IDLE_TIMEOUT)
+            atexit.register(_writer.close_all)
+        return _writer
@@ -0,0 +1,9 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+from importlib import import_module
+
+from jobserv.settings import HEARTBEAT_BACKEND
+
+
+Heartbeat = import_module(HEARTBEAT_BACKEND).Heartbeat
@@ -0,0 +1,20 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+
+class BaseHeartbeat(object):
+    def ping(self, worker, timestamp, metrics):
+        '''Record a check-in from the worker. metrics is a dictionary of
+           name=value strings the worker sent.'''
+        raise NotImplementedError()
+
+    def last_seen(self, workers):
+        '''Return a dictionary of worker name -> timestamp of its last
+           check-in for the given workers. Workers that have never checked
+           in are left out.'''
+        raise NotImplementedError()
+
+    def recent_pings(self, worker):
+        '''Return a list of (timestamp, metrics) for the worker's most recent
+           check-ins, oldest first.'''
+        raise NotImplementedError()
@@ -0,0 +1,39 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import datetime
+
+from jobserv.heartbeat.base import BaseHeartbeat
+from jobserv.models import db, WorkerPing
+from jobserv.settings import HEARTBEAT_HISTORY
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Heartbeat(BaseHeartbeat):
+    '''Keeps a row per worker in the worker_pings table so that the worker
+       monitor can check every worker with a single query.'''
+
+    def ping(self, worker, timestamp, metrics):
+        p = WorkerPing.query.get(worker.name)
+        if not p:
+            p = WorkerPing(worker.name)
+            db.session.add(p)
+        p.add(timestamp, metrics, HEARTBEAT_HISTORY)
+        db.session.commit()
+
+    def last_seen(self, workers):
+        names = [w.name for w in workers]
+        if not names:
+            return {}
+        query = db.session.query(
+            WorkerPing.worker_name, WorkerPing.last_seen
+        ).filter(WorkerPing.worker_name.in_(names))
+        return {name: (last_seen - EPOCH).total_seconds()
+                for name, last_seen in query}
+
+    def recent_pings(self, worker):
+        p = WorkerPing.query.get(worker.name)
+        if p:
+            return [(ts, metrics) for ts, metrics in p.recent]
+        return []
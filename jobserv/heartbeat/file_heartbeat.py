@@ -0,0 +1,71 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import logging
+import os
+import time
+
+from jobserv.heartbeat.base import BaseHeartbeat
+from jobserv.settings import HEARTBEAT_HISTORY
+
+log = logging.getLogger()
+
+
+class Heartbeat(BaseHeartbeat):
+    '''Appends each check-in to WORKER_DIR/<worker>/pings.log and uses the
+       file's mtime to tell when the worker was last seen.'''
+
+    def ping(self, worker, timestamp, metrics):
+        path = worker.pings_log
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path))
+        vals = ','.join(['%s=%s' % (k, v) for k, v in metrics.items()])
+        with open(path, 'a') as f:
+            f.write('%d: %s\n' % (timestamp, vals))
+
+    def _rotate(self, pings_log, st):
+        rotated = pings_log + '.%d' % time.time()
+        log.info('rotating pings log to: %s', rotated)
+        os.rename(pings_log, rotated)
+
+        # the pings log won't exist now, so we need to touch an empty file
+        # with the proper mtime so we won't mark it offline on the next run
+        # this is technically racy, pings.log could exist at this moment,
+        # so we open in append mode, our st_mtime could be faulty because
+        # of this race condition, but this is one of the reasons why we
+        # give the worker some grace periods to check in
+        open(pings_log, 'a').close()
+        os.utime(pings_log, (st.st_atime, st.st_mtime))
+
+    def last_seen(self, workers):
+        '''This also rotates pings logs that have grown too large.'''
+        seen = {}
+        for w in workers:
+            try:
+                st = os.stat(w.pings_log)
+            except FileNotFoundError:
+                continue  # its never checked in
+            seen[w.name] = st.st_mtime
+
+            # based on rough calculations a 1M file is about 9000 entries
+            # which is about 2 days worth of information
+            if st.st_size > (1024 * 1024):
+                self._rotate(w.pings_log, st)
+        return seen
+
+    def recent_pings(self, worker):
+        try:
+            with open(worker.pings_log) as f:
+                lines = f.readlines()[-HEARTBEAT_HISTORY:]
+        except FileNotFoundError:
+            return []
+        pings = []
+        for line in lines:
+            ts, vals = line.split(':', 1)
+            metrics = {}
+            for val in vals.strip().split(','):
+                if val:
+                    k, v = val.split('=', 1)
+                    metrics[k] = v
+            pings.append((int(ts), metrics))
+        return pings
@@ -1,7 +1,15 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
-from flask import jsonify, request
+from flask import has_request_context, jsonify, request
+from werkzeug.urls import url_quote
+
+from jobserv.cache import LRUCache
+from jobserv.settings import RESPONSE_CACHE_SIZE
+
+# Keyed by (type name, id) of a completed build or run. Each entry is a dict
+# of the responses generated for it, see jsendify_cached.
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
 
 
 def _status_str(status_code):
@@ -21,9 +29,41 @@ def jsendify(data, status_code=200):
         rv['data'] = data
     resp = jsonify(rv)
     resp.status_code = status_code
+    if status_code == 200 and has_request_context() and \
+            request.method in ('GET', 'HEAD'):
+        # Allow pollers to use If-None-Match and get a 304 when nothing has
+        # changed
+        resp.add_etag()
+        resp.make_conditional(request)
     return resp
 
 
+def jsendify_cached(obj, create, *version):
+    '''Return jsendify(create()) for a build or run. Once obj is complete the
+       data is cached based on its status, the URL requested (without its
+       query string, so clients can't grow the cache with arbitrary ones),
+       and anything else the caller passes as the `version`. Processes
+       changing a completed obj should call uncache(obj), however the status
+       being part of the key keeps other processes from returning stale
+       data.'''
+    if not obj.complete:
+        return jsendify(create())
+    key = (obj.__class__.__name__, obj.id)
+    variant = (obj.status.value, request.base_url) + version
+    responses = response_cache.get(key)
+    if responses is None:
+        responses = {}
+        response_cache.put(key, responses)
+    data = responses.get(variant)
+    if data is None:
+        data = responses[variant] = create()
+    return jsendify(data)
+
+
+def uncache(obj):
+    response_cache.pop((obj.__class__.__name__, obj.id))
+
+
 class ApiError(Exception):
     def __init__(self, status_code, data):
         super(ApiError, self).__init__()
@@ -40,32 +80,103 @@ def get_or_404(query):
     return rv
 
 
-def paginate_custom(item_type, query, cb_func):
-    try:
-        limit = int(request.args.get('limit', '25'))
-    except ValueError:
-        raise ApiError(400, 'Invalid pagination. "limit" must be numeric')
+def _pagination_args(name, convert=int):
+    val = request.args.get(name)
+    if val is None:
+        return None
     try:
-        page = int(request.args.get('page', '0'))
+        return convert(val)
     except ValueError:
-        raise ApiError(400, 'Invalid pagination. "page" must be numeric')
-    total = query.count()
-    offset = page * limit
-
-    items = query.limit(limit).offset(offset)
-    data = {
-        'total': total,
-        item_type: [cb_func(x) for x in items],
-    }
-    if (page + 1) * limit < total:
-        url = request.host_url
-        if url[-1] == '/':
-            url = url[:-1]
-        url += request.path
-        data['next'] = '%s?page=%d&limit=%d' % (url, page + 1, limit)
+        raise ApiError(
+            400, 'Invalid pagination. "%s" must be %s' % (
+                name, 'numeric' if convert is int else 'valid'))
+
+
+def _list_url():
+    url = request.host_url
+    if url[-1] == '/':
+        url = url[:-1]
+    return url + request.path
+
+
+def _paginate_keyset(query, key, descending, limit, before, after):
+    """Return a page of items along with whether there are more items
+       before and after the page in display order."""
+    if before is not None:
+        query = query.filter(key < before)
+    if after is not None:
+        query = query.filter(key > after)
+
+    # Paging towards the start of the list means walking away from the
+    # cursor in the opposite order and then flipping the results around
+    if descending:
+        backwards = after is not None and before is None
+    else:
+        backwards = before is not None and after is None
+    order = key.desc() if descending != backwards else key.asc()
+    items = query.order_by(None).order_by(order).limit(limit + 1).all()
+    more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        return list(reversed(items)), more, True
+    return items, before is not None or after is not None, more
+
+
+def paginate_custom(item_type, query, cb_func, key=None, descending=True):
+    """Return a page of the query's items.
+
+       Pages are selected with ?page=N which needs an OFFSET the database
+       has to walk through. When a `key` column is given, ?before=K and
+       ?after=K select the items whose key is less/greater than K. These
+       are cheap at any depth and the "next" and "prev" links will use
+       them. The total count can be skipped with ?count=0."""
+    limit = _pagination_args('limit')
+    if limit is None:
+        limit = 25
+    page = _pagination_args('page')
+    with_count = request.args.get('count', '1').lower() not in (
+        '0', 'false', 'no')
+
+    data = {}
+    if with_count:
+        data['total'] = query.count()
+
+    if key is not None and page is None:
+        convert = key.type.python_type
+        before = _pagination_args('before', convert)
+        after = _pagination_args('after', convert)
+        items, has_prev, has_next = _paginate_keyset(
+            query, key, descending, limit, before, after)
+        data[item_type] = [cb_func(x) for x in items]
+        if items:
+            first, last = (
+                url_quote(str(getattr(x, key.key)))
+                for x in (items[0], items[-1]))
+            towards_end, towards_start = 'before', 'after'
+            if not descending:
+                towards_end, towards_start = towards_start, towards_end
+            url = _list_url()
+            if has_next:
+                data['next'] = '%s?%s=%s&limit=%d' % (
+                    url, towards_end, last, limit)
+            if has_prev:
+                data['prev'] = '%s?%s=%s&limit=%d' % (
+                    url, towards_start, first, limit)
+    else:
+        page = page or 0
+        items = query.limit(limit + 1).offset(page * limit).all()
+        data[item_type] = [cb_func(x) for x in items[:limit]]
+        if len(items) > limit:
+            data['next'] = '%s?page=%d&limit=%d' % (
+                _list_url(), page + 1, limit)
+    if not with_count:
+        for link in ('next', 'prev'):
+            if link in data:
+                data[link] += '&count=0'
     return jsendify(data)
 
 
-def paginate(item_type, query):
+def paginate(item_type, query, key=None, descending=True):
     return paginate_custom(
-        item_type, query, lambda x: x.as_json(detailed=False))
+        item_type, query, lambda x: x.as_json(detailed=False), key,
+        descending)
@@ -16,10 +16,13 @@ import sqlalchemy.dialects.mysql.mysqldb as mysqldb
 
 from flask import url_for
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.hybrid import Comparator, hybrid_property
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.urls import url_quote
 
-from jobserv.settings import JOBS_DIR, WORKER_DIR
+from jobserv.settings import JOBS_DIR, LOCK_PROVIDER, LOCK_TIMEOUT, WORKER_DIR
 from jobserv.stats import StatsClient
 
 db = SQLAlchemy()
@@ -39,11 +42,10 @@ orig_create = mysqldb.MySQLDialect_mysqldb.create_connect_args
 mysqldb.MySQLDialect_mysqldb.create_connect_args = hack_create_connect_args
 
 
-def get_cumulative_status(obj, items):
+def get_cumulative_status(states):
     '''A helper used by Test and Build to calculate the status based on the
-       status of its child TestResults and Runs.'''
+       set of states of its child Tests and Runs.'''
     status = BuildStatus.QUEUED  # Default guess to QUEUED
-    states = set([x.status for x in items])
     if BuildStatus.RUNNING in states or BuildStatus.UPLOADING in states:
         # Something is still running
         status = BuildStatus.RUNNING
@@ -150,6 +152,71 @@ class StatusComparator(Comparator):
         return self.__clause_element__().in_([x.value for x in states])
 
 
+@contextlib.contextmanager
+def _file_lock(obj):
+    '''flock a file under JOBS_DIR. This requires every node serving the
+       API to share JOBS_DIR.'''
+    lockname = os.path.join(
+        JOBS_DIR, '%s-%d' % (obj.__class__.__name__, obj.id))
+    with open(lockname, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # force a clean session so that updates from another thread will
+        # be pulled in
+        db.session.rollback()
+        yield
+        db.session.commit()
+    if obj.complete:
+        os.unlink(lockname)
+
+
+@contextlib.contextmanager
+def _row_lock(obj):
+    '''SELECT ... FOR UPDATE the object's own row. The lock is held by the
+       session's transaction, so its released by the commit, or by the
+       rollback if the body raises.'''
+    db.session.rollback()
+    db.session.query(obj.__class__).filter_by(
+        id=obj.id).with_for_update().populate_existing().one()
+    try:
+        yield
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+
+
+@contextlib.contextmanager
+def _mysql_lock(obj):
+    '''Use a MySQL named lock. Named locks belong to a connection rather
+       than a transaction, so the lock is taken on a connection of its own
+       that the session's commit won't release.'''
+    name = 'jobserv-%s-%d' % (obj.__class__.__name__, obj.id)
+    # End the session's transaction first so its connection goes back to
+    # the pool rather than being held while we wait for the lock. This also
+    # gives us a clean session that pulls in updates from other threads.
+    db.session.rollback()
+    with db.engine.connect() as conn:
+        locked = conn.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                              name=name, timeout=LOCK_TIMEOUT).scalar()
+        if locked != 1:
+            raise RuntimeError('Unable to acquire lock: ' + name)
+        try:
+            yield
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        finally:
+            conn.execute(text('SELECT RELEASE_LOCK(:name)'), name=name)
+
+
+_LOCK_PROVIDERS = {
+    'file': _file_lock,
+    'db': _row_lock,
+    'mysql': _mysql_lock,
+}
+
+
 class StatusMixin(object):
     '''Using ENUM columns in the Database can be a real pain and difficult
        to provide migration logic for. This hack makes the column feel just
@@ -179,19 +246,15 @@ class StatusMixin(object):
     @contextlib.contextmanager
     def locked(self):
         '''Provide a distributed lock that can be used to provide sequential
-           updates to certain operations like Run and Test status.
+           updates to certain operations like Run and Test status. The
+           session is committed when the lock is released.
         '''
-        lockname = os.path.join(
-            JOBS_DIR, '%s-%d' % (self.__class__.__name__, self.id))
-        with open(lockname, 'a') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
-            # force a clean session so that updates from another thread will
-            # be pulled in
-            db.session.rollback()
+        try:
+            provider = _LOCK_PROVIDERS[LOCK_PROVIDER]
+        except KeyError:
+            raise ValueError('Invalid LOCK_PROVIDER: ' + LOCK_PROVIDER)
+        with provider(self):
             yield
-            db.session.commit()
-        if self.complete:
-            os.unlink(lockname)
 
 
 class Build(db.Model, StatusMixin):
@@ -212,15 +275,31 @@ class Build(db.Model, StatusMixin):
                            cascade='save-update, merge, delete')
     status_events = db.relationship('BuildEvents', order_by='BuildEvents.id',
                                     cascade='save-update, merge, delete')
+    run_counts = db.relationship('BuildRunCounts', uselist=False,
+                                 cascade='all, delete-orphan')
 
     __table_args__ = (
+        # build_id_uc also serves keyset pagination of a project's builds
         db.UniqueConstraint('proj_id', 'build_id', name='build_id_uc'),
+        # and this serves the promoted-builds listing
+        db.Index('ix_builds_proj_id_status_build_id',
+                 'proj_id', '_status', 'build_id'),
     )
 
     def __init__(self, project, build_id):
         self.proj_id = project.id
         self.build_id = build_id
         self.status = BuildStatus.QUEUED
+        self.run_counts = BuildRunCounts()
+
+    @staticmethod
+    def serialize_options():
+        '''Query options to eagerly load everything as_json touches.'''
+        return (
+            joinedload(Build.project),
+            selectinload(Build.status_events),
+            selectinload(Build.runs).selectinload(Run.status_events),
+        )
 
     def as_json(self, detailed=False):
         url = url_for('api_build.build_get', proj=self.project.name,
@@ -229,7 +308,7 @@ class Build(db.Model, StatusMixin):
             'build_id': self.build_id,
             'url': url,
             'status': self.status.name,
-            'runs': [x.as_json() for x in self.runs],
+            'runs': [x.as_json(build_url=url) for x in self.runs],
         }
         if self.name:
             data['name'] = self.name
@@ -242,15 +321,13 @@ class Build(db.Model, StatusMixin):
         if detailed:
             data['status_events'] = [{'time': x.time, 'status': x.status.name}
                                      for x in self.status_events]
-            data['runs_url'] = url_for(
-                'api_run.run_list', proj=self.project.name,
-                build_id=self.build_id, _external=True)
+            data['runs_url'] = url + 'runs/'
             data['reason'] = self.reason
             data['annotation'] = self.annotation
         return data
 
     def refresh_status(self):
-        status = get_cumulative_status(self, self.runs)
+        status = get_cumulative_status(BuildRunCounts.states(self.id))
         if self.status != status:
             self.status = status
             db.session.add(BuildEvents(self, status))
@@ -311,7 +388,9 @@ class Run(db.Model, StatusMixin):
 
     build_id = db.Column(db.Integer, db.ForeignKey(Build.id), nullable=False)
     name = db.Column(db.String(80))
-    _status = db.Column(db.Integer)
+    # active_history ensures the old status is known when the status is
+    # changed so BuildRunCounts can be updated
+    _status = db.column_property(db.Column(db.Integer), active_history=True)
     api_key = db.Column(db.String(80), nullable=False)
     trigger = db.Column(db.String(80))
     meta = db.Column(db.String(1024))
@@ -327,12 +406,20 @@ class Run(db.Model, StatusMixin):
     tests = db.relationship('Test', order_by='Test.id',
                             cascade='save-update, merge, delete')
     worker = db.relationship('Worker')
+    manifest = db.relationship('RunManifest', uselist=False,
+                               cascade='all, delete-orphan')
 
     in_test_mode = False
 
     __table_args__ = (
         # can't have the same named run for a single build
         db.UniqueConstraint('build_id', 'name', name='run_name_uc'),
+        # Run.pop_queued is called on every worker check-in. These keep its
+        # cost proportional to the number of queued runs rather than the
+        # size of the runs table.
+        db.Index('ix_runs_status_build_id', '_status', 'build_id'),
+        db.Index('ix_runs_status_host_tag', '_status', 'host_tag',
+                 mysql_length={'host_tag': 191}),
     )
 
     def __init__(self, build, name, trigger=None):
@@ -344,19 +431,23 @@ class Run(db.Model, StatusMixin):
             string.ascii_lowercase + string.ascii_uppercase + string.digits)
             for _ in range(32))
 
-    def as_json(self, detailed=False):
-        b = self.build
-        p = b.project
-        url = url_for('api_run.run_get', proj=p.name, build_id=b.build_id,
-                      run=self.name, _external=True)
-        log = url_for('api_run.run_get_artifact', proj=p.name,
-                      build_id=b.build_id, run=self.name, path='console.log',
-                      _external=True)
+    def url(self, build_url=None):
+        '''Return the run's URL. Building it from the build's URL saves
+           calling url_for and loading the run's build and project when
+           serializing a lot of runs.'''
+        if build_url is None:
+            build_url = url_for(
+                'api_build.build_get', proj=self.build.project.name,
+                build_id=self.build.build_id, _external=True)
+        return '%sruns/%s/' % (build_url, url_quote(self.name))
+
+    def as_json(self, detailed=False, build_url=None):
+        url = self.url(build_url)
         data = {
             'name': self.name,
             'url': url,
             'status': self.status.name,
-            'log_url': log,
+            'log_url': url + 'console.log',
         }
         if self.status_events:
             data['created'] = self.status_events[0].time
@@ -367,9 +458,7 @@ class Run(db.Model, StatusMixin):
         if detailed:
             data['status_events'] = [{'time': x.time, 'status': x.status.name}
                                      for x in self.status_events]
-            data['tests'] = url_for(
-                'api_test.test_list', proj=p.name, build_id=b.build_id,
-                run=self.name, _external=True)
+            data['tests'] = url + 'tests/'
         return data
 
     def set_status(self, status):
@@ -386,47 +475,249 @@ class Run(db.Model, StatusMixin):
             self.name, self.status.name)
 
     @staticmethod
-    def pop_queued(worker):
+    def pop_queued(worker, count=1):
+        '''Assign up to `count` queued runs to the worker and return them.'''
         # A great read on MySql locking can be found here:
         # https://www.percona.com/blog/2014/09/11/
         # openstack-users-shed-light-on-percona-xtradb-cluster-deadlock-issues
         # The big take-away is that select-for-update isn't a silver bullet.
         # In fact, with what we are trying to do, its actually going to be more
-        # full-proof to try and update a single row and see if it changed.
-        # If it didn't change, that means we lost a race condition and the
-        # run has been assigned to another worker.
-        tags = '`host_tag` like "%s"' % worker.name
-        for t in worker.host_tags.split(','):
-            tags += ' OR `host_tag` like "%s"' % t.strip()
-        conn = db.session.connection().connection
-        cursor = conn.cursor()
-
-        # this is a trick to allow us to find the ID of the row we updated
-        id_trick = 'id = @run_id := id'
-        limit = 'ORDER BY `build_id`, `id` asc LIMIT 1'
+        # full-proof to try and update the rows and see which ones changed.
+        # Rows we didn't change were lost to a race condition and have been
+        # assigned to another worker.
+        params = {
+            'queued': BuildStatus.QUEUED.value,
+            'running': BuildStatus.RUNNING.value,
+            'worker': worker.name,
+            'count': count,
+        }
+        tags = [worker.name] + worker.host_tags.split(',')
+        for i, tag in enumerate(tags):
+            params['tag%d' % i] = tag.strip()
+        tags = ' OR '.join(
+            '`host_tag` like :tag%d' % i for i in range(len(tags)))
+
+        ids = []
         if Run.in_test_mode:
-            # of course, sqlite isn't advanced enough, so we hack something
-            # for unit-testing
-            id_trick = 'id = id'
-            # libsqlite3 under alpine can't handle the limit statement
-            limit = ''
-
-        rows = cursor.execute('''
-            UPDATE runs SET
-                `_status` = 2, %s, `worker_name` = "%s"
-            WHERE
-                `_status` = 1
-              AND (%s)
-            %s''' % (id_trick, worker.name, tags, limit))
+            # sqlite can't do an UPDATE with a LIMIT, so for unit-testing we
+            # pick the rows first and then claim them
+            ids = [x[0] for x in db.session.execute(text('''
+                SELECT `id` FROM runs
+                WHERE `_status` = :queued AND (%s)
+                ORDER BY `build_id`, `id` asc LIMIT :count''' % tags), params)]
+            if ids:
+                Run.query.filter(
+                    Run.id.in_(ids), Run._status == BuildStatus.QUEUED.value
+                ).update({
+                    '_status': BuildStatus.RUNNING.value,
+                    'worker_name': worker.name,
+                }, synchronize_session=False)
+        else:
+            # This is a trick to allow us to find the IDs of the rows we
+            # updated. The IF() is only there to append each id to @run_ids
+            # while leaving the column unchanged. The WHERE and ORDER BY
+            # clauses are covered by the indexes in __table_args__ so this
+            # doesn't scan the runs table.
+            db.session.execute(text('SET @run_ids := NULL'))
+            sql = text('''
+                UPDATE runs SET
+                    `_status` = :running, `worker_name` = :worker,
+                    `id` = IF((@run_ids := CONCAT_WS(',', @run_ids, `id`))
+                              IS NULL, `id`, `id`)
+                WHERE
+                    `_status` = :queued
+                  AND (%s)
+                ORDER BY `build_id`, `id` asc LIMIT :count''' % tags)
+            rows = db.session.execute(sql, params).rowcount
+            if rows:
+                # @run_ids is per-connection, so read it before committing
+                ids = db.session.execute(text('select @run_ids')).scalar()
+                ids = [int(x) for x in ids.split(',')]
+
+        # These UPDATEs bypass the ORM, so BuildRunCounts has to be updated
+        # here as part of the same transaction.
+        if ids:
+            builds = db.session.query(
+                Run.build_id, db.func.count(Run.id)
+            ).filter(Run.id.in_(ids)).group_by(Run.build_id)
+            for build_id, count in builds.all():
+                BuildRunCounts.update(db.session.connection(), build_id, {
+                    BuildStatus.QUEUED.value: -count,
+                    BuildStatus.RUNNING.value: count,
+                })
         db.session.commit()
-        if Run.in_test_mode:
-            return Run.query.filter(Run.status == BuildStatus.RUNNING).first()
-        if rows == 1:
-            cursor.execute('select @run_id')
-            r = Run.query.get(cursor.fetchone()[0])
+
+        if not ids:
+            return []
+        runs = Run.query.filter(
+            Run.id.in_(ids), Run.worker_name == worker.name,
+            Run._status == BuildStatus.RUNNING.value,
+        ).order_by(Run.build_id, Run.id).all()
+        for r in runs:
             db.session.add(RunEvents(r, BuildStatus.RUNNING))
+        db.session.commit()
+        return runs
+
+
+class BuildRunCounts(db.Model):
+    '''The number of runs in each state for a build. These are kept up to
+       date as runs change state so that a build's status can be found
+       without loading all of its runs.'''
+    __tablename__ = 'build_run_counts'
+
+    build_id = db.Column(db.Integer, db.ForeignKey(Build.id), primary_key=True)
+    queued = db.Column(db.Integer, nullable=False, default=0)
+    running = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    running_with_failures = db.Column(
+        db.Integer, nullable=False, default=0)
+    uploading = db.Column(db.Integer, nullable=False, default=0)
+    promoted = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def _column(status):
+        return BuildRunCounts.__table__.c[BuildStatus(status).name.lower()]
+
+    @staticmethod
+    def update(connection, build_id, deltas):
+        '''Apply a dictionary of status value -> change in count. This uses
+           the given connection so it can be called from ORM flush events.'''
+        table = BuildRunCounts.__table__
+        values = {}
+        for status, delta in deltas.items():
+            col = BuildRunCounts._column(status)
+            values[col.name] = col + delta
+        connection.execute(
+            table.update().where(table.c.build_id == build_id).values(values))
+
+    @staticmethod
+    def states(build_id):
+        '''Return the set of states the build's runs are in.'''
+        cols = [BuildRunCounts._column(x) for x in BuildStatus]
+        counts = db.session.query(*cols).filter(
+            BuildRunCounts.build_id == build_id).one()
+        return set(x for x, count in zip(BuildStatus, counts) if count)
+
+    @staticmethod
+    def rebuild():
+        '''Recalculate the counts for every build from the runs table. This
+           shouldn't be needed, but provides a way to recover if they ever
+           get out of sync.'''
+        table = BuildRunCounts.__table__
+        cols = [db.func.coalesce(db.func.sum(
+            db.case([(Run._status == x.value, 1)], else_=0)), 0)
+            for x in BuildStatus]
+        query = db.select([Build.id] + cols).select_from(
+            Build.__table__.outerjoin(Run.__table__)).group_by(Build.id)
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(
+            ['build_id'] + [BuildRunCounts._column(x).name
+                            for x in BuildStatus], query))
+
+
+@db.event.listens_for(Run, 'after_insert')
+def _run_inserted(mapper, connection, run):
+    BuildRunCounts.update(connection, run.build_id, {run._status: 1})
+
+
+@db.event.listens_for(Run, 'after_update')
+def _run_updated(mapper, connection, run):
+    history = db.inspect(run).attrs._status.history
+    if history.added and history.deleted:
+        old, new = history.deleted[0], history.added[0]
+        if old != new:
+            BuildRunCounts.update(
+                connection, run.build_id, {old: -1, new: 1})
+
+
+@db.event.listens_for(Run, 'before_delete')
+def _run_deleted(mapper, connection, run):
+    BuildRunCounts.update(connection, run.build_id, {run._status: -1})
+
+
+class RunCompletion(db.Model, StatusMixin):
+    '''A run that has reported its final status but whose completion work
+       hasn't been done yet. See jobserv.run_completion.'''
+    __tablename__ = 'run_completions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey(Run.id), nullable=False,
+                       unique=True)
+    _status = db.Column(db.Integer)
+    # The URL the run's status was posted to. Triggers and emails are
+    # generated in the context of this URL.
+    url = db.Column(db.String(1024), nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    next_attempt = db.Column(db.DateTime, nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # None until the console log has been grepped for tests
+    failed_tests = db.Column(db.Boolean)
+    last_error = db.Column(db.Text)
+
+    run = db.relationship(Run)
+
+    def __init__(self, run, status, url):
+        self.run_id = run.id
+        self.status = status
+        self.url = url
+        self.created = self.next_attempt = datetime.datetime.utcnow()
+        self.attempts = 0
+
+    @staticmethod
+    def queue(run, status, url):
+        '''Queue the run's completion. A runner retrying its status update
+           won't queue it twice.'''
+        if not RunCompletion.query.filter_by(run_id=run.id).first():
+            db.session.add(RunCompletion(run, status, url))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()  # a concurrent retry beat us to it
+
+    def __repr__(self):
+        return '<RunCompletion %d: %s>' % (self.run_id, self.status.name)
+
+
+class RunManifest(db.Model):
+    '''The artifacts of a completed run. These don't change once a run is
+       complete so they are recorded here rather than listing storage each
+       time they are needed.'''
+    __tablename__ = 'run_manifests'
+
+    run_id = db.Column(db.Integer, db.ForeignKey(Run.id), primary_key=True)
+    # JSON list of {"path", "size", "content-type", "md5"}. Runs can have
+    # thousands of artifacts, more than fit in a 64KB MySQL TEXT column
+    _artifacts = db.Column(db.Text(length=2**24), nullable=False)
+
+    def __init__(self, run, artifacts):
+        self.run_id = run.id
+        self._artifacts = json.dumps(
+            sorted(artifacts, key=lambda x: x['path']))
+
+    @property
+    def artifacts(self):
+        return json.loads(self._artifacts)
+
+    @property
+    def paths(self):
+        return [x['path'] for x in self.artifacts]
+
+    @staticmethod
+    def save(manifests):
+        '''Commit the manifests of the runs listed by a request at once.
+           Committing per run would expire everything already loaded.'''
+        db.session.add_all(manifests)
+        try:
             db.session.commit()
-            return r
+        except IntegrityError:
+            db.session.rollback()  # a concurrent request recorded it
+        except SQLAlchemyError:
+            db.session.rollback()
+            logging.exception('Unable to record run manifests %r', manifests)
+
+    def __repr__(self):
+        return '<RunManifest %d>' % self.run_id
 
 
 class RunEvents(db.Model, StatusMixin):
@@ -467,12 +758,19 @@ class Test(db.Model, StatusMixin):
         self.status = status
         self.created = datetime.datetime.utcnow()
 
-    def as_json(self, detailed=False):
-        r = self.run
-        b = r.build
-        p = b.project
-        url = url_for('api_test.test_get', proj=p.name, build_id=b.build_id,
-                      run=self.run.name, test=self.name, _external=True)
+    @staticmethod
+    def serialize_options():
+        '''Query options to eagerly load everything as_json touches.'''
+        return (
+            joinedload(Test.run).joinedload(Run.build).joinedload(
+                Build.project),
+            selectinload(Test.results),
+        )
+
+    def as_json(self, detailed=False, run_url=None):
+        if run_url is None:
+            run_url = self.run.url()
+        url = '%stests/%s/' % (run_url, url_quote(self.name))
         data = {
             'name': self.name,
             'url': url,
@@ -496,7 +794,11 @@ class Test(db.Model, StatusMixin):
             status = BuildStatus[status]
         if self.status != status:
             self.status = status
-            return get_cumulative_status(self.run, self.run.tests)
+            db.session.flush()
+            states = db.session.query(Test._status).filter(
+                Test.run_id == self.run_id).distinct()
+            return get_cumulative_status(
+                set(BuildStatus(x[0]) for x in states))
 
     @property
     def complete(self):
@@ -609,18 +911,16 @@ class Worker(db.Model):
         return os.path.join(WORKER_DIR, self.name, 'pings.log')
 
     def ping(self, **kwargs):
+        # imported here since the heartbeat backends depend on this module
+        from jobserv.heartbeat import Heartbeat
+
         if not self.online:
             self.online = True
             db.session.commit()
             with StatsClient() as c:
                 c.worker_online(self)
-        path = self.pings_log
-        if not os.path.exists(path):
-            os.makedirs(os.path.dirname(path))
         now = time.time()
-        vals = ','.join(['%s=%s' % (k, v[0]) for k, v in kwargs.items()])
-        with open(path, 'a') as f:
-            f.write('%d: %s\n' % (now, vals))
+        Heartbeat().ping(self, now, {k: v[0] for k, v in kwargs.items()})
 
         try:
             # this is a no-op if unconfigured
@@ -628,3 +928,30 @@ class Worker(db.Model):
                 c.worker_ping(self, now, kwargs)
         except:
             logging.exception('Unable to update metrics for ' + self.name)
+
+
+class WorkerPing(db.Model):
+    '''Used by the "db" heartbeat backend to track when a worker last
+       checked in along with the metrics from its most recent check-ins.'''
+    __tablename__ = 'worker_pings'
+
+    worker_name = db.Column(db.String(512), db.ForeignKey('workers.name'),
+                            primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    _recent = db.Column(db.Text)
+
+    def __init__(self, worker_name):
+        self.worker_name = worker_name
+
+    @property
+    def recent(self):
+        if self._recent:
+            return json.loads(self._recent)
+        return []
+
+    def add(self, timestamp, metrics, history):
+        '''Record a ping keeping only the last `history` entries.'''
+        self.last_seen = datetime.datetime.utcfromtimestamp(timestamp)
+        recent = self.recent[-(history - 1):] if history > 1 else []
+        recent.append([timestamp, metrics])
+        self._recent = json.dumps(recent)
@@ -0,0 +1,51 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''A lightweight, in-process way for worker check-ins to learn that runs have
+been queued.
+
+This only wakes up requests handled by the same process. Check-ins served by
+other processes will find the runs on their next periodic re-check, so the
+notification is an optimization rather than something to rely on.'''
+
+import threading
+
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+_cond = threading.Condition()
+_generation = 0
+
+
+def runs_queued():
+    '''Wake up everything blocked in wait_for_runs.'''
+    global _generation
+    with _cond:
+        _generation += 1
+        _cond.notify_all()
+
+
+def notify_on_commit(session):
+    '''Call runs_queued once the session's transaction is committed. Waking
+       up check-ins before the runs are committed would be pointless since
+       they couldn't see them yet.'''
+    session.info['runs_queued'] = True
+
+
+def wait_for_runs(timeout):
+    '''Block until runs_queued is called or timeout seconds have passed.
+       Returns True if we were notified.'''
+    with _cond:
+        generation = _generation
+        return _cond.wait_for(lambda: _generation != generation, timeout)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('runs_queued', False):
+        runs_queued()
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('runs_queued', None)
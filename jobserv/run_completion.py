@@ -0,0 +1,129 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+'''Process the RunCompletions queued by run_update when ASYNC_RUN_COMPLETION
+is set.
+
+Completing a run greps its console log for tests, copies the log to storage,
+sets the run's status and then handles triggers and emails. This can take a
+while, so doing it here lets the runner's request return right away. Failed
+attempts are retried with an exponential backoff.'''
+
+import datetime
+import logging
+import time
+import traceback
+
+from jobserv.api.run import failed_tests, set_run_status
+from jobserv.jsend import uncache
+from jobserv.models import db, BuildStatus, RunCompletion
+from jobserv.settings import RUN_COMPLETION_MAX_ATTEMPTS
+from jobserv.stats import StatsClient
+from jobserv.storage import Storage
+
+# How long a processor has to complete a run before another may try
+LEASE = datetime.timedelta(minutes=15)
+BATCH_SIZE = 50
+
+logging.basicConfig(
+    level='INFO', format='%(asctime)s %(levelname)s: %(message)s')
+log = logging.getLogger()
+
+
+def _claim(completion_id):
+    '''Claim a completion so concurrent processors don't work on it. Like
+       Run.pop_queued, this updates the row and checks that it changed.'''
+    now = datetime.datetime.utcnow()
+    rows = RunCompletion.query.filter(
+        RunCompletion.id == completion_id,
+        RunCompletion.next_attempt <= now,
+    ).update({'next_attempt': now + LEASE}, synchronize_session=False)
+    db.session.commit()
+    return rows == 1
+
+
+def _complete(completion):
+    storage = Storage()
+    run = completion.run
+    storage.flush_console_log(run)
+    if completion.failed_tests is None:
+        # only grep once, a retry would create the tests again
+        completion.failed_tests = failed_tests(storage, run)
+        db.session.commit()
+    status = completion.status
+    if completion.failed_tests:
+        status = BuildStatus.FAILED
+    storage.copy_log(run)
+    set_run_status(storage, run, status)
+
+
+def _failed(completion_id):
+    db.session.rollback()
+    completion = RunCompletion.query.get(completion_id)
+    completion.attempts += 1
+    completion.last_error = traceback.format_exc()
+    if completion.attempts < RUN_COMPLETION_MAX_ATTEMPTS:
+        delay = min(30 * 2 ** completion.attempts, 3600)
+        log.exception('Unable to complete %r, retrying in %ds',
+                      completion.run, delay)
+        completion.next_attempt = datetime.datetime.utcnow() + \
+            datetime.timedelta(seconds=delay)
+        db.session.commit()
+        return
+
+    log.exception('Unable to complete %r, giving up', completion.run)
+    run = completion.run
+    db.session.delete(completion)
+    db.session.commit()
+    try:
+        # archive what we can so the log isn't left in JOBS_DIR
+        storage = Storage()
+        storage.flush_console_log(run)
+        storage.copy_log(run)
+    except Exception:
+        log.exception('Unable to copy the console log of %r', run)
+    with run.build.locked():
+        run.set_status(BuildStatus.FAILED)
+    uncache(run)
+    uncache(run.build)
+
+
+def process_completions(app):
+    '''Process the completions that are due. Returns how many there were.'''
+    now = datetime.datetime.utcnow()
+    due = [x.id for x in RunCompletion.query.filter(
+        RunCompletion.next_attempt <= now
+    ).order_by(RunCompletion.id).limit(BATCH_SIZE)]
+    db.session.commit()
+
+    for completion_id in due:
+        if not _claim(completion_id):
+            continue  # another processor has it
+        completion = RunCompletion.query.get(completion_id)
+        start = time.time()
+        failed = False
+        try:
+            with app.test_request_context(completion.url):
+                _complete(completion)
+            db.session.delete(completion)
+            db.session.commit()
+        except Exception:
+            failed = True
+            _failed(completion_id)
+        with StatsClient() as c:
+            c.run_completion(time.time() - start, failed)
+    return len(due)
+
+
+def run_completion_processor(app):
+    log.info('run completion processor has started')
+    while True:
+        try:
+            with StatsClient() as c:
+                c.run_completions_queued(RunCompletion.query.count())
+            if not process_completions(app):
+                time.sleep(2)
+        except Exception:
+            log.exception('unexpected error processing run completions')
+            db.session.rollback()
+            time.sleep(10)
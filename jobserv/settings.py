@@ -20,17 +20,119 @@ PERMISSIONS_MODULE = os.environ.get(
 JOBS_DIR = os.environ.get('JOBS_DIR', '/data/ci_jobs')
 WORKER_DIR = os.environ.get('WORKER_DIR', '/data/workers')
 
+# Console logs of runs in progress are opened, appended to and closed for
+# each chunk a runner sends. Setting CONSOLE_LOG_MAX_OPEN caches up to that
+# many append handles instead, see jobserv.console_log. When
+# CONSOLE_LOG_FLUSH_INTERVAL is also set, appends are buffered for up to
+# that many seconds or until CONSOLE_LOG_FLUSH_SIZE bytes are pending.
+# Completing a run then waits for the interval so other processes can write
+# out what they've buffered.
+CONSOLE_LOG_MAX_OPEN = int(os.environ.get('CONSOLE_LOG_MAX_OPEN', '0'))
+CONSOLE_LOG_FLUSH_INTERVAL = float(
+    os.environ.get('CONSOLE_LOG_FLUSH_INTERVAL', '0'))
+CONSOLE_LOG_FLUSH_SIZE = int(os.environ.get('CONSOLE_LOG_FLUSH_SIZE', '65536'))
+# none - leave it to the OS, write - fsync after each write, close - fsync
+# before a handle is closed. Closing a file is what makes its writes visible
+# to other NFS clients, so cached handles on a JOBS_DIR shared over NFS by
+# several hosts need "write".
+CONSOLE_LOG_FSYNC = os.environ.get('CONSOLE_LOG_FSYNC', 'none')
+CONSOLE_LOG_IDLE_TIMEOUT = int(
+    os.environ.get('CONSOLE_LOG_IDLE_TIMEOUT', '60'))
+
+# Set to "gzip" to compress console logs when they are copied to storage.
+# They are served with a "Content-Encoding: gzip" header, or decompressed for
+# clients that don't accept it. Logs copied before this was set can be
+# compressed with "flask compress-logs".
+CONSOLE_LOG_COMPRESSION = os.environ.get('CONSOLE_LOG_COMPRESSION', '')
+
+# The console log of a run in progress can be followed with server-sent
+# events when LOG_TAIL_SSE is set. Each connection holds a gunicorn thread
+# and checks for new data every LOG_TAIL_INTERVAL seconds, so only enable
+# this with GUNICORN_THREADS or an async worker class. Otherwise a few
+# viewers tie up every worker. Connections are closed after
+# LOG_TAIL_SSE_MAX seconds and clients reconnect from where they left off.
+LOG_TAIL_SSE = bool(int(os.environ.get('LOG_TAIL_SSE', '0')))
+LOG_TAIL_INTERVAL = float(os.environ.get('LOG_TAIL_INTERVAL', '1'))
+LOG_TAIL_SSE_MAX = int(os.environ.get('LOG_TAIL_SSE_MAX', '300'))
+
+# How builds are locked while their runs are updated:
+#  file - flock files in JOBS_DIR. Every API node must share JOBS_DIR.
+#  db - SELECT ... FOR UPDATE the build's row.
+#  mysql - a MySQL GET_LOCK named lock.
+LOCK_PROVIDER = os.environ.get('LOCK_PROVIDER', 'file')
+# Seconds to wait for a "mysql" lock
+LOCK_TIMEOUT = int(os.environ.get('LOCK_TIMEOUT', '60'))
+
+# Run definitions never change once created, so storage caches the most
+# recently used ones in memory. RUNDEF_CACHE_DIR adds a second tier on disk
+# that can be shared by the processes on a host. Anything in it can safely be
+# removed, eg by a cron job cleaning out old files.
+RUNDEF_CACHE_SIZE = int(os.environ.get('RUNDEF_CACHE_SIZE', '1024'))
+RUNDEF_CACHE_DIR = os.environ.get('RUNDEF_CACHE_DIR')
+
 LOCAL_ARTIFACTS_DIR = os.environ.get('LOCAL_ARTIFACTS_DIR', '/data/artifacts')
 GCE_BUCKET = os.environ.get('GCE_BUCKET')
 STORAGE_BACKEND = os.environ.get(
     'STORAGE_BACKEND', 'jobserv.storage.gce_storage')
 
+# Files served from local disk (local_storage artifacts and the console logs
+# of runs in progress) can be handed to the web server in front of jobserv
+# rather than tying up a gunicorn worker for the whole download:
+#   x-sendfile - Apache's mod_xsendfile, lighttpd
+#   x-accel-redirect - nginx. The file's path is appended to
+#     SENDFILE_ACCEL_PREFIX which should be an "internal" location whose
+#     alias is "/".
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '')
+SENDFILE_ACCEL_PREFIX = os.environ.get('SENDFILE_ACCEL_PREFIX', '/_sendfile')
+
+# Where worker check-ins are recorded. jobserv.heartbeat.file_heartbeat
+# keeps the old pings.log files under WORKER_DIR.
+HEARTBEAT_BACKEND = os.environ.get(
+    'HEARTBEAT_BACKEND', 'jobserv.heartbeat.db_heartbeat')
+# How many check-ins worth of metrics to keep for each worker. The db
+# backend rewrites them on every check-in so this is kept small, 15 is about
+# 5 minutes worth. Longer term metrics belong in the stats backend.
+HEARTBEAT_HISTORY = int(os.environ.get('HEARTBEAT_HISTORY', '15'))
+
 # The SURGE_SUPPORT_RATIO is defined as the number of Runs in QUEUED for a
 # given host_tag divided by the number of online and enlisted non-surge
 # workers that can service that host_tag. If this ratio is exceeded, the
 # JobServ will enter surge support mode and use surge workers for QUEUED run.
 SURGE_SUPPORT_RATIO = int(os.environ.get('SURGE_SUPPORT_RATIO', '3'))
 
+# Workers can ask for their check-in to be held open until a run is queued
+# for them by passing "wait=<seconds>". This is the longest we'll hold a
+# check-in, up to 60 seconds so the worker isn't marked offline while it
+# waits. 0 disables long-polling. Each waiting check-in ties up a
+# request handler, so this should only be enabled when running with enough
+# threads (eg GUNICORN_THREADS).
+WORKER_LONG_POLL_MAX = int(os.environ.get('WORKER_LONG_POLL_MAX', '0'))
+# Runs queued by another process don't notify us, so a waiting check-in
+# re-checks the queue this often.
+WORKER_LONG_POLL_INTERVAL = int(
+    os.environ.get('WORKER_LONG_POLL_INTERVAL', '5'))
+
+# When set, the work done when a run completes (test-grepping, copying its
+# log, triggers and emails) is queued and handled by "flask
+# process_run_completions" rather than in the runner's request.
+ASYNC_RUN_COMPLETION = bool(int(os.environ.get('ASYNC_RUN_COMPLETION', '0')))
+# Failed completions are retried with a backoff this many times before the
+# run is marked as FAILED
+RUN_COMPLETION_MAX_ATTEMPTS = int(
+    os.environ.get('RUN_COMPLETION_MAX_ATTEMPTS', '8'))
+
+# Number of parsed project definitions to keep in memory for handling run
+# triggers. A build's project definition never changes once its created.
+PROJECT_DEFINITION_CACHE_SIZE = int(
+    os.environ.get('PROJECT_DEFINITION_CACHE_SIZE', '64'))
+
+# Number of completed builds and runs whose API responses are kept in memory.
+# These only change when a build is promoted.
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1024'))
+
+# /health/runs is served from a snapshot regenerated at most this often
+HEALTH_SNAPSHOT_TTL = int(os.environ.get('HEALTH_SNAPSHOT_TTL', '10'))
+
 INTERNAL_API_KEY = os.environ.get('INTERNAL_API_KEY', '').encode()
 
 # Allow this to be deployed in a way that builds and runs can provide links
@@ -73,6 +175,9 @@ if CARBON_HOST:
 CARBON_PREFIX = os.environ.get('CARBON_PREFIX', 'jobserv')
 if CARBON_PREFIX and CARBON_PREFIX[-1] != '.':
     CARBON_PREFIX += '.'
+# Metrics are queued and sent to carbon from a background thread. If carbon
+# can't keep up, the oldest metrics are dropped once this many are queued.
+CARBON_BUFFER_SIZE = int(os.environ.get('CARBON_BUFFER_SIZE', '10000'))
 
 RUNNER = os.path.join(os.path.dirname(__file__),
                       '../runner/dist/jobserv_runner-0.1-py3-none-any.whl')
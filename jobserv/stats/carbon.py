@@ -1,29 +1,128 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import atexit
+import collections
+import logging
+import os
 import socket
+import threading
 import time
 
-from jobserv.settings import CARBON_HOST, CARBON_PREFIX
+from jobserv.settings import CARBON_BUFFER_SIZE, CARBON_HOST, CARBON_PREFIX
+
+log = logging.getLogger()
+
+
+class _Sender(object):
+    '''Sends metrics to carbon from a background thread over a long-lived
+       connection so callers never wait on carbon.
+
+       Metrics are queued in a bounded buffer that drops the oldest entries
+       when carbon is slow or down. The thread writes everything queued in
+       one send, and reconnects with an exponential backoff.'''
+    BATCH_SIZE = 500
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 60
+
+    def __init__(self, address, buffer_size):
+        self.address = address
+        self.buffer_size = buffer_size
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._lines = collections.deque(maxlen=self.buffer_size)
+                self._batch = []
+                self._cond = threading.Condition()
+                self._sock = None
+                self.dropped = 0
+                t = threading.Thread(target=self._run, name='carbon-sender')
+                t.daemon = True
+                t.start()
+                self._pid = os.getpid()
+
+    def put(self, line):
+        if self._pid != os.getpid():
+            # Start on first use. This is also true in a child process after
+            # a fork, where the parent's thread doesn't exist and its locks
+            # and socket can't be trusted.
+            self._start()
+        with self._cond:
+            if len(self._lines) == self.buffer_size:
+                self.dropped += 1
+            self._lines.append(line)
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        '''Wait for everything queued to be sent. Returns False on timeout.'''
+        if self._pid != os.getpid():
+            return True  # nothing has been queued by this process
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._lines and not self._batch, timeout)
+
+    def _connect(self):
+        if not self._sock:
+            self._sock = socket.create_connection(self.address, timeout=10)
+
+    def _close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self):
+        backoff = 0
+        while True:
+            with self._cond:
+                while not self._lines and not self._batch:
+                    self._cond.wait()
+                while self._lines and len(self._batch) < self.BATCH_SIZE:
+                    self._batch.append(self._lines.popleft())
+                batch = ''.join(self._batch).encode()
+            try:
+                self._connect()
+                self._sock.sendall(batch)
+                backoff = 0
+                with self._cond:
+                    self._batch = []
+                    self._cond.notify_all()
+            except OSError as e:
+                self._close()
+                backoff = min(max(backoff * 2, self.MIN_BACKOFF),
+                              self.MAX_BACKOFF)
+                log.warning('Unable to send metrics to carbon, retrying in '
+                            '%.1fs: %s', backoff, e)
+                time.sleep(backoff)
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def _get_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = _Sender(CARBON_HOST, CARBON_BUFFER_SIZE)
+            atexit.register(_sender.flush, 2)
+        return _sender
 
 
 class CarbonClient(object):
     def __init__(self):
-        self._sock = None
         if CARBON_HOST:
             self.send = self._real_send
         else:
             self.send = self._mock_send
 
     def __enter__(self):
-        if CARBON_HOST:
-            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._sock.connect(CARBON_HOST)
         return self
 
     def __exit__(self, *args):
-        if self._sock:
-            self._sock.close()
+        pass
 
     def _mock_send(self, metric, value, timestamp=None):
         pass
@@ -31,20 +130,23 @@ class CarbonClient(object):
     def _real_send(self, metric, value, timestamp=None):
         if timestamp is None:
             timestamp = time.time()
-        buff = '%s%s %f %d\n' % (CARBON_PREFIX, metric, value, timestamp)
-        buff = buff.encode()
-        msglen = len(buff)
-        total = 0
-        while total < msglen:
-            sent = self._sock.send(buff[total:])
-            if sent == 0:
-                raise RuntimeError("socket connection broken")
-            total += sent
+        _get_sender().put(
+            '%s%s %f %d\n' % (CARBON_PREFIX, metric, value, timestamp))
 
     def queued_runs(self, depth):
         '''Track the number of queued runs'''
         self.send('queued_runs', depth)
 
+    def run_completions_queued(self, depth):
+        '''Track the number of runs waiting for completion processing'''
+        self.send('run_completions.queued', depth)
+
+    def run_completion(self, seconds, failed):
+        '''Track how long a run's completion processing took'''
+        self.send('run_completions.seconds', seconds)
+        if failed:
+            self.send('run_completions.failed', 1)
+
     def worker_ping(self, worker, timestamp, metrics):
         '''Track a list of metrics for a worker'''
         for k, v in metrics.items():
@@ -3,15 +3,86 @@
 
 import contextlib
 import datetime
+import gzip
 import json
 import os
 import logging
 import mimetypes
+import shutil
+import tempfile
 
-from jobserv.settings import JOBS_DIR
+from flask import Response, request, send_file
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.urls import url_quote
+
+from jobserv.cache import LRUCache
+from jobserv.console_log import get_writer
+from jobserv.settings import (
+    CONSOLE_LOG_COMPRESSION,
+    JOBS_DIR,
+    RUNDEF_CACHE_DIR,
+    RUNDEF_CACHE_SIZE,
+    SENDFILE_ACCEL_PREFIX,
+    SENDFILE_MODE,
+)
 
 log = logging.getLogger('jobserv.flask')
 
+# Run definitions keyed by their storage path
+rundef_cache = LRUCache(RUNDEF_CACHE_SIZE)
+
+COMPRESSIONS = ('', 'gzip')
+
+
+SENDFILE_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+
+
+def send_local_file(path, mimetype):
+    '''Respond with a file from local disk. Its either handed off to the web
+       server as configured by SENDFILE_MODE, or sent by us with support for
+       conditional and Range requests. Raises FileNotFoundError.'''
+    if SENDFILE_MODE not in SENDFILE_MODES:
+        raise ValueError('Invalid SENDFILE_MODE: ' + SENDFILE_MODE)
+    size = os.stat(path).st_size
+    if SENDFILE_MODE == 'x-sendfile':
+        return Response(mimetype=mimetype, headers={'X-Sendfile': path})
+    if SENDFILE_MODE == 'x-accel-redirect':
+        return Response(mimetype=mimetype, headers={
+            'X-Accel-Redirect': SENDFILE_ACCEL_PREFIX + url_quote(path)})
+
+    resp = send_file(path, mimetype=mimetype)
+    try:
+        return resp.make_conditional(
+            request, accept_ranges=True, complete_length=size)
+    except RequestedRangeNotSatisfiable:
+        resp.close()
+        return '', 416, {'Content-Range': 'bytes */%d' % size}
+
+
+def _rundef_disk_get(storage_path):
+    if RUNDEF_CACHE_DIR:
+        try:
+            with open(os.path.join(RUNDEF_CACHE_DIR, storage_path)) as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            log.exception('Unable to read cached rundef %s', storage_path)
+
+
+def _rundef_disk_put(storage_path, definition):
+    if RUNDEF_CACHE_DIR:
+        path = os.path.join(RUNDEF_CACHE_DIR, storage_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write and rename so other processes never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as f:
+                f.write(definition)
+            os.rename(tmp, path)
+        except OSError:
+            log.exception('Unable to cache rundef %s', storage_path)
+
 
 class BaseStorage(object):
     blueprint = None
@@ -22,18 +93,39 @@ class BaseStorage(object):
     def _create_from_string(self, storage_path, contents):
         raise NotImplementedError()
 
-    def _create_from_file(self, storage_path, filename, mimetype):
+    def _create_from_file(self, storage_path, filename, content_type,
+                          content_encoding=None):
+        raise NotImplementedError()
+
+    def _get_as_bytes(self, storage_path):
+        '''Return the object's data. Objects created with a gzip
+           content_encoding are returned decompressed.'''
         raise NotImplementedError()
 
     def _get_as_string(self, storage_path):
+        return self._get_as_bytes(storage_path).decode()
+
+    def _get_content_encoding(self, storage_path):
+        '''Return the content_encoding the object was created with. Raises
+           FileNotFoundError if it doesn't exist.'''
         raise NotImplementedError()
 
     def _generate_put_url(self, run, path, expiration, content_type):
         raise NotImplementedError()
 
+    def _generate_resumable_url(self, run, path, expiration, content_type,
+                                size):
+        raise NotImplementedError()
+
     def list_artifacts(self, run):
         raise NotImplementedError()
 
+    def list_artifact_details(self, run):
+        '''Like list_artifacts but returns a list of dictionaries with each
+           artifact's path, size, content-type and md5 checksum. The md5 is
+           None when the backend doesn't already have one.'''
+        raise NotImplementedError()
+
     def get_download_response(self, request):
         raise NotImplementedError()
 
@@ -60,12 +152,40 @@ class BaseStorage(object):
     def set_run_definition(self, run, definition):
         path = self._get_run_path(run, '.rundef.json')
         self._create_from_string(path, definition)
+        rundef_cache.put(path, definition)
+        _rundef_disk_put(path, definition)
 
     def get_run_definition(self, run):
-        return self._get_as_string(self._get_run_path(run, '.rundef.json'))
+        path = self._get_run_path(run, '.rundef.json')
+        definition = rundef_cache.get(path)
+        if definition is None:
+            definition = _rundef_disk_get(path)
+            if definition is None:
+                definition = self._get_as_string(path)
+                _rundef_disk_put(path, definition)
+            rundef_cache.put(path, definition)
+        return definition
+
+    def _console_log_path(self, run):
+        return os.path.join(
+            JOBS_DIR, self._get_run_path(run, 'console.log'))
+
+    def append_console_log(self, run, data):
+        get_writer().append(self._console_log_path(run), data)
+
+    def flush_console_log(self, run):
+        '''Make sure everything appended to the run's console log has been
+           written out. This must be called before the log of a completed
+           run is read.'''
+        writer = get_writer()
+        writer.close(self._console_log_path(run))
+        writer.wait_for_others()
 
     def console_logfd(self, run, mode='r'):
-        path = os.path.join(JOBS_DIR, self._get_run_path(run, 'console.log'))
+        path = self._console_log_path(run)
+        if mode[0] in ('a', 'w'):
+            # write out anything we have buffered, so its not out of order
+            get_writer().close(path)
         if mode[0] in ('a', 'w') and not os.path.exists(path):
             try:
                 os.makedirs(os.path.dirname(path))
@@ -74,14 +194,24 @@ class BaseStorage(object):
         return open(path, mode)
 
     def copy_log(self, run):
-        src = os.path.join(JOBS_DIR, self._get_run_path(run, 'console.log'))
+        src = self._console_log_path(run)
+        get_writer().close(src)
 
         if not os.path.exists(src):
             log.warn('Run had no console output')
             return
 
-        self._create_from_file(
-            self._get_run_path(run, 'console.log'), src, 'text/plain')
+        if CONSOLE_LOG_COMPRESSION not in COMPRESSIONS:
+            raise ValueError(
+                'Invalid CONSOLE_LOG_COMPRESSION: ' + CONSOLE_LOG_COMPRESSION)
+        path = self._get_run_path(run, 'console.log')
+        if CONSOLE_LOG_COMPRESSION:
+            with open(src, 'rb') as fin, gzip.open(src + '.gz', 'wb', 6) as f:
+                shutil.copyfileobj(fin, f, 1048576)
+            self._create_from_file(path, src + '.gz', 'text/plain', 'gzip')
+            os.unlink(src + '.gz')
+        else:
+            self._create_from_file(path, src, 'text/plain')
 
         # try and clean up our runs on disk
         os.unlink(src)
@@ -91,19 +221,51 @@ class BaseStorage(object):
         except:
             pass  # another run is still in progress
 
+    def compress_log(self, run):
+        '''Compress a console log copied to storage before
+           CONSOLE_LOG_COMPRESSION was set. Returns False if the run has no
+           log or it was already compressed.'''
+        path = self._get_run_path(run, 'console.log')
+        try:
+            if self._get_content_encoding(path):
+                return False
+            data = self._get_as_bytes(path)
+        except FileNotFoundError:
+            return False
+        with tempfile.NamedTemporaryFile(suffix='.gz') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as gz:
+                gz.write(data)
+            f.flush()
+            self._create_from_file(path, f.name, 'text/plain', 'gzip')
+        return True
+
     def generate_signed(self, run, paths, expiration):
+        '''Return the URLs the runner uploads the paths to. A path can also
+           be given as {"path": p, "size": n, "resumable": true} to get a
+           URL that can be uploaded to in chunks with Content-Range headers,
+           following the GCS resumable upload protocol.'''
         urls = {}
         expiration = datetime.timedelta(seconds=expiration)
         for p in paths:
+            resumable = size = None
+            if isinstance(p, dict):
+                resumable, size = p.get('resumable'), p.get('size')
+                p = p['path']
             ct = mimetypes.guess_type(p)[0]
             if not ct:
                 ct = ''
-            url = self._generate_put_url(
-                run, p, expiration=expiration, content_type=ct)
+            if resumable:
+                url = self._generate_resumable_url(
+                    run, p, expiration=expiration, content_type=ct, size=size)
+            else:
+                url = self._generate_put_url(
+                    run, p, expiration=expiration, content_type=ct)
             urls[p] = {
                 'url': url,
                 'content-type': ct,
             }
+            if resumable:
+                urls[p]['resumable'] = True
         return urls
 
     @contextlib.contextmanager
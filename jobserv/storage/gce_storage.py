@@ -1,9 +1,12 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import base64
+import json
 import os
 import datetime
 import logging
+import threading
 
 from flask import redirect
 from google.cloud import storage
@@ -14,27 +17,68 @@ from jobserv.storage.base import BaseStorage
 log = logging.getLogger('jobserv.flask')
 
 
+class _Bucket(object):
+    '''Storage objects are created several times per request. Creating a
+       client and looking up the bucket each time means re-reading
+       credentials, a bucket metadata request and a new TLS connection. The
+       client and bucket are instead created once per thread, and the
+       client's HTTP connections are kept alive between requests. The
+       client's httplib2 connections can't be shared between threads.'''
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._local = threading.local()
+
+    def get(self):
+        local = self._local
+        # A client created before a fork shares its connections with the
+        # parent, so each process needs its own
+        if getattr(local, 'pid', None) != os.getpid():
+            creds_file = os.environ.get('GCE_CREDS')
+            if creds_file:
+                client = storage.Client.from_service_account_json(creds_file)
+            else:
+                client = storage.Client()
+            local.bucket = client.get_bucket(GCE_BUCKET)
+            local.pid = os.getpid()
+        return local.bucket
+
+
+shared_bucket = _Bucket()
+
+
 class Storage(BaseStorage):
     def __init__(self):
         super().__init__()
-        creds_file = os.environ.get('GCE_CREDS')
-        if creds_file:
-            client = storage.Client.from_service_account_json(creds_file)
-        else:
-            client = storage.Client()
-        self.bucket = client.get_bucket(GCE_BUCKET)
+        self.bucket = shared_bucket.get()
 
     def _create_from_string(self, storage_path, contents):
         b = self.bucket.blob(storage_path)
         b.upload_from_string(contents)
 
-    def _create_from_file(self, storage_path, filename, content_type):
+    def _create_from_file(self, storage_path, filename, content_type,
+                          content_encoding=None):
         b = self.bucket.blob(storage_path)
         with open(filename, 'rb') as f:
             b.upload_from_file(f, content_type=content_type)
+        if content_encoding:
+            # This client version's uploads don't send the blob's metadata,
+            # so it has to be set afterwards. GCS decompresses objects with
+            # a gzip Content-Encoding for clients that don't accept it.
+            b.content_encoding = content_encoding
+            b.patch()
+
+    def _get_as_bytes(self, storage_path):
+        # httplib2 asks for and then decompresses gzip Content-Encodings
+        return self.bucket.blob(storage_path).download_as_string()
 
-    def _get_as_string(self, storage_path):
-        return self.bucket.blob(storage_path).download_as_string().decode()
+    def _get_content_encoding(self, storage_path):
+        b = self.bucket.get_blob(storage_path)
+        if b is None:
+            raise FileNotFoundError(storage_path)
+        return b.content_encoding
 
     def list_artifacts(self, run):
         name = '%s/%s/%s/' % (
@@ -43,11 +87,56 @@ class Storage(BaseStorage):
                 for x in self.bucket.list_blobs(prefix=name)
                 if not x.name.endswith('.rundef.json')]
 
+    def list_artifact_details(self, run):
+        name = self._get_run_path(run)
+        details = []
+        for b in self.bucket.list_blobs(prefix=name):
+            if not b.name.endswith('.rundef.json'):
+                md5 = None
+                if b.md5_hash:  # composite objects don't have one
+                    md5 = base64.b64decode(b.md5_hash).hex()
+                details.append({
+                    'path': b.name[len(name):],
+                    'size': b.size,
+                    'content-type': b.content_type,
+                    'md5': md5,
+                })
+        return details
+
     def _generate_put_url(self, run, path, expiration, content_type):
         b = self.bucket.blob(self._get_run_path(run, path))
         return b.generate_signed_url(
             expiration=expiration, method='PUT', content_type=content_type)
 
+    def _generate_resumable_url(self, run, path, expiration, content_type,
+                                size):
+        # Start a resumable upload session. Its URI is all the runner needs
+        # to upload to it, and is good for a week. This client version has
+        # no API for it, so the session is started the way upload_from_file
+        # does it.
+        conn = self.bucket.client._base_connection
+        url = conn.build_api_url(
+            api_base_url=conn.API_BASE_URL + '/upload',
+            path=self.bucket.path + '/o',
+            query_params={
+                'uploadType': 'resumable',
+                'name': self._get_run_path(run, path),
+            })
+        content_type = content_type or 'application/octet-stream'
+        headers = {
+            'Content-Type': 'application/json; charset=UTF-8',
+            'X-Upload-Content-Type': content_type,
+        }
+        if size:
+            headers['X-Upload-Content-Length'] = str(size)
+        resp, content = conn.http.request(
+            url, 'POST', body=json.dumps({'contentType': content_type}),
+            headers=headers)
+        if resp.status != 200:
+            raise RuntimeError('Unable to start upload of %s: HTTP_%d %s' % (
+                path, resp.status, content))
+        return resp['location']
+
     def get_download_response(self, request, run, path):
         expiration = int(request.headers.get('X-EXPIRATION', '90'))
         b = self.bucket.blob(self._get_run_path(run, path))
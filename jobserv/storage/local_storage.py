@@ -1,21 +1,42 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import base64
+import binascii
+import contextlib
+import gzip
+import hashlib
 import hmac
 import os
 import mimetypes
+import re
 import shutil
+import tempfile
 
 from flask import Blueprint, request, send_file, url_for
 
 from jobserv.jsend import get_or_404
 from jobserv.models import Build, Project, Run
 from jobserv.settings import INTERNAL_API_KEY, LOCAL_ARTIFACTS_DIR
-from jobserv.storage.base import BaseStorage
+from jobserv.storage.base import BaseStorage, send_local_file
 
 
 blueprint = Blueprint('local_storage', __name__, url_prefix='/local-storage')
 
+UPLOAD_CHUNK_SIZE = 1048576
+# Uploads are written here and then renamed into place. Its under the
+# artifacts directory so the rename stays on one filesystem. Resumable
+# uploads that were never finished are left here, so files that haven't been
+# modified in a week or so can safely be cleaned out.
+UPLOAD_DIR = '.uploads'
+
+
+def _gzip_path(path):
+    '''There's no metadata to record a content_encoding in, so objects
+       created with a gzip one are kept in a hidden file named for it.'''
+    dirname, name = os.path.split(path)
+    return os.path.join(dirname, '.%s.gz' % name)
+
 
 class Storage(BaseStorage):
     blueprint = blueprint
@@ -37,16 +58,35 @@ class Storage(BaseStorage):
         with open(path, 'w') as f:
             f.write(contents)
 
-    def _create_from_file(self, storage_path, filename, content_type):
-        path = self._get_local(storage_path)
+    def _create_from_file(self, storage_path, filename, content_type,
+                          content_encoding=None):
+        path = stale = self._get_local(storage_path)
+        if content_encoding == 'gzip':
+            path = _gzip_path(path)
+        else:
+            stale = _gzip_path(path)
         with open(filename, 'rb') as fin, open(path, 'wb') as fout:
             shutil.copyfileobj(fin, fout)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(stale)  # eg the uncompressed log being replaced
 
-    def _get_as_string(self, storage_path):
+    def _get_as_bytes(self, storage_path):
         assert storage_path[0] != '/'
         path = os.path.join(self.artifacts, storage_path)
-        with open(path, 'r') as f:
-            return f.read()
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            with gzip.open(_gzip_path(path), 'rb') as f:
+                return f.read()
+
+    def _get_content_encoding(self, storage_path):
+        path = os.path.join(self.artifacts, storage_path)
+        if os.path.exists(path):
+            return None
+        if os.path.exists(_gzip_path(path)):
+            return 'gzip'
+        raise FileNotFoundError(path)
 
     def list_artifacts(self, run):
         path = '%s/%s/%s/' % (
@@ -54,14 +94,43 @@ class Storage(BaseStorage):
         path = os.path.join(self.artifacts, path)
         for base, _, names in os.walk(path):
             for name in names:
+                if name[0] == '.' and name.endswith('.gz'):
+                    name = name[1:-3]  # see _gzip_path
                 if name != '.rundef.json':
                     yield os.path.join(base, name)[len(path):]
 
+    def list_artifact_details(self, run):
+        # Hashing every artifact here would read all of them, so the md5 is
+        # left out like it is for GCS objects without one
+        base = os.path.join(self.artifacts, self._get_run_path(run))
+        details = []
+        for path in self.list_artifacts(run):
+            full = os.path.join(base, path)
+            if not os.path.exists(full):
+                full = _gzip_path(full)
+            details.append({
+                'path': path,
+                'size': os.path.getsize(full),
+                'content-type': mimetypes.guess_type(path)[0],
+                'md5': None,
+            })
+        return details
+
     def get_download_response(self, request, run, path):
         try:
             p = os.path.join(self.artifacts, self._get_run_path(run), path)
             mt = mimetypes.guess_type(p)[0]
-            return send_file(open(p, 'rb'), mimetype=mt)
+            if not os.path.exists(p) and os.path.exists(_gzip_path(p)):
+                p = _gzip_path(p)
+                if not request.accept_encodings['gzip']:
+                    return send_file(gzip.open(p, 'rb'), mimetype=mt)
+                # Sent by us since the web server could drop the
+                # Content-Encoding header
+                resp = send_file(p, mimetype=mt)
+                resp.headers['Content-Encoding'] = 'gzip'
+                resp.vary.add('Accept-Encoding')
+                return resp.make_conditional(request)
+            return send_local_file(p, mt)
         except FileNotFoundError:
             return 'File not found', 404
 
@@ -74,6 +143,12 @@ class Storage(BaseStorage):
             proj=run.build.project.name, build_id=run.build.build_id,
             run=run.name, path=path, _external=True)
 
+    def _generate_resumable_url(self, run, path, expiration, content_type,
+                                size):
+        # run_upload_artifact switches to resumable uploads when it gets a
+        # Content-Range header
+        return self._generate_put_url(run, path, expiration, content_type)
+
 
 def _get_run(proj, build_id, run):
     p = get_or_404(Project.query.filter_by(name=proj))
@@ -85,6 +160,87 @@ def _get_run(proj, build_id, run):
     ).first_or_404()
 
 
+def receive_upload(stream, dst, tmpdir, length=None, md5=None, sha256=None):
+    '''Write the upload being read from stream to dst. Its written to a temp
+       file that's renamed to dst once complete, so readers never see a
+       partial file. When given, the length is preallocated and the hex
+       digests are verified. Raises ValueError if they don't match.'''
+    hashes = []
+    if md5:
+        hashes.append((hashlib.md5(), md5.lower()))
+    if sha256:
+        hashes.append((hashlib.sha256(), sha256.lower()))
+
+    fd, tmp = tempfile.mkstemp(dir=tmpdir)
+    try:
+        os.fchmod(fd, 0o644)  # mkstemp only allows us to read it
+        with open(fd, 'wb') as f:
+            if length and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, length)
+                except OSError:
+                    pass  # not supported by this filesystem
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                for h, _ in hashes:
+                    h.update(chunk)
+            f.truncate()  # in case we got less than was preallocated
+        for h, expected in hashes:
+            if h.hexdigest() != expected:
+                raise ValueError('%s mismatch' % h.name.upper())
+        os.rename(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def receive_upload_chunk(stream, dst, tmpdir, content_range):
+    '''Handle a chunk of a resumable upload the way GCS does. Its appended
+       to a partial file in tmpdir that's renamed to dst once the last chunk
+       arrives. A Content-Range of "bytes START-END/TOTAL" sends the chunk
+       and "bytes */TOTAL" asks how much has been received. The response
+       is a 308 with a Range header of what we have, or "ok" once
+       complete.'''
+    m = re.match(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+)$', content_range)
+    if not m:
+        return 'Invalid Content-Range: ' + content_range, 400
+    total = int(m.group(3))
+    partial = os.path.join(tmpdir, hashlib.sha1(dst.encode()).hexdigest())
+    try:
+        received = os.path.getsize(partial)
+    except FileNotFoundError:
+        received = 0
+        if m.group(1) is None and os.path.isfile(dst) and \
+                os.path.getsize(dst) == total:
+            return 'ok'  # we're being asked about an upload that completed
+
+    # A chunk that doesn't start where we left off means the client is out
+    # of sync. It'll find out where to resume from the response.
+    if m.group(1) is not None and int(m.group(1)) == received and \
+            received <= int(m.group(2)) < total:
+        try:
+            with open(partial, 'ab') as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        finally:
+            # keep what we got, even if the connection was lost
+            received = os.path.getsize(partial)
+
+    if received == total:
+        os.rename(partial, dst)
+        return 'ok'
+    headers = {}
+    if received:
+        headers['Range'] = 'bytes=0-%d' % (received - 1)
+    return '', 308, headers
+
+
 @blueprint.route(
     '/<sig>/<project:proj>/builds/<int:build_id>/runs/<run>/<path:path>',
     methods=('PUT',))
@@ -99,20 +255,25 @@ def run_upload_artifact(sig, proj, build_id, run, path):
     if not hmac.compare_digest(sig, computed):
         return 'Invalid signature', 401
 
-    dirname = os.path.dirname(p)
+    md5 = request.headers.get('Content-MD5')
+    if md5:
+        try:
+            md5 = base64.b64decode(md5, validate=True).hex()
+        except binascii.Error:
+            return 'Invalid Content-MD5', 400
+
+    tmpdir = os.path.join(ls.artifacts, UPLOAD_DIR)
+    for dirname in (os.path.dirname(p), tmpdir):
+        # we could have 2 uploads trying this, so just do it this way to
+        # avoid race conditions
+        os.makedirs(dirname, exist_ok=True)
+
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        return receive_upload_chunk(request.stream, p, tmpdir, content_range)
     try:
-        # we could have 2 uploads trying this, so just do it this way to avoid
-        # race conditions
-        os.makedirs(dirname)
-    except FileExistsError:
-        pass
-
-    # stream the contents to disk
-    with open(p, 'wb') as f:
-        chunk_size = 4096
-        while True:
-            chunk = request.stream.read(chunk_size)
-            if len(chunk) == 0:
-                break
-            f.write(chunk)
+        receive_upload(request.stream, p, tmpdir, request.content_length,
+                       md5, request.headers.get('X-Content-SHA256'))
+    except ValueError as e:
+        return str(e), 400
     return 'ok'
@@ -11,6 +11,7 @@ from flask import url_for
 from jobserv.jsend import ApiError
 from jobserv.models import Build, BuildStatus, Run, db
 from jobserv.project import ProjectDefinition
+from jobserv.queue_notify import notify_on_commit
 from jobserv.settings import BUILD_URL_FMT
 from jobserv.storage import Storage
 
@@ -34,6 +35,7 @@ def trigger_runs(storage, projdef, build, trigger, params, secrets):
             rundef = projdef.get_run_definition(
                 r, run, trigger['type'], params, secrets)
             storage.set_run_definition(r, rundef)
+        notify_on_commit(db.session)
     except ApiError:
         logging.exception('ApiError while triggering runs for: %r', trigger)
         raise
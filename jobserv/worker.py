@@ -5,6 +5,7 @@ import logging
 import os
 import time
 
+from jobserv.heartbeat import Heartbeat
 from jobserv.models import db, BuildStatus, Run, Worker, WORKER_DIR
 from jobserv.sendmail import notify_surge_started, notify_surge_ended
 from jobserv.settings import SURGE_SUPPORT_RATIO
@@ -18,53 +19,36 @@ logging.basicConfig(
 log = logging.getLogger()
 
 
-def _check_worker(w):
+def _check_worker(w, now, last_seen):
     log.debug('checking worker(%s) online(%s)', w.name, w.enlisted)
-    pings_log = w.pings_log
-
-    try:
-        now = time.time()
-        st = os.stat(pings_log)
-        diff = now - st.st_mtime
-        threshold = 80
-        if w.surges_only:
-            # surge workers check in every 90s so let them miss 3 check-ins
-            threshold = 120
-        if diff > threshold and w.online:
-            # the worker checks in every 20s. This means its missed 4 check-ins
-            log.info('marking %s offline %ds without a check-in', w.name, diff)
-            w.online = False
-            with StatsClient() as c:
-                c.worker_offline(w)
-
-        # based on rough calculations a 1M file is about 9000 entries which is
-        # about 2 days worth of information
-        if st.st_size > (1024 * 1024):
-            # rotate log file
-            rotated = pings_log + '.%d' % now
-            log.info('rotating pings log to: %s', rotated)
-            os.rename(pings_log, rotated)
-
-            # the pings log won't exist now, so we need to touch an empty file
-            # with the proper mtime so we won't mark it offline on the next run
-            # this is technically racy, pings.log could exist at this moment,
-            # so we open in append mode, our st_mtime could be faulty because
-            # of this race condition, but this is one of the reasons why we
-            # give the worker some grace periods to check in
-            open(pings_log, 'a').close()
-            os.utime(pings_log, (st.st_atime, st.st_mtime))
-    except FileNotFoundError:
+    if last_seen is None:
         # its never checked in
         if w.online:
             w.online = False
-            log.info('marking %s offline (no pings log)', w.name)
+            log.info('marking %s offline (no check-ins)', w.name)
             with StatsClient() as c:
                 c.worker_offline(w)
+        return
+
+    diff = now - last_seen
+    threshold = 80
+    if w.surges_only:
+        # surge workers check in every 90s so let them miss 3 check-ins
+        threshold = 120
+    if diff > threshold and w.online:
+        # the worker checks in every 20s. This means its missed 4 check-ins
+        log.info('marking %s offline %ds without a check-in', w.name, diff)
+        w.online = False
+        with StatsClient() as c:
+            c.worker_offline(w)
 
 
 def _check_workers():
-    for w in Worker.query.filter(Worker.enlisted == 1):
-        _check_worker(w)
+    workers = Worker.query.filter(Worker.enlisted == 1).all()
+    last_seen = Heartbeat().last_seen(workers)
+    now = time.time()
+    for w in workers:
+        _check_worker(w, now, last_seen.get(w.name))
     db.session.commit()
 
 
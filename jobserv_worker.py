@@ -143,9 +143,10 @@ class JobServ(object):
             'Authorization': 'Token ' + config['jobserv']['host_api_key'],
         }
 
-    def _get(self, resource, params=None):
+    def _get(self, resource, params=None, timeout=None):
         url = urllib.parse.urljoin(config['jobserv']['server_url'], resource)
-        r = self.requests.get(url, params=params, headers=self._auth_headers())
+        r = self.requests.get(url, params=params, headers=self._auth_headers(),
+                              timeout=timeout)
         if r.status_code != 200:
             log.error('Failed to issue request: %s\n' % r.text)
             sys.exit(1)
@@ -184,7 +185,10 @@ class JobServ(object):
     def delete_host(self):
         self._delete('/workers/%s/' % config['jobserv']['hostname'])
 
-    def check_in(self):
+    def check_in(self, wait=0):
+        '''Check in with the server. If wait is given, the server may hold
+           the request open for up to that many seconds until a run is
+           queued for us.'''
         flocks = HostProps.get_available_runners()
         load_avg_1, load_avg_5, load_avg_15 = os.getloadavg()
         params = {
@@ -197,8 +201,12 @@ class JobServ(object):
             'load_avg_5': load_avg_5,
             'load_avg_15': load_avg_15,
         }
-        data = self._get(
-            '/workers/%s/' % config['jobserv']['hostname'], params).json()
+        timeout = None
+        if wait and flocks:
+            params['wait'] = wait
+            timeout = wait + 30
+        data = self._get('/workers/%s/' % config['jobserv']['hostname'],
+                         params, timeout).json()
         return data, flocks
 
     def get_worker_script(self):
@@ -375,7 +383,7 @@ def cmd_check(args):
         return
 
     HostProps().update_if_needed(args.server)
-    data, flocks = args.server.check_in()
+    data, flocks = args.server.check_in(args.long_poll)
     for rundef in data['data']['worker'].get('run-defs', []):
         rundef = json.loads(rundef)
         # by placing the flock in the rundef, it will stay locked after
@@ -418,13 +426,14 @@ def _docker_clean():
 
 def cmd_loop(args):
     # Ensure no other copy of this script is running
-    cmd_args = [sys.argv[0], 'check']
+    cmd_args = [sys.argv[0], 'check', '--long-poll', str(args.long_poll)]
     with open('/tmp/jobserv_worker.lock', 'w+') as f:
         try:
             fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
             next_clean = time.time() + (args.docker_rm * 3600)
             while True:
                 log.debug('Calling check')
+                start = time.time()
                 rc = subprocess.call(cmd_args)
                 if rc:
                     log.error('Last call exited with rc: %d', rc)
@@ -433,7 +442,8 @@ def cmd_loop(args):
                     _docker_clean()
                     next_clean = time.time() + (args.docker_rm * 3600)
                 else:
-                    time.sleep(args.every)
+                    # A long-poll may have already spent the interval waiting
+                    time.sleep(max(0, args.every - (time.time() - start)))
         except IOError:
             sys.exit('Script is already running')
         except KeyboardInterrupt:
@@ -491,8 +501,16 @@ def get_args(args=None):
     p = sub.add_parser('uninstall', help='Uninstall the client')
     p.set_defaults(func=cmd_uninstall)
 
+    long_poll_help = '''Ask the server to hold the check-in open for up to
+                     this many seconds until a run is queued for us. This
+                     cuts the time it takes for a run to start without
+                     having to check in more often. The server may cap
+                     this or not support it. default=%(default)d'''
+
     p = sub.add_parser('check', help='Check in with server for updates')
     p.set_defaults(func=cmd_check)
+    p.add_argument('--long-poll', type=int, default=0, metavar='seconds',
+                   help=long_poll_help)
 
     p = sub.add_parser('loop', help='Run the "check" command in a loop')
     p.set_defaults(func=cmd_loop)
@@ -505,6 +523,8 @@ def get_args(args=None):
                    help='''Interval in hours to run to run "dock rm" on
                         containers that have exited. default is every
                         %(default)d hours''')
+    p.add_argument('--long-poll', type=int, default=0, metavar='seconds',
+                   help=long_poll_help)
 
     p = sub.add_parser('cronwrap',
                        help='''Run a command and report back to the jobserv
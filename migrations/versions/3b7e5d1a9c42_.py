@@ -0,0 +1,42 @@
+"""Add worker_pings for the db heartbeat backend
+
+Revision ID: 3b7e5d1a9c42
+Revises: ef2c5e9d0ad7
+Create Date: 2018-03-07 14:22:09.118370
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e5d1a9c42'
+down_revision = 'ef2c5e9d0ad7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('worker_pings',
+    sa.Column('worker_name', sa.String(length=512), nullable=False),
+    sa.Column('last_seen', sa.DateTime(), nullable=False),
+    sa.Column('_recent', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['worker_name'], ['workers.name'], ),
+    sa.PrimaryKeyConstraint('worker_name')
+    )
+
+    # Give every worker a check-in now. Otherwise the worker monitor would
+    # mark them all offline before they next check in.
+    workers = sa.table('workers', sa.column('name'))
+    pings = sa.table(
+        'worker_pings', sa.column('worker_name'), sa.column('last_seen'))
+    op.execute(pings.insert().from_select(
+        ['worker_name', 'last_seen'],
+        sa.select([workers.c.name,
+                   sa.literal(datetime.datetime.utcnow(), sa.DateTime)])))
+
+
+def downgrade():
+    op.drop_table('worker_pings')
@@ -0,0 +1,41 @@
+"""Add run_completions for ASYNC_RUN_COMPLETION
+
+Revision ID: 5a9f3c71e2d8
+Revises: 8d4c2e0f6b17
+Create Date: 2018-03-12 16:05:52.410331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9f3c71e2d8'
+down_revision = '8d4c2e0f6b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('run_completions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('_status', sa.Integer(), nullable=True),
+    sa.Column('url', sa.String(length=1024), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('next_attempt', sa.DateTime(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('failed_tests', sa.Boolean(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['run_id'], ['runs.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('run_id')
+    )
+    op.create_index(op.f('ix_run_completions_next_attempt'),
+                    'run_completions', ['next_attempt'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_run_completions_next_attempt'),
+                  table_name='run_completions')
+    op.drop_table('run_completions')
@@ -0,0 +1,51 @@
+"""Add build_run_counts to track the status of a build's runs
+
+Revision ID: 8d4c2e0f6b17
+Revises: 3b7e5d1a9c42
+Create Date: 2018-03-09 11:40:27.563018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4c2e0f6b17'
+down_revision = '3b7e5d1a9c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('build_run_counts',
+    sa.Column('build_id', sa.Integer(), nullable=False),
+    sa.Column('queued', sa.Integer(), nullable=False),
+    sa.Column('running', sa.Integer(), nullable=False),
+    sa.Column('passed', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('running_with_failures', sa.Integer(), nullable=False),
+    sa.Column('uploading', sa.Integer(), nullable=False),
+    sa.Column('promoted', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['build_id'], ['builds.id'], ),
+    sa.PrimaryKeyConstraint('build_id')
+    )
+    # populate the counts for existing builds. The status values are from
+    # jobserv.models.BuildStatus
+    op.execute('''
+        INSERT INTO build_run_counts
+            (build_id, queued, running, passed, failed,
+             running_with_failures, uploading, promoted)
+        SELECT builds.id,
+            COALESCE(SUM(CASE WHEN runs._status = 1 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 2 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 3 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 4 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 5 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 6 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN runs._status = 7 THEN 1 ELSE 0 END), 0)
+        FROM builds LEFT JOIN runs ON runs.build_id = builds.id
+        GROUP BY builds.id''')
+
+
+def downgrade():
+    op.drop_table('build_run_counts')
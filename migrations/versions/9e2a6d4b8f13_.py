@@ -0,0 +1,29 @@
+"""Add run_manifests to record the artifacts of completed runs
+
+Revision ID: 9e2a6d4b8f13
+Revises: c4e1b7a93f60
+Create Date: 2018-03-15 11:22:40.183559
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2a6d4b8f13'
+down_revision = 'c4e1b7a93f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('run_manifests',
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('_artifacts', sa.Text(length=2**24), nullable=False),
+    sa.ForeignKeyConstraint(['run_id'], ['runs.id'], ),
+    sa.PrimaryKeyConstraint('run_id')
+    )
+
+
+def downgrade():
+    op.drop_table('run_manifests')
@@ -0,0 +1,24 @@
+"""Index promoted builds for keyset pagination
+
+Revision ID: c4e1b7a93f60
+Revises: 5a9f3c71e2d8
+Create Date: 2018-03-14 09:47:13.528406
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1b7a93f60'
+down_revision = '5a9f3c71e2d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_builds_proj_id_status_build_id', 'builds',
+                    ['proj_id', '_status', 'build_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_builds_proj_id_status_build_id', table_name='builds')
@@ -0,0 +1,29 @@
+"""Index runs for Run.pop_queued
+
+Revision ID: ef2c5e9d0ad7
+Revises: f775fa543080
+Create Date: 2018-03-05 10:12:41.802214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ef2c5e9d0ad7'
+down_revision = 'f775fa543080'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_runs_status_build_id', 'runs',
+                    ['_status', 'build_id'], unique=False)
+    op.create_index('ix_runs_status_host_tag', 'runs',
+                    ['_status', 'host_tag'], unique=False,
+                    mysql_length={'host_tag': 191})
+
+
+def downgrade():
+    op.drop_index('ix_runs_status_host_tag', table_name='runs')
+    op.drop_index('ix_runs_status_build_id', table_name='runs')
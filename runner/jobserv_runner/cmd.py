@@ -2,53 +2,68 @@
 # Author: Andy Doan <andy.doan@linaro.org>
 
 import os
-import select
+import selectors
 import subprocess
 import time
 
+# How much to read from the command's output on each wakeup
+READ_SIZE = 65536
 
-def _cmd_output(cmd, cwd=None):
-    '''Simple non-blocking way to stream the output of a command'''
-    poller = select.poll()
+# stream_cmd will send data every FLUSH_INTERVAL seconds or when it has
+# FLUSH_SIZE bytes of data buffered
+FLUSH_INTERVAL = 20
+FLUSH_SIZE = 1048576
+
+
+def _cmd_output(cmd, cwd=None, read_size=READ_SIZE, timeout=1):
+    '''Stream the output of a command.
+
+       This blocks on a selector until the command produces output, so a
+       command doesn't cost us any CPU while its quiet. An empty buffer is
+       yielded every `timeout` seconds of silence so that callers can handle
+       things like flushing data they've buffered.
+    '''
     p = subprocess.Popen(
         cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
         stdin=subprocess.DEVNULL,
         cwd=cwd)
 
-    fds = [p.stdout.fileno()]
-    for fd in fds:
-        poller.register(fd, select.POLLIN)
-
-    while len(fds) > 0:
-        events = poller.poll(0)
-        if not events and p.poll() is not None:
-            break
-        for fd, event in events:
-            if event & select.POLLIN:
-                yield os.read(fd, 1024)
-            elif event & select.POLLHUP:
-                poller.unregister(fd)
-                fds.remove(fd)
+    fd = p.stdout.fileno()
+    with selectors.DefaultSelector() as sel:
+        sel.register(fd, selectors.EVENT_READ)
+        while True:
+            if sel.select(timeout):
+                buff = os.read(fd, read_size)
+                if not buff:
+                    break  # EOF, the command has closed its output
+                yield buff
+            elif p.poll() is not None:
+                # The command has exited, but something it spawned may still
+                # be holding its stdout open. Don't wait on that.
+                break
+            else:
+                yield b''
     p.wait()
     p.stdout.close()
     if p.returncode != 0:
         raise subprocess.CalledProcessError(p.returncode, cmd)
 
 
-def stream_cmd(stream_cb, cmd, cwd=None):
+def stream_cmd(stream_cb, cmd, cwd=None, read_size=READ_SIZE,
+               flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
     last_update = 0
     last_buff = b''
     try:
-        for buff in _cmd_output(cmd, cwd):
+        for buff in _cmd_output(cmd, cwd, read_size):
+            last_buff += buff
+            if not last_buff:
+                continue
             now = time.time()
-            # stream data every 20s or if we have a 1M of data
-            if now - last_update > 20 or len(buff) > 1048576:
-                if not stream_cb(last_buff + buff):
-                    last_buff += buff
-                else:
+            if now - last_update > flush_interval \
+                    or len(last_buff) >= flush_size:
+                if stream_cb(last_buff):
                     last_buff = b''
-            else:
-                last_buff += buff
+                    last_update = now
         if last_buff:
             if not stream_cb(last_buff):
                 # Unable to stream part of command output
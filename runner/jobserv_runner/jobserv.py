@@ -2,19 +2,20 @@
 # Author: Andy Doan <andy.doan@linaro.org>
 
 import datetime
+import io
 import json
 import logging
 import mimetypes
 import mmap
 import os
+import threading
 import time
 import urllib.error
 import urllib.request
 import urllib.parse
 
-from http.client import HTTPException
-
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
 
 
 def split(items, group_size):
@@ -56,11 +57,23 @@ def _post(url, data, headers, raise_error=False):
 
 class JobServApi(object):
     SIMULATED = False
+    UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '4'))
+    # it seems that 100 is about the most URLs you can sign in one HTTP
+    # request, so we get them in groups of 75 to be safe
+    URL_GROUP_SIZE = 75
+    # Artifacts bigger than this are uploaded in chunks. After an error the
+    # upload continues from the last chunk the server received rather than
+    # starting over. GCS needs chunks to be a multiple of 256KB.
+    RESUMABLE_UPLOAD_SIZE = 64 * 1048576
+    UPLOAD_CHUNK_SIZE = 32 * 1048576
 
     def __init__(self, run_url, api_key):
         mimetypes.add_type('text/plain', '.log')
         self._run_url = run_url
         self._api_key = api_key
+        self._local = threading.local()
+        self._conns = []  # every thread's dict of connections
+        self._conns_lock = threading.Lock()
 
     def _post(self, data, headers, retry):
         if self.SIMULATED:
@@ -102,7 +115,13 @@ class JobServApi(object):
             url += '/'
         url += 'create_signed'
 
-        urls = [x['file'] for x in uploads]
+        urls = []
+        for x in uploads:
+            if x.get('size', 0) > self.RESUMABLE_UPLOAD_SIZE:
+                urls.append(
+                    {'path': x['file'], 'size': x['size'], 'resumable': True})
+            else:
+                urls.append(x['file'])
         data = json.dumps(urls).encode()
         for i in range(1, 5):
             try:
@@ -114,6 +133,121 @@ class JobServApi(object):
                 logging.exception('Unable to get urls, sleeping and retrying')
                 time.sleep(2 * i)
 
+    def _put(self, url, data, headers, accept=()):
+        '''PUT the data over a connection this thread keeps alive to the
+           url's host. urllib is used when a proxy is configured for it.
+           Returns the response's status and headers. An HTTPError is
+           raised for a status >= 300 unless its in `accept`.'''
+        parts = urllib.parse.urlsplit(url)
+        proxied = parts.scheme in urllib.request.getproxies()
+        if proxied:
+            proxied = not urllib.request.proxy_bypass(parts.hostname)
+        if parts.scheme not in ('http', 'https') or proxied:
+            req = urllib.request.Request(
+                url, data, headers=headers, method='PUT')
+            try:
+                resp = urllib.request.urlopen(req)
+                resp.read()
+                return resp.status, resp.headers
+            except urllib.error.HTTPError as e:
+                if e.code not in accept:
+                    raise
+                return e.code, e.headers
+
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+            with self._conns_lock:
+                self._conns.append(conns)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        while True:
+            conn = conns.pop(key, None)
+            reused = conn is not None
+            if not reused:
+                if parts.scheme == 'https':
+                    conn = HTTPSConnection(parts.netloc)
+                else:
+                    conn = HTTPConnection(parts.netloc)
+            try:
+                conn.request('PUT', path, data, headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue  # the server may have closed it while idle
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                conns[key] = conn
+            if resp.status >= 300 and resp.status not in accept:
+                raise urllib.error.HTTPError(
+                    url, resp.status, resp.reason, resp.headers,
+                    io.BytesIO(body))
+            return resp.status, resp.headers
+
+    def _put_resumable(self, url, data, headers):
+        '''Upload the data in chunks using the GCS resumable upload protocol.
+           Each chunk is answered with a 308 and a Range header saying how
+           much the server has. After an error the server is asked how much
+           it has and the upload continues from there.'''
+        total = len(data)
+        offset = 0
+        failures = 0
+        while True:
+            chunk_headers = dict(headers)
+            try:
+                if offset is None:
+                    chunk_headers['Content-Range'] = 'bytes */%d' % total
+                    status, resp_headers = self._put(
+                        url, b'', chunk_headers, accept=(308,))
+                else:
+                    end = min(offset + self.UPLOAD_CHUNK_SIZE, total) - 1
+                    chunk_headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                        offset, end, total)
+                    # Release the slice even when a traceback still refers
+                    # to it, or the file's mmap can't be closed
+                    with data[offset:end + 1] as chunk:
+                        status, resp_headers = self._put(
+                            url, chunk, chunk_headers, accept=(308,))
+            except (HTTPException, OSError) as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code < 500:
+                    raise  # eg the upload session has expired
+                failures += 1
+                if failures > 4:
+                    raise
+                logging.warning(
+                    'Error uploading %s, resuming: %s', url, str(e))
+                time.sleep(2 * failures)
+                offset = None  # find out where to resume from
+                continue
+            if status != 308:
+                return
+            received = resp_headers.get('Range')
+            received = int(received.split('-')[1]) + 1 if received else 0
+            if offset is not None:
+                if received > offset:
+                    failures = 0  # we're making progress
+                else:
+                    failures += 1
+                    if failures > 4:
+                        raise HTTPException(
+                            'Upload of %s is not making progress' % url)
+            offset = received
+
+    def _close_connections(self):
+        with self._conns_lock:
+            for conns in self._conns:
+                for conn in conns.values():
+                    conn.close()
+                conns.clear()
+            self._conns = []
+        self._local = threading.local()
+
     def _upload_item(self, artifacts_dir, artifact, urldata):
         # http://stackoverflow.com/questions/2502596/
         with open(os.path.join(artifacts_dir, artifact), 'rb') as f:
@@ -124,10 +258,13 @@ class JobServApi(object):
                 mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             try:
                 headers = {'Content-Type': urldata['content-type']}
-
-                req = urllib.request.Request(
-                    urldata['url'], mapped, headers=headers, method='PUT')
-                urllib.request.urlopen(req)
+                # A memoryview is sent with a Content-Length in one go.
+                # http.client would send an mmap in 8k chunked pieces.
+                with memoryview(mapped) as data:
+                    if urldata.get('resumable'):
+                        self._put_resumable(urldata['url'], data, headers)
+                    else:
+                        self._put(urldata['url'], data, headers)
             except urllib.error.URLError as e:
                 return 'Unable to upload %s: %s' % (
                     artifact, urllib_error_str(e))
@@ -135,33 +272,89 @@ class JobServApi(object):
                 return 'Unable to upload %s: %s' % (artifact, str(e))
             except Exception as e:
                 return 'Unexpected error for %s: %s' % (artifact, str(e))
+            finally:
+                if mapped:
+                    try:
+                        mapped.close()
+                    except BufferError:
+                        # Something still has a view of it. The mapping is
+                        # freed along with that, so don't lose our result.
+                        logging.warning('Unable to close mmap of %s', artifact)
 
     def upload(self, artifacts_dir, uploads):
-        def _upload_cb(data):
+        '''Upload the artifacts, largest first so a big one isn't left
+           uploading alone at the end. The URLs for the next group of
+           uploads are signed while the current group is uploading. Returns
+           a list of errors.'''
+        def _upload_cb(artifact, urldata):
             e = None
             for i in range(1, 5):
-                e = self._upload_item(artifacts_dir, data[0], data[1])
+                e = self._upload_item(artifacts_dir, artifact, urldata)
                 if not e:
                     break
-                msg = 'Error uploading %s, sleeping and retrying' % data[0]
+                msg = 'Error uploading %s, sleeping and retrying' % artifact
                 self.update_status('UPLOADING', msg)
                 time.sleep(2 * i)  # try and give the server a moment
-            return e
+            return artifact, e
 
-        # it seems that 100 is about the most URLs you can sign in one HTTP
-        # request, so we'll split up our uploads array into groups of 75 to
-        # be safe and upload them in bunches
-        errors = []
-        upload_groups = split(uploads, 75)
-        for i, upload_group in enumerate(upload_groups):
-            if self.SIMULATED:
+        if not uploads:
+            return []
+        uploads = sorted(uploads, key=lambda x: x.get('size', 0), reverse=True)
+        sizes = {x['file']: x.get('size', 0) for x in uploads}
+        upload_groups = split(uploads, self.URL_GROUP_SIZE)
+        if self.SIMULATED:
+            for upload_group in upload_groups:
                 self.update_status('UPLOADING', 'simulate %s' % upload_group)
-                continue
-            urls = self._get_urls(upload_group)
-            p = ThreadPool(4)
-            errors.extend([x for x in p.map(_upload_cb, urls.items()) if x])
-            if len(upload_groups) > 2:  # lets give some status messages
-                msg = 'Uploading %d%% complete' % (
-                    100 * (i + 1) / len(upload_groups))
-                self.update_status('UPLOADING', msg)
+            return []
+
+        errors = []
+        uploaded = 0
+        start = time.time()
+
+        def _finished(futures):
+            nonlocal uploaded
+            for f in futures:
+                artifact, e = f.result()
+                if e:
+                    errors.append(e)
+                else:
+                    uploaded += sizes.get(artifact, 0)
+
+        def _mbps():
+            return uploaded / max(time.time() - start, 0.001) / 1048576
+
+        try:
+            with ThreadPoolExecutor(1) as signer, \
+                    ThreadPoolExecutor(self.UPLOAD_CONCURRENCY) as uploader:
+                pending = set()
+                urls = signer.submit(self._get_urls, upload_groups[0])
+                for i, upload_group in enumerate(upload_groups):
+                    group_urls = urls.result()
+                    if i + 1 < len(upload_groups):
+                        urls = signer.submit(
+                            self._get_urls, upload_groups[i + 1])
+                    for artifact, urldata in sorted(
+                            group_urls.items(),
+                            key=lambda x: sizes.get(x[0], 0), reverse=True):
+                        pending.add(
+                            uploader.submit(_upload_cb, artifact, urldata))
+                    if i + 1 == len(upload_groups):
+                        break
+                    # Only queue the next group once this one is nearly done
+                    # so its signed URLs don't sit around expiring
+                    while len(pending) > self.UPLOAD_CONCURRENCY:
+                        done, pending = wait(
+                            pending, return_when=FIRST_COMPLETED)
+                        _finished(done)
+                    if len(upload_groups) > 2:  # lets give status messages
+                        msg = 'Uploading %d%% complete, %.1f MB/s' % (
+                            100 * (i + 1) / len(upload_groups), _mbps())
+                        self.update_status('UPLOADING', msg)
+                _finished(wait(pending).done)
+        finally:
+            self._close_connections()
+
+        msg = 'Uploaded %d bytes in %.1fs, %.1f MB/s' % (
+            uploaded, time.time() - start, _mbps())
+        self.update_status('UPLOADING', msg)
         return errors
@@ -1,12 +1,18 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import contextlib
 import json
 
 from flask_testing import TestCase
+from sqlalchemy import event
 
 from jobserv import internal_requests, settings
-from jobserv.jsend import _status_str
+from jobserv.api.health import run_health_snapshot
+from jobserv.api.run import projdef_cache
+from jobserv.storage.base import rundef_cache
+from jobserv.storage.gce_storage import shared_bucket
+from jobserv.jsend import _status_str, response_cache
 from jobserv.models import db, Project
 from jobserv.flask import create_app
 
@@ -23,6 +29,12 @@ class JobServTest(TestCase):
     def setUp(self):
         super().setUp()
         db.create_all()
+        # build ids and run paths get re-used between tests
+        projdef_cache.clear()
+        rundef_cache.clear()
+        run_health_snapshot.clear()
+        response_cache.clear()
+        shared_bucket.clear()
 
     def tearDown(self):
         db.session.remove()
@@ -33,6 +45,22 @@ class JobServTest(TestCase):
             db.session.add(Project(n))
         db.session.commit()
 
+    @contextlib.contextmanager
+    def assertMaxQueries(self, count):
+        '''Fail if more than count SQL statements are run in the block.'''
+        statements = []
+
+        def _count(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', _count)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _count)
+        if len(statements) > count:
+            self.fail('%d queries run, expected at most %d:\n%s' % (
+                len(statements), count, '\n'.join(statements)))
+
     def get_json(self, url, status_code=200, query_string=None, headers=None):
         resp = self.client.get(url, query_string=query_string, headers=headers)
         if status_code != resp.status_code:
@@ -0,0 +1,56 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import subprocess
+
+from unittest import TestCase
+
+from jobserv_runner.cmd import stream_cmd
+
+
+class StreamCmdTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.streamed = []
+
+    def _cb(self, buff):
+        self.streamed.append(buff)
+        return True
+
+    def test_output(self):
+        """Ensure all of a command's output is streamed."""
+        stream_cmd(self._cb, ['/bin/sh', '-c', 'echo foo; echo bar >&2'])
+        self.assertEqual(b'foo\nbar\n', b''.join(self.streamed))
+
+    def test_large_output(self):
+        """Ensure output is chunked by flush_size rather than per read."""
+        cmd = ['/bin/sh', '-c', 'head -c 1000000 /dev/zero']
+        stream_cmd(self._cb, cmd, read_size=4096, flush_size=100000)
+        self.assertEqual(1000000, len(b''.join(self.streamed)))
+        # first chunk is sent right away, the rest should be coalesced
+        self.assertLess(len(self.streamed), 20)
+
+    def test_timed_flush(self):
+        """Ensure buffered output is sent after the command goes quiet."""
+        cmd = ['/bin/sh', '-c', 'echo 1; echo 2; sleep 1.5; echo 3']
+        stream_cmd(self._cb, cmd, flush_interval=0.5)
+        self.assertEqual(b'3\n', self.streamed[-1])
+        self.assertEqual(b'1\n2\n', b''.join(self.streamed[:-1]))
+
+    def test_failed(self):
+        """Ensure a failing command raises an error."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            stream_cmd(self._cb, ['/bin/sh', '-c', 'echo foo; exit 1'])
+        self.assertEqual(b'foo\n', b''.join(self.streamed))
+
+    def test_unstreamed(self):
+        """Ensure data we couldn't stream is returned with the error."""
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            stream_cmd(lambda x: False, ['/bin/echo', 'foo'])
+        self.assertEqual(b'foo\n', cm.exception.unstreamed)
+
+    def test_exited_with_open_stdout(self):
+        """Don't wait on a background process holding stdout open."""
+        cmd = ['/bin/sh', '-c', 'echo foo; sleep 30 &']
+        stream_cmd(self._cb, cmd)
+        self.assertEqual(b'foo\n', b''.join(self.streamed))
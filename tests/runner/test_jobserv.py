@@ -0,0 +1,170 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+from jobserv_runner.jobserv import JobServApi
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _resumable(self, data):
+        # A minimal version of the GCS resumable upload protocol that fails
+        # partway through the second chunk
+        received = self.server.resumable
+        start, total = self.headers['Content-Range'][6:].split('/')
+        self.server.ranges.append(start)
+        if start != '*':
+            start, end = (int(x) for x in start.split('-'))
+            if start == len(received):
+                if start and not self.server.failed:
+                    self.server.failed = True
+                    received.extend(data[:len(data) // 2])
+                    self.send_response(503)
+                    return
+                received.extend(data)
+        if len(received) == int(total):
+            self.server.uploads.append((self.path, bytes(received)))
+            self.send_response(200)
+        else:
+            self.send_response(308)
+            if received:
+                self.send_header('Range', 'bytes=0-%d' % (len(received) - 1))
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.startswith('/resumable/'):
+            self._resumable(data)
+        elif self.path.startswith('/fail/'):
+            self.send_response(500)
+        else:
+            self.server.uploads.append((self.path, data))
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class JobServApiTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), UploadHandler)
+        self.server.connections = 0
+        self.server.lock = threading.Lock()
+        self.server.uploads = []
+        self.server.resumable = bytearray()
+        self.server.ranges = []
+        self.server.failed = False
+        t = threading.Thread(target=self.server.serve_forever)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.urlbase = 'http://127.0.0.1:%d/' % self.server.server_port
+
+        self.api = JobServApi('http://jobserv/run/', 'key')
+        self.api.update_status = mock.Mock()
+        self.signed = []
+
+    def _get_urls(self, uploads, fail=()):
+        self.signed.append([x['file'] for x in uploads])
+        return {x['file']: {
+            'url': '%s%s%s?sig=1' % (
+                self.urlbase, 'fail/' if x['file'] in fail else '', x['file']),
+            'content-type': 'text/plain',
+        } for x in uploads}
+
+    def _create(self, name, size):
+        with open(os.path.join(self.tmpdir, name), 'wb') as f:
+            f.write(b'x' * size)
+        return {'file': name, 'size': size}
+
+    def test_upload(self):
+        uploads = [self._create('f%d' % x, x) for x in range(7)]
+        self.api._get_urls = self._get_urls
+        self.api.URL_GROUP_SIZE = 3
+        self.api.UPLOAD_CONCURRENCY = 1
+        self.assertEqual([], self.api.upload(self.tmpdir, uploads))
+
+        # largest first
+        self.assertEqual(
+            [['f6', 'f5', 'f4'], ['f3', 'f2', 'f1'], ['f0']], self.signed)
+        self.assertEqual(
+            [('/f%d?sig=1' % x, b'x' * x) for x in range(6, -1, -1)],
+            self.server.uploads)
+        # the connection was kept alive between uploads
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual([], self.api._conns)
+
+        msg = self.api.update_status.call_args[0][1]
+        self.assertTrue(msg.startswith('Uploaded 21 bytes in '), msg)
+
+    def test_upload_concurrent(self):
+        uploads = [self._create('f%d' % x, x) for x in range(20)]
+        self.api._get_urls = self._get_urls
+        self.api.URL_GROUP_SIZE = 6
+        self.assertEqual([], self.api.upload(self.tmpdir, uploads))
+        self.assertEqual(
+            sorted('/f%d?sig=1' % x for x in range(20)),
+            sorted(x[0] for x in self.server.uploads))
+        self.assertLessEqual(
+            self.server.connections, JobServApi.UPLOAD_CONCURRENCY)
+
+    @mock.patch('jobserv_runner.jobserv.time.sleep')
+    def test_upload_error(self, sleep):
+        uploads = [self._create('good', 1), self._create('bad', 2)]
+        self.api._get_urls = lambda x: self._get_urls(x, fail=('bad',))
+        errors = self.api.upload(self.tmpdir, uploads)
+        self.assertEqual(1, len(errors))
+        self.assertIn('Unable to upload bad: HTTP_500', errors[0])
+        self.assertEqual([('/good?sig=1', b'x')], self.server.uploads)
+
+    @mock.patch('jobserv_runner.jobserv.time.sleep')
+    def test_upload_resumable(self, sleep):
+        self.api.RESUMABLE_UPLOAD_SIZE = 10
+        self.api.UPLOAD_CHUNK_SIZE = 4
+        uploads = [self._create('big', 11)]
+        with open(os.path.join(self.tmpdir, 'big'), 'wb') as f:
+            f.write(b'0123456789A')
+
+        def get_urls(uploads):
+            self.signed.append(uploads)
+            return {'big': {
+                'url': self.urlbase + 'resumable/big',
+                'content-type': 'application/octet-stream',
+                'resumable': True,
+            }}
+        with mock.patch('jobserv_runner.jobserv._post') as post:
+            post().read.return_value = b'{"data": {"urls": {}}}'
+            self.api._get_urls(uploads)
+            expected = [{'path': 'big', 'size': 11, 'resumable': True}]
+            self.assertEqual(expected, json.loads(post.call_args[0][1]))
+
+        self.api._get_urls = get_urls
+        # the log records keep the retried error, and its traceback, alive
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual([], self.api.upload(self.tmpdir, uploads))
+        self.assertEqual(
+            [('/resumable/big', b'0123456789A')], self.server.uploads)
+        # the second chunk failed after 2 bytes were received, so we asked
+        # where to resume from and only sent the rest of it
+        self.assertEqual(
+            ['0-3', '4-7', '*', '6-9', '10-10'], self.server.ranges)
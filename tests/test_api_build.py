@@ -6,7 +6,9 @@ import json
 from unittest.mock import patch
 
 from jobserv.internal_requests import _sign
-from jobserv.models import Build, BuildStatus, Project, Run, Test, db
+from jobserv.jsend import response_cache
+from jobserv.models import (
+    Build, BuildStatus, Project, Run, RunManifest, Test, db)
 
 from tests import JobServTest
 
@@ -37,6 +39,27 @@ class BuildAPITest(JobServTest):
         for i, b in enumerate(builds):
             self.assertEqual(3 - i, b['build_id'])
 
+    def test_build_list_queries(self):
+        for _ in range(5):
+            b = Build.create(self.project)
+            for i in range(4):
+                db.session.add(Run(b, 'run%d' % i))
+            db.session.flush()
+            for r in b.runs:
+                r.set_status(BuildStatus.RUNNING)
+                r.set_status(BuildStatus.PASSED)
+        db.session.commit()
+
+        # The count shouldn't grow with the number of builds or runs
+        with self.assertMaxQueries(6):
+            builds = self.get_json(self.urlbase)['builds']
+        self.assertEqual(5, len(builds))
+        run = builds[0]['runs'][1]
+        url = 'http://localhost/projects/proj-1/builds/5/runs/run1/'
+        self.assertEqual(url, run['url'])
+        self.assertEqual(url + 'console.log', run['log_url'])
+        self.assertIn('completed', run)
+
     def test_build_list_paginate(self):
         for x in range(8):
             Build.create(self.project)
@@ -47,6 +70,36 @@ class BuildAPITest(JobServTest):
         data = self.get_json(self.urlbase + '?limit=4&page=2')
         self.assertEqual([], data['builds'])
 
+    def test_build_list_keyset(self):
+        for x in range(8):
+            Build.create(self.project)
+        data = self.get_json(self.urlbase + '?limit=3&count=0')
+        self.assertNotIn('total', data)
+        self.assertNotIn('prev', data)
+        self.assertEqual([8, 7, 6], [x['build_id'] for x in data['builds']])
+        self.assertTrue(data['next'].endswith('?before=6&limit=3&count=0'))
+
+        data = self.get_json(data['next'])
+        self.assertEqual([5, 4, 3], [x['build_id'] for x in data['builds']])
+        data = self.get_json(data['next'])
+        self.assertEqual([2, 1], [x['build_id'] for x in data['builds']])
+        self.assertNotIn('next', data)
+
+        # walk back to the start
+        data = self.get_json(data['prev'])
+        self.assertEqual([5, 4, 3], [x['build_id'] for x in data['builds']])
+        data = self.get_json(data['prev'])
+        self.assertEqual([8, 7, 6], [x['build_id'] for x in data['builds']])
+        self.assertNotIn('prev', data)
+
+        # poll for new builds
+        data = self.get_json(self.urlbase + '?after=6')
+        self.assertEqual(8, data['total'])
+        self.assertEqual([8, 7], [x['build_id'] for x in data['builds']])
+
+        resp = self.client.get(self.urlbase + '?before=foo')
+        self.assertEqual(400, resp.status_code)
+
     def test_build_get(self):
         Build.create(self.project)
         b = Build.create(self.project)
@@ -56,6 +109,50 @@ class BuildAPITest(JobServTest):
         self.assertEqual(
             ['QUEUED'], [x['status'] for x in data['status_events']])
 
+    def test_build_get_cached(self):
+        b = Build.create(self.project)
+        db.session.add(Run(b, 'run0'))
+        db.session.commit()
+        url = self.urlbase + '1/'
+        self.assertEqual('QUEUED', self.get_json(url)['build']['status'])
+        b.runs[0].set_status(BuildStatus.PASSED)
+        db.session.commit()
+        self.assertEqual('PASSED', self.get_json(url)['build']['status'])
+
+        # the completed build is served without loading its runs
+        with self.assertMaxQueries(2):
+            data = self.get_json(url)['build']
+        self.assertEqual(['run0'], [x['name'] for x in data['runs']])
+
+        # query strings don't add variants to the cache
+        self.get_json(url + '?foo=1')
+        self.get_json(url + '?foo=2')
+        self.assertEqual(1, len(response_cache.get(('Build', b.id))))
+
+        # a promotion changes the build without changing its runs
+        headers = {'Content-type': 'application/json'}
+        promote = 'http://localhost/projects/proj-1/builds/1/promote'
+        _sign(promote, headers, 'POST')
+        self._post(promote, json.dumps({'name': 'release-x'}), headers, 201)
+        data = self.get_json(url)['build']
+        self.assertEqual(('PROMOTED', 'release-x'),
+                         (data['status'], data['name']))
+
+    def test_build_get_etag(self):
+        Build.create(self.project)
+        resp = self.client.get(self.urlbase + '1/')
+        self.assertEqual(200, resp.status_code)
+        etag = resp.headers['ETag']
+
+        resp = self.client.get(
+            self.urlbase + '1/', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b'', resp.data)
+
+        resp = self.client.get(
+            self.urlbase + '1/', headers={'If-None-Match': '"nope"'})
+        self.assertEqual(200, resp.status_code)
+
     @patch('jobserv.api.build.Storage')
     def test_build_get_definition(self, storage):
         Build.create(self.project)
@@ -127,9 +224,16 @@ class BuildAPITest(JobServTest):
         b.status = BuildStatus.PROMOTED
         b.name = 'release-X'
         b.annotation = 'foo bar'
+        storage().list_artifact_details.return_value = [
+            {'path': 'a', 'size': 1, 'content-type': None, 'md5': None}]
         url = '/projects/%s/promoted-builds/release-X/' % self.project.name
-        build = self.get_json(url)['build']
+        with patch('jobserv.models.db.session.commit') as commit:
+            build = self.get_json(url)['build']
+            # the manifests of all the runs are saved at once
+            self.assertEqual(1, commit.call_count)
         self.assertEqual('foo bar', build['annotation'])
+        self.assertEqual(['run0/a', 'run1/a'], build['artifacts'])
+        self.assertEqual(2, RunManifest.query.count())
 
     def test_promote_post(self):
         b = Build.create(self.project)
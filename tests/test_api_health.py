@@ -2,6 +2,9 @@
 # Author: Andy Doan <andy.doan@linaro.org>
 
 import json
+import time
+
+from unittest.mock import patch
 
 from jobserv.models import Build, BuildStatus, Project, Run, Worker, db
 
@@ -49,3 +52,33 @@ class HealthApiTest(JobServTest):
         self.assertEqual(2, len(d['health']['RUNNING']['worker2']))
 
         self.assertEqual(2, len(d['health']['QUEUED']))
+        item = d['health']['RUNNING']['worker1'][0]
+        self.assertEqual('run1-worker1', item['run'])
+        self.assertEqual(
+            'http://localhost/projects/proj-1/builds/1/runs/run1-worker1/',
+            item['url'])
+        self.assertEqual(b.status_events[0].time.isoformat() + '+00:00',
+                         item['created'])
+
+    def test_run_health_snapshot(self):
+        self.create_projects('proj-1')
+        b = Build.create(Project.query.first())
+        db.session.add(Run(b, 'queued-1'))
+        db.session.commit()
+
+        d = self.get_json('/health/runs/')
+        generated = d['generated']
+        self.assertEqual(1, d['health']['statuses']['QUEUED'])
+
+        db.session.add(Run(b, 'queued-2'))
+        db.session.commit()
+        with self.assertMaxQueries(0):
+            d = self.get_json('/health/runs/')
+        self.assertEqual(generated, d['generated'])
+        self.assertEqual(1, d['health']['statuses']['QUEUED'])
+
+        with patch('jobserv.api.health.time') as t:
+            t.time.return_value = time.time() + 10
+            d = self.get_json('/health/runs/')
+        self.assertNotEqual(generated, d['generated'])
+        self.assertEqual(2, d['health']['statuses']['QUEUED'])
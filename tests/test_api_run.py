@@ -6,9 +6,12 @@ import json
 import os
 import shutil
 import tempfile
+import time
 
 from unittest.mock import Mock, patch
 
+from sqlalchemy import event
+
 import jobserv.models
 import jobserv.storage.base
 
@@ -88,6 +91,19 @@ class RunAPITest(JobServTest):
         self.assertEqual('secret', data['script-repo']['token'])
         self.assertIsNone(data.get('api_key'))
 
+    def _mock_console_log(self, storage):
+        @contextlib.contextmanager
+        def _logfd(run, mode='r'):
+            path = os.path.join(jobserv.storage.base.JOBS_DIR, run.name)
+            with open(path, mode) as f:
+                yield f
+
+        def _append(run, data):
+            with _logfd(run, 'ab') as f:
+                f.write(data)
+        storage.console_logfd = _logfd
+        storage.append_console_log = _append
+
     def _post(self, url, data, headers, status=200):
         resp = self.client.post(url, data=data, headers=headers)
         self.assertEqual(status, resp.status_code, resp.data)
@@ -132,6 +148,139 @@ class RunAPITest(JobServTest):
         self.assertEqual(200, resp.status_code)
         self.assertEqual('text/plain', resp.mimetype)
 
+    @patch('jobserv.storage.gce_storage.storage')
+    def test_get_stream_offset(self, storage):
+        r = Run(self.build, 'run0')
+        r.status = BuildStatus.RUNNING
+        db.session.add(r)
+        db.session.commit()
+
+        with Storage().console_logfd(r, 'ab') as f:
+            f.write(b'this is the message')
+
+        url = self.urlbase + 'run0/console.log'
+        resp = self.client.get(url, query_string={'offset': 8})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(b'the message', resp.data)
+        self.assertEqual('19', resp.headers['X-Next-Offset'])
+
+        resp = self.client.get(url, query_string={'offset': 19})
+        self.assertEqual(b'', resp.data)
+        self.assertEqual('19', resp.headers['X-Next-Offset'])
+
+        resp = self.client.get(url, headers={'Range': 'bytes=8-'})
+        self.assertEqual(206, resp.status_code)
+        self.assertEqual(b'the message', resp.data)
+        self.assertEqual('bytes 8-18/*', resp.headers['Content-Range'])
+
+        resp = self.client.get(url, headers={'Range': 'bytes=19-'})
+        self.assertEqual(416, resp.status_code)
+
+        resp = self.client.get(url, query_string={'offset': 'bad'})
+        self.assertEqual(400, resp.status_code)
+
+    @patch('jobserv.storage.gce_storage.storage')
+    def test_get_stream_sse_disabled(self, storage):
+        r = Run(self.build, 'run0')
+        r.status = BuildStatus.RUNNING
+        db.session.add(r)
+        db.session.commit()
+
+        with Storage().console_logfd(r, 'ab') as f:
+            f.write(b'line 1\n')
+
+        url = self.urlbase + 'run0/console.log'
+        headers = {'Accept': 'text/event-stream'}
+        resp = self.client.get(url, headers=headers)
+        self.assertEqual('text/plain', resp.mimetype)
+        self.assertEqual(b'line 1\n', resp.data)
+
+    @patch('jobserv.api.run.LOG_TAIL_SSE', True)
+    @patch('jobserv.api.run.LOG_TAIL_SSE_MAX', 0)
+    @patch('jobserv.storage.gce_storage.storage')
+    def test_get_stream_sse(self, storage):
+        r = Run(self.build, 'run0')
+        r.status = BuildStatus.RUNNING
+        db.session.add(r)
+        db.session.commit()
+
+        with Storage().console_logfd(r, 'ab') as f:
+            f.write(b'line 1\nline 2\npartial')
+
+        url = self.urlbase + 'run0/console.log'
+        headers = {'Accept': 'text/event-stream', 'Last-Event-ID': '7'}
+        resp = self.client.get(url, headers=headers)
+        self.assertEqual('text/event-stream', resp.mimetype)
+        events = resp.data.decode().split('\n\n')
+        self.assertEqual('id: 14\ndata: line 2\ndata: ', events[1])
+        self.assertEqual('id: 21\ndata: partial', events[2])
+
+    @patch('jobserv.api.run.LOG_TAIL_SSE', True)
+    @patch('jobserv.storage.gce_storage.storage')
+    def test_get_stream_sse_complete(self, storage):
+        r = Run(self.build, 'run0')
+        r.status = BuildStatus.RUNNING
+        db.session.add(r)
+        db.session.commit()
+
+        with Storage().console_logfd(r, 'ab') as f:
+            f.write(b'line 1\n')
+
+        def complete(seconds):
+            with Storage().console_logfd(r, 'ab') as f:
+                f.write(b'done\n')
+            r.set_status(BuildStatus.PASSED)
+
+        url = self.urlbase + 'run0/console.log'
+        headers = {'Accept': 'text/event-stream'}
+        with patch('jobserv.api.run.time') as t:
+            t.time.side_effect = time.time
+            t.sleep.side_effect = complete
+            resp = self.client.get(url, headers=headers)
+            events = resp.data.decode().split('\n\n')
+        self.assertEqual('id: 7\ndata: line 1\ndata: ', events[1])
+        self.assertEqual('id: 12\ndata: done\ndata: ', events[2])
+        self.assertEqual('event: complete\ndata: PASSED', events[3])
+
+    @patch('jobserv.api.run.LOG_TAIL_SSE', True)
+    @patch('jobserv.storage.gce_storage.storage')
+    def test_get_stream_sse_queued(self, storage):
+        r = Run(self.build, 'run0')
+        db.session.add(r)
+        db.session.commit()
+
+        in_transaction = []
+        txns = []
+        session = db.session()
+        listeners = (
+            ('after_begin', lambda *args: txns.append(1)),
+            ('after_commit', lambda *args: txns.clear()),
+        )
+        for name, fn in listeners:
+            event.listen(session, name, fn)
+            self.addCleanup(event.remove, session, name, fn)
+
+        def progress(seconds):
+            in_transaction.append(bool(txns))
+            with Storage().console_logfd(r, 'ab') as f:
+                f.write(b'line %d\n' % len(in_transaction))
+            if len(in_transaction) == 1:
+                r.set_status(BuildStatus.RUNNING)
+            else:
+                r.set_status(BuildStatus.PASSED)
+
+        url = self.urlbase + 'run0/console.log'
+        headers = {'Accept': 'text/event-stream'}
+        with patch('jobserv.api.run.time') as t:
+            t.time.side_effect = time.time
+            t.sleep.side_effect = progress
+            resp = self.client.get(url, headers=headers)
+            events = resp.data.decode().split('\n\n')
+        self.assertEqual('id: 7\ndata: line 1\ndata: ', events[1])
+        self.assertEqual('id: 14\ndata: line 2\ndata: ', events[2])
+        self.assertEqual('event: complete\ndata: PASSED', events[3])
+        self.assertEqual([False, False], in_transaction)
+
     @patch('jobserv.storage.gce_storage.storage')
     def test_run_metadata(self, storage):
         r = Run(self.build, 'run0')
@@ -212,6 +361,64 @@ class RunAPITest(JobServTest):
         self.assertEqual('test-run0', run.name)
         self.assertEqual('QUEUED', run.status.name)
 
+    @patch('jobserv.api.run.Storage')
+    def test_run_complete_triggers_cached(self, storage):
+        m = Mock()
+        m.get_project_definition.return_value = json.dumps({
+            'timeout': 5,
+            'triggers': [
+                {
+                    'name': 'github',
+                    'type': 'github_pr',
+                    'runs': [
+                        {
+                            'name': 'run0',
+                            'triggers': [{'name': 'triggered',
+                                          'run-names': '{name}-run0'}],
+                        },
+                        {
+                            'name': 'run1',
+                            'triggers': [{'name': 'triggered'}],
+                        },
+                    ],
+                },
+                {
+                    'name': 'triggered',
+                    'type': 'simple',
+                    'runs': [{
+                        'name': 'test',
+                        'host-tag': 'bar',
+                        'container': 'container-foo',
+                        'script': 'test',
+                    }],
+                },
+            ],
+            'scripts': {
+                'test': '#test#',
+            }
+        })
+        m.console_logfd.return_value = open('/dev/null', 'w')
+        m.get_run_definition.return_value = json.dumps({})
+        storage.return_value = m
+        for name in ('run0', 'run1'):
+            r = Run(self.build, name)
+            r.trigger = 'github'
+            r.status = BuildStatus.RUNNING
+            db.session.add(r)
+        db.session.commit()
+
+        for r in Run.query.all():
+            headers = [
+                ('Authorization', 'Token %s' % r.api_key),
+                ('X-RUN-STATUS', 'PASSED'),
+            ]
+            self._post(self.urlbase + r.name + '/', None, headers, 200)
+
+        self.assertEqual(1, m.get_project_definition.call_count)
+        # run-names from run0's trigger must not leak into run1's
+        names = [x.name for x in Run.query.all()]
+        self.assertEqual(['run0', 'run1', 'test-run0', 'test'], names)
+
     @patch('jobserv.api.run.Storage')
     def test_run_complete_triggers_name_error(self, storage):
         m = Mock()
@@ -279,12 +486,7 @@ class RunAPITest(JobServTest):
             ],
         })
 
-        @contextlib.contextmanager
-        def _logfd(run, mode='r'):
-            path = os.path.join(jobserv.storage.base.JOBS_DIR, run.name)
-            with open(path, mode) as f:
-                yield f
-        m.console_logfd = _logfd
+        self._mock_console_log(m)
         data = '''
         t1: PASSED
         t2: FAILED
@@ -333,12 +535,7 @@ class RunAPITest(JobServTest):
             ],
         })
 
-        @contextlib.contextmanager
-        def _logfd(run, mode='r'):
-            path = os.path.join(jobserv.storage.base.JOBS_DIR, run.name)
-            with open(path, mode) as f:
-                yield f
-        m.console_logfd = _logfd
+        self._mock_console_log(m)
         data = """
         t1: PASSED
         t2: FAILED
@@ -373,6 +570,53 @@ class RunAPITest(JobServTest):
         expected = [('t1', 'PASSED'), ('t2', 'FAILED')]
         self.assertEqual(expected, results)
 
+    @patch('jobserv.api.run.TEST_GREP_BATCH_SIZE', 2)
+    @patch('jobserv.api.run.Storage')
+    def test_run_complete_tests_batched(self, storage):
+        """Ensure results are tied to the right tests across batches."""
+        m = Mock()
+        m.get_project_definition.return_value = json.dumps({
+            'timeout': 5,
+            'triggers': [{'name': 'github', 'type': 'github_pr',
+                          'runs': [{'name': 'run0'}]}],
+        })
+
+        self._mock_console_log(m)
+        data = ''
+        for t in range(3):
+            data += 'Starting Test: test%d...\n' % t
+            for x in range(5):
+                result = 'FAILED' if t == 1 and x == 3 else 'PASSED'
+                data += 't%d-%d: %s\n' % (t, x, result)
+        rundef = {
+            'test-grepping': {
+                'test-pattern': r'.*Starting Test: (?P<name>\S+)...',
+                'result-pattern': r'\s*(?P<name>\S+): '
+                                  '(?P<result>(PASSED|FAILED))',
+            }
+        }
+        m.get_run_definition.return_value = json.dumps(rundef)
+        storage.return_value = m
+        r = Run(self.build, 'run0')
+        r.trigger = 'github'
+        r.status = BuildStatus.RUNNING
+        db.session.add(r)
+        db.session.commit()
+
+        headers = [
+            ('Authorization', 'Token %s' % r.api_key),
+            ('X-RUN-STATUS', 'PASSED'),
+        ]
+        self._post(self.urlbase + 'run0/', data, headers, 200)
+        self.assertEqual('FAILED', r.status.name)
+        tests = Test.query.all()
+        self.assertEqual(
+            [('test0', 'PASSED'), ('test1', 'FAILED'), ('test2', 'PASSED')],
+            [(x.name, x.status.name) for x in tests])
+        for i, t in enumerate(tests):
+            self.assertEqual(['t%d-%d' % (i, x) for x in range(5)],
+                             [x.name for x in t.results])
+
     @patch('jobserv.api.run.Storage')
     @patch('jobserv.api.run.notify_build_complete')
     def test_build_complete_email(self, build_complete, storage):
@@ -44,6 +44,19 @@ class TestAPITest(JobServTest):
         self.assertEqual('test1', data['tests'][0]['name'])
         self.assertEqual('test1-ctx', data['tests'][0]['context'])
 
+    def test_test_list_queries(self):
+        r = Run.query.all()[0]
+        for i in range(10):
+            db.session.add(Test(r, 'test%d' % (i + 2), None))
+        db.session.commit()
+
+        # project, build, run, tests
+        with self.assertMaxQueries(4):
+            data = self.get_json(self.urlbase)
+        self.assertEqual(11, len(data['tests']))
+        self.assertEqual(self.urlbase + 'test1/',
+                         data['tests'][0]['url'][len('http://localhost'):])
+
     def test_test_get(self):
         data = self.get_json(self.urlbase + 'test1/')
         self.assertEqual(0, len(data['test']['results']))
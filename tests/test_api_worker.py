@@ -7,6 +7,7 @@ import shutil
 import tempfile
 
 import jobserv.models
+from jobserv.heartbeat import Heartbeat
 from jobserv.models import Build, BuildStatus, Project, Run, Worker, db
 
 from unittest.mock import patch
@@ -32,6 +33,19 @@ class WorkerAPITest(JobServTest):
         self.assertEqual('w2', data['workers'][1]['name'])
         self.assertEqual(False, data['workers'][1]['enlisted'])
 
+    def test_worker_list_paginate(self):
+        for x in range(5):
+            db.session.add(
+                Worker('w%d' % x, 'ubuntu', 12, 2, 'aarch64', 'key', 2, []))
+        db.session.commit()
+        data = self.get_json('/workers/?limit=3')
+        self.assertEqual(['w0', 'w1', 'w2'],
+                         [x['name'] for x in data['workers']])
+        self.assertTrue(data['next'].endswith('?after=w2&limit=3'))
+        data = self.get_json(data['next'])
+        self.assertEqual(['w3', 'w4'], [x['name'] for x in data['workers']])
+        self.assertNotIn('next', data)
+
     def test_worker_get(self):
         db.session.add(Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, []))
         db.session.add(Worker('w2', 'fedora', 14, 4, 'amd64', 'key', 1, []))
@@ -56,11 +70,9 @@ class WorkerAPITest(JobServTest):
             '/workers/w1/', headers=headers, query_string=qs)
         self.assertEqual(200, resp.status_code)
         self.assertTrue(Worker.query.all()[0].online)
-        p = os.path.join(jobserv.models.WORKER_DIR, 'w1/pings.log')
-        with open(p) as f:
-            buf = f.read()
-            self.assertIn('num_available=1', buf)
-            self.assertIn('foo=bar', buf)
+        pings = Heartbeat().recent_pings(w)
+        self.assertEqual(1, len(pings))
+        self.assertEqual({'num_available': '1', 'foo': 'bar'}, pings[0][1])
 
     def test_worker_log_event(self):
         w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, [])
@@ -156,6 +168,178 @@ class WorkerAPITest(JobServTest):
         data = json.loads(resp.data.decode())
         self.assertNotIn('run-defs', data['data']['worker'])
 
+    @patch('jobserv.api.worker.Storage')
+    def test_worker_get_runs(self, storage):
+        Run.in_test_mode = True
+        rundef = {
+            'run_url': 'foo',
+            'runner_url': 'foo',
+            'env': {}
+        }
+        storage().get_run_definition.return_value = json.dumps(rundef)
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+
+        self.create_projects('job-1')
+        p = Project.query.all()[0]
+        b = Build.create(p)
+        for x in range(3):
+            r = Run(b, 'run%d' % x)
+            r.host_tag = 'aarch96'
+            db.session.add(r)
+        db.session.commit()
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        resp = self.client.get(
+            '/workers/w1/', headers=headers,
+            query_string='available_runners=2')
+        self.assertEqual(200, resp.status_code, resp.data)
+        data = json.loads(resp.data.decode())
+        self.assertEqual(2, len(data['data']['worker']['run-defs']))
+
+        resp = self.client.get(
+            '/workers/w1/', headers=headers,
+            query_string='available_runners=2')
+        self.assertEqual(200, resp.status_code, resp.data)
+        data = json.loads(resp.data.decode())
+        self.assertEqual(1, len(data['data']['worker']['run-defs']))
+
+    @patch('jobserv.api.worker.Storage')
+    def test_worker_get_runs_requeued(self, storage):
+        """Ensure every popped run is re-queued if we can't send them."""
+        Run.in_test_mode = True
+        storage().get_run_definition.side_effect = RuntimeError('boom')
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+
+        self.create_projects('job-1')
+        p = Project.query.all()[0]
+        b = Build.create(p)
+        for x in range(2):
+            r = Run(b, 'run%d' % x)
+            r.host_tag = 'aarch96'
+            db.session.add(r)
+        db.session.commit()
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        resp = self.client.get('/workers/w1/', headers=headers,
+                               query_string='available_runners=2')
+        self.assertEqual(500, resp.status_code)
+        for r in Run.query.all():
+            self.assertEqual(BuildStatus.QUEUED, r.status)
+            self.assertIsNone(r.worker_name)
+
+    @patch('jobserv.api.worker.WORKER_LONG_POLL_MAX', 30)
+    @patch('jobserv.api.worker.wait_for_runs')
+    @patch('jobserv.api.worker.Storage')
+    def test_worker_get_long_poll(self, storage, wait_for_runs):
+        Run.in_test_mode = True
+        rundef = {
+            'run_url': 'foo',
+            'runner_url': 'foo',
+            'env': {}
+        }
+        storage().get_run_definition.return_value = json.dumps(rundef)
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+        self.create_projects('job-1')
+        b = Build.create(Project.query.all()[0])
+
+        def queue_run(timeout):
+            # simulate a run being triggered while the check-in waits
+            r = Run(b, 'run0')
+            r.host_tag = 'aarch96'
+            db.session.add(r)
+            db.session.commit()
+            return True
+        wait_for_runs.side_effect = queue_run
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        resp = self.client.get('/workers/w1/', headers=headers,
+                               query_string='available_runners=1&wait=60')
+        self.assertEqual(200, resp.status_code, resp.data)
+        data = json.loads(resp.data.decode())
+        self.assertEqual(1, len(data['data']['worker']['run-defs']))
+        self.assertEqual(1, wait_for_runs.call_count)
+        # the wait is capped by WORKER_LONG_POLL_INTERVAL
+        self.assertGreaterEqual(5, wait_for_runs.call_args[0][0])
+
+    @patch('jobserv.api.worker.WORKER_LONG_POLL_MAX', 0)
+    @patch('jobserv.api.worker.wait_for_runs')
+    def test_worker_get_long_poll_disabled(self, wait_for_runs):
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+        db.session.commit()
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        resp = self.client.get('/workers/w1/', headers=headers,
+                               query_string='available_runners=1&wait=60')
+        self.assertEqual(200, resp.status_code, resp.data)
+        data = json.loads(resp.data.decode())
+        self.assertNotIn('run-defs', data['data']['worker'])
+        self.assertFalse(wait_for_runs.called)
+
+    @patch('jobserv.api.worker.WORKER_LONG_POLL_MAX', 300)
+    @patch('jobserv.api.worker.wait_for_runs')
+    def test_worker_get_long_poll_limit(self, wait_for_runs):
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+        db.session.commit()
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        with patch('jobserv.api.worker.time') as t:
+            # the wait ends before the worker would be marked offline
+            t.time.side_effect = [1000, 1010, 1061]
+            resp = self.client.get('/workers/w1/', headers=headers,
+                                   query_string='available_runners=1&wait=300')
+        self.assertEqual(200, resp.status_code, resp.data)
+        self.assertEqual(1, wait_for_runs.call_count)
+
+    @patch('jobserv.api.worker.wait_for_runs')
+    def test_worker_get_long_poll_bad(self, wait_for_runs):
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, ['aarch96'])
+        w.enlisted = True
+        w.online = True
+        db.session.add(w)
+        db.session.commit()
+
+        headers = [
+            ('Content-type', 'application/json'),
+            ('Authorization', 'Token key'),
+        ]
+        for wait in ('foo', 'nan'):
+            resp = self.client.get(
+                '/workers/w1/', headers=headers,
+                query_string='available_runners=1&wait=' + wait)
+            self.assertEqual(400, resp.status_code, resp.data)
+            self.assertIn('Invalid wait value', resp.data.decode())
+        self.assertFalse(wait_for_runs.called)
+
     def test_worker_create_bad(self):
         data = {
         }
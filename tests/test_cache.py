@@ -0,0 +1,38 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+from unittest import TestCase
+
+from jobserv.cache import LRUCache
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(1, c.get('a'))
+        c.put('c', 3)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(1, c.get('a'))
+        self.assertEqual(3, c.get('c'))
+        self.assertEqual(2, len(c))
+        self.assertEqual(3, c.hits)
+        self.assertEqual(1, c.misses)
+
+    def test_get_or_create(self):
+        c = LRUCache(2)
+        calls = []
+
+        def create():
+            calls.append(1)
+            return None  # make sure None values are cached
+        self.assertIsNone(c.get_or_create('a', create))
+        self.assertIsNone(c.get_or_create('a', create))
+        self.assertEqual(1, len(calls))
+
+    def test_disabled(self):
+        c = LRUCache(0)
+        c.put('a', 1)
+        self.assertEqual(0, len(c))
+        self.assertEqual(2, c.get_or_create('a', lambda: 2))
@@ -0,0 +1,115 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import socket
+import threading
+import time
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from jobserv.stats import carbon
+
+
+class _Server(object):
+    '''A fake carbon server that collects the lines sent to it.'''
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.address = self.sock.getsockname()
+        self.data = b''
+        self.connections = 0
+        t = threading.Thread(target=self._run)
+        t.daemon = True
+        t.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            t = threading.Thread(target=self._recv, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _recv(self, conn):
+        while True:
+            buf = conn.recv(4096)
+            if not buf:
+                break
+            self.data += buf
+
+    def wait_for_lines(self, count, timeout=5):
+        '''The sender is done once the data is written to its socket, so
+           give our end a chance to read it.'''
+        end = time.time() + timeout
+        while time.time() < end:
+            lines = self.data.decode().splitlines()
+            if len(lines) >= count:
+                return lines
+            time.sleep(0.01)
+        return self.data.decode().splitlines()
+
+
+class CarbonClientTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = _Server()
+        self.addCleanup(self.server.sock.close)
+        sender = carbon._Sender(self.server.address, 10)
+        p = patch('jobserv.stats.carbon._sender', sender)
+        p.start()
+        self.addCleanup(p.stop)
+
+    @patch('jobserv.stats.carbon.CARBON_HOST', ('localhost', 1))
+    def test_send(self):
+        for x in range(3):
+            with carbon.CarbonClient() as c:
+                c.queued_runs(x)
+        self.assertTrue(carbon._sender.flush(5))
+        self.assertEqual(
+            ['jobserv.queued_runs 0.000000',
+             'jobserv.queued_runs 1.000000',
+             'jobserv.queued_runs 2.000000'],
+            [x.rsplit(' ', 1)[0] for x in self.server.wait_for_lines(3)])
+        # all sent over one connection
+        self.assertEqual(1, self.server.connections)
+
+    def test_drop_oldest(self):
+        sender = carbon._sender
+        sender._start()
+        # hold the condition so the sender can't take anything off the queue
+        with sender._cond:
+            for x in range(15):
+                sender.put('%d\n' % x)
+        self.assertTrue(sender.flush(5))
+        self.assertEqual(5, sender.dropped)
+        self.assertEqual([str(x) for x in range(5, 15)],
+                         self.server.wait_for_lines(10))
+
+    @patch('jobserv.stats.carbon.log')
+    def test_reconnect(self, log):
+        sender = carbon._Sender(('127.0.0.1', 1), 10)
+        sender.MIN_BACKOFF = sender.MAX_BACKOFF = 0.05
+        sender.put('foo\n')
+        self.assertFalse(sender.flush(0.2))
+        self.assertTrue(log.warning.called)
+        # carbon comes back
+        sender.address = self.server.address
+        self.assertTrue(sender.flush(5))
+        self.assertEqual(['foo'], self.server.wait_for_lines(1))
+
+    def test_fork(self):
+        sender = carbon._sender
+        sender.put('parent\n')
+        self.assertTrue(sender.flush(5))
+        parent_cond = sender._cond
+        # pretend we're now in a child process
+        with patch('jobserv.stats.carbon.os.getpid', return_value=-1):
+            sender.put('child\n')
+            self.assertTrue(sender.flush(5))
+        self.assertIsNot(parent_cond, sender._cond)
+        self.assertEqual(['parent', 'child'], self.server.wait_for_lines(2))
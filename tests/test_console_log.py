@@ -0,0 +1,103 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from jobserv.console_log import Writer
+
+
+class WriterTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'run/console.log')
+
+    def _read(self, path=None):
+        with open(path or self.path, 'rb') as f:
+            return f.read()
+
+    def _writer(self, interval=0, size=1024, max_open=10, idle=60):
+        w = Writer(interval, size, 'none', max_open, idle)
+        self.addCleanup(w.close_all)
+        return w
+
+    def test_write_through(self):
+        w = self._writer()
+        w.append(self.path, b'line 1\n')
+        w.append(self.path, b'line 2\n')
+        self.assertEqual(b'line 1\nline 2\n', self._read())
+
+    def test_buffered(self):
+        w = self._writer(interval=60, size=10)
+        w.append(self.path, b'12345')
+        self.assertEqual(b'', self._read())
+        w.append(self.path, b'67890')  # hits the flush size
+        self.assertEqual(b'1234567890', self._read())
+        w.append(self.path, b'abc')
+        w.close(self.path)
+        self.assertEqual(b'1234567890abc', self._read())
+
+    def test_maintain(self):
+        w = self._writer(interval=5, idle=30)
+        w.append(self.path, b'abc')
+        with patch('jobserv.console_log.time') as t:
+            t.time.return_value = w._handles[self.path].buffered_at + 6
+            w._maintain()
+            self.assertEqual(b'abc', self._read())
+            self.assertIn(self.path, w._handles)
+
+            t.time.return_value += 30
+            w._maintain()
+            self.assertNotIn(self.path, w._handles)
+
+        # a new handle is opened for the next append
+        w.append(self.path, b'def')
+        w.close(self.path)
+        self.assertEqual(b'abcdef', self._read())
+
+    def test_wait_for_others(self):
+        ctx = multiprocessing.get_context('fork')
+        appended = ctx.Event()
+        done = ctx.Event()
+
+        def other():
+            w = Writer(0.2, 1024, 'none', 10, 60)
+            w.append(self.path, b'from another process\n')
+            appended.set()
+            done.wait(10)  # don't exit and flush the buffer on close
+
+        p = ctx.Process(target=other)
+        p.start()
+        self.addCleanup(p.join)
+        self.addCleanup(done.set)
+        self.assertTrue(appended.wait(10))
+
+        self._writer(interval=0.2).wait_for_others()
+        self.assertEqual(b'from another process\n', self._read())
+
+    def test_max_open(self):
+        w = self._writer(interval=60, max_open=2)
+        paths = [os.path.join(self.tmpdir, str(x)) for x in range(3)]
+        for p in paths:
+            w.append(p, b'foo')
+        self.assertEqual(paths[1:], list(w._handles.keys()))
+        self.assertEqual(b'foo', self._read(paths[0]))
+
+    def test_uncached(self):
+        w = self._writer(max_open=0)
+        w.append(self.path, b'line 1\n')
+        w.append(self.path, b'line 2\n')
+        self.assertEqual(b'line 1\nline 2\n', self._read())
+        self.assertIsNone(w._pid)  # no handles or thread to maintain them
+        with self.assertRaises(ValueError):
+            self._writer(interval=5, max_open=0)
+
+    def test_invalid_fsync(self):
+        with self.assertRaises(ValueError):
+            Writer(0, 0, 'bad', 1, 1)
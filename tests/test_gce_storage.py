@@ -0,0 +1,114 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import tempfile
+import threading
+
+from unittest import TestCase, mock
+
+from jobserv.storage import gce_storage
+
+
+class GceStorageTest(TestCase):
+    def setUp(self):
+        gce_storage.shared_bucket.clear()
+        self.addCleanup(gce_storage.shared_bucket.clear)
+
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_bucket_shared(self, storage):
+        s1 = gce_storage.Storage()
+        s2 = gce_storage.Storage()
+        self.assertIs(s1.bucket, s2.bucket)
+        self.assertEqual(1, storage.Client.call_count)
+        self.assertEqual(1, storage.Client().get_bucket.call_count)
+
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_bucket_per_thread(self, storage):
+        storage.Client.side_effect = lambda: mock.Mock()
+        buckets = []
+
+        def target():
+            buckets.append(gce_storage.Storage().bucket)
+            buckets.append(gce_storage.Storage().bucket)
+        t = threading.Thread(target=target)
+        t.start()
+        t.join()
+        target()
+        self.assertIs(buckets[0], buckets[1])
+        self.assertIs(buckets[2], buckets[3])
+        self.assertIsNot(buckets[0], buckets[2])
+        self.assertEqual(2, storage.Client.call_count)
+
+    @mock.patch('jobserv.storage.gce_storage.os.getpid')
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_bucket_after_fork(self, storage, getpid):
+        getpid.return_value = 1
+        gce_storage.Storage()
+        getpid.return_value = 2
+        gce_storage.Storage()
+        gce_storage.Storage()
+        self.assertEqual(2, storage.Client.call_count)
+
+    @mock.patch.dict('os.environ', {'GCE_CREDS': '/creds.json'})
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_bucket_creds(self, storage):
+        gce_storage.Storage()
+        gce_storage.Storage()
+        storage.Client.from_service_account_json.assert_called_once_with(
+            '/creds.json')
+
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_resumable_url(self, storage):
+        class Response(dict):
+            status = 200
+        bucket = storage.Client().get_bucket()
+        bucket.path = '/b/bucket'
+        conn = bucket.client._base_connection
+        conn.API_BASE_URL = 'https://gcs'
+        conn.http.request.return_value = (
+            Response(location='https://gcs/session'), b'')
+
+        run = mock.Mock()
+        run.name = 'run'
+        run.build.build_id = 1
+        run.build.project.name = 'proj'
+        s = gce_storage.Storage()
+        url = s._generate_resumable_url(run, 'a.img', 60, '', 10)
+        self.assertEqual('https://gcs/session', url)
+        conn.build_api_url.assert_called_once_with(
+            api_base_url='https://gcs/upload', path='/b/bucket/o',
+            query_params={'uploadType': 'resumable',
+                          'name': 'proj/1/run/a.img'})
+        headers = conn.http.request.call_args[1]['headers']
+        self.assertEqual('10', headers['X-Upload-Content-Length'])
+        self.assertEqual(
+            'application/octet-stream', headers['X-Upload-Content-Type'])
+
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_create_from_file_encoding(self, storage):
+        blob = storage.Client().get_bucket().blob()
+        s = gce_storage.Storage()
+        with tempfile.NamedTemporaryFile() as f:
+            s._create_from_file('foo', f.name, 'text/plain', 'gzip')
+            self.assertEqual('gzip', blob.content_encoding)
+            blob.patch.assert_called_once_with()
+            self.assertEqual(
+                [mock.call.upload_from_file(
+                    mock.ANY, content_type='text/plain'),
+                 mock.call.patch()],
+                [x for x in blob.mock_calls
+                 if x[0] in ('upload_from_file', 'patch')])
+
+            blob.reset_mock()
+            s._create_from_file('foo', f.name, 'text/plain')
+            self.assertFalse(blob.patch.called)
+
+    @mock.patch('jobserv.storage.gce_storage.storage')
+    def test_compress_log(self, storage):
+        bucket = storage.Client().get_bucket()
+        bucket.get_blob.return_value.content_encoding = 'gzip'
+        run = mock.Mock()
+        self.assertFalse(gce_storage.Storage().compress_log(run))
+
+        bucket.get_blob.return_value = None
+        self.assertFalse(gce_storage.Storage().compress_log(run))
@@ -0,0 +1,82 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import os
+import shutil
+import tempfile
+import time
+
+from unittest.mock import patch
+
+import jobserv.models
+
+from jobserv.heartbeat import db_heartbeat, file_heartbeat
+from jobserv.models import db, Worker
+
+from tests import JobServTest
+
+
+class DBHeartbeatTest(JobServTest):
+    def setUp(self):
+        super().setUp()
+        self.workers = []
+        for x in range(3):
+            w = Worker('w%d' % x, 'd', 1, 1, 'amd64', 'k', 1, 'amd64')
+            db.session.add(w)
+            self.workers.append(w)
+        db.session.commit()
+        self.hb = db_heartbeat.Heartbeat()
+
+    def test_last_seen(self):
+        self.hb.ping(self.workers[0], 1000, {'foo': '1'})
+        self.hb.ping(self.workers[1], 1010, {'foo': '1'})
+        self.hb.ping(self.workers[1], 1020, {'foo': '2'})
+        self.assertEqual({'w0': 1000, 'w1': 1020},
+                         self.hb.last_seen(self.workers))
+        self.assertEqual({}, self.hb.last_seen([]))
+
+    @patch('jobserv.heartbeat.db_heartbeat.HEARTBEAT_HISTORY', 3)
+    def test_recent_pings(self):
+        self.assertEqual([], self.hb.recent_pings(self.workers[0]))
+        for x in range(5):
+            self.hb.ping(self.workers[0], 1000 + x, {'foo': str(x)})
+        self.assertEqual([(1002, {'foo': '2'}),
+                          (1003, {'foo': '3'}),
+                          (1004, {'foo': '4'})],
+                         self.hb.recent_pings(self.workers[0]))
+
+
+class FileHeartbeatTest(JobServTest):
+    def setUp(self):
+        super().setUp()
+        jobserv.models.WORKER_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobserv.models.WORKER_DIR)
+        self.worker = Worker('w1', 'd', 1, 1, 'amd64', 'k', 1, 'amd64')
+        self.hb = file_heartbeat.Heartbeat()
+
+    def test_last_seen(self):
+        self.assertEqual({}, self.hb.last_seen([self.worker]))
+        self.hb.ping(self.worker, time.time(), {'foo': '1'})
+        offline = time.time() - 81
+        os.utime(self.worker.pings_log, (offline, offline))
+        self.assertEqual({'w1': offline}, self.hb.last_seen([self.worker]))
+
+    def test_recent_pings(self):
+        self.hb.ping(self.worker, 1000, {'foo': '1', 'bar': 'a'})
+        self.hb.ping(self.worker, 1001, {})
+        self.assertEqual([(1000, {'foo': '1', 'bar': 'a'}), (1001, {})],
+                         self.hb.recent_pings(self.worker))
+
+    def test_rotate(self):
+        # create a big file
+        self.hb.ping(self.worker, time.time(), {})
+        with open(self.worker.pings_log, 'a') as f:
+            f.write('1' * 1024 * 1024)
+        self.assertIn('w1', self.hb.last_seen([self.worker]))
+        self.assertEqual(0, os.stat(self.worker.pings_log).st_size)
+        # there should be two files now
+        self.assertEqual(2, len(
+            os.listdir(os.path.dirname(self.worker.pings_log))))
+
+        # and we should still be considered online
+        self.assertIn('w1', self.hb.last_seen([self.worker]))
@@ -1,15 +1,21 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import base64
+import gzip
+import hashlib
 import json
 import os
 import shutil
 import tempfile
 
+import jobserv.storage.base
 import jobserv.storage.local_storage
 
 from unittest import mock
 
+from sqlalchemy.exc import DataError
+
 from tests import JobServTest
 
 from jobserv.models import Build, BuildStatus, Run, Project, db
@@ -36,6 +42,27 @@ class LocalStorageTest(JobServTest):
 
         self.app.register_blueprint(self.storage.blueprint)
 
+    def test_rundef_cached(self):
+        self.storage.set_run_definition(self.run, '{"a": 1}')
+        path = self.storage._get_run_path(self.run, '.rundef.json')
+        os.unlink(os.path.join(self.tmpdir, path))
+        self.assertEqual('{"a": 1}', self.storage.get_run_definition(self.run))
+
+    def test_rundef_disk_cache(self):
+        cachedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cachedir)
+        with mock.patch('jobserv.storage.base.RUNDEF_CACHE_DIR', cachedir):
+            path = self.storage._get_run_path(self.run, '.rundef.json')
+            self.storage._create_from_string(path, '{"a": 1}')
+            self.assertEqual(
+                '{"a": 1}', self.storage.get_run_definition(self.run))
+
+            # a different process would only have the disk copy
+            jobserv.storage.base.rundef_cache.clear()
+            os.unlink(os.path.join(self.tmpdir, path))
+            self.assertEqual(
+                '{"a": 1}', self.storage.get_run_definition(self.run))
+
     def test_list_empty(self):
         self.assertEqual([], list(self.storage.list_artifacts(self.run)))
 
@@ -48,6 +75,126 @@ class LocalStorageTest(JobServTest):
         found = list(sorted(self.storage.list_artifacts(self.run)))
         self.assertEqual(expected, found)
 
+    def test_list_details(self):
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'file1.txt'), 'a')
+        self.storage._create_from_string(os.path.join(path, 'subdir/1'), 'bc')
+        found = sorted(self.storage.list_artifact_details(self.run),
+                       key=lambda x: x['path'])
+        expected = [
+            {'path': 'file1.txt', 'size': 1, 'content-type': 'text/plain',
+             'md5': None},
+            {'path': 'subdir/1', 'size': 2, 'content-type': None,
+             'md5': None},
+        ]
+        self.assertEqual(expected, found)
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_run_get_manifest(self, storage):
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'file1.txt'), 'a')
+        url = '/projects/local-1/builds/1/runs/run1/'
+        data = self.get_json(url)['run']
+        self.assertEqual(['http://localhost' + url + 'file1.txt'],
+                         data['artifacts'])
+        self.assertEqual(1, self.run.manifest.artifacts[0]['size'])
+
+        # completed runs don't change, so storage isn't listed again
+        with mock.patch.object(self.storage, 'list_artifact_details') as m:
+            data = self.get_json(url)['run']
+            self.assertEqual(['http://localhost' + url + 'file1.txt'],
+                             data['artifacts'])
+            self.assertFalse(m.called)
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_run_get_manifest_fails(self, storage):
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'file1.txt'), 'a')
+        url = '/projects/local-1/builds/1/runs/run1/'
+        err = DataError('INSERT', {}, Exception('Data too long'))
+        with mock.patch('jobserv.models.db.session.commit', side_effect=err):
+            data = self.get_json(url)['run']
+        self.assertEqual(['http://localhost' + url + 'file1.txt'],
+                         data['artifacts'])
+        self.assertIsNone(self.run.manifest)
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_run_get_in_progress(self, storage):
+        self.run.status = BuildStatus.RUNNING
+        db.session.commit()
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'file1.txt'), 'a')
+        data = self.get_json('/projects/local-1/builds/1/runs/run1/')['run']
+        self.assertEqual(1, len(data['artifacts']))
+        self.assertIsNone(self.run.manifest)
+
+    @mock.patch('jobserv.storage.base.CONSOLE_LOG_COMPRESSION', 'gzip')
+    @mock.patch('jobserv.api.run.Storage')
+    def test_compressed_log(self, storage):
+        storage.return_value = self.storage
+        jobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobs_dir)
+        with mock.patch('jobserv.storage.base.JOBS_DIR', jobs_dir):
+            with self.storage.console_logfd(self.run, 'w') as f:
+                f.write('line 1\nline 2\n')
+            self.storage.copy_log(self.run)
+
+        path = self.storage._get_run_path(self.run, '.console.log.gz')
+        with open(os.path.join(self.tmpdir, path), 'rb') as f:
+            self.assertEqual(b'line 1\nline 2\n', gzip.decompress(f.read()))
+        self.assertEqual(['console.log'],
+                         list(self.storage.list_artifacts(self.run)))
+        self.assertEqual('line 1\nline 2\n',
+                         self.storage.get_artifact_content(
+                             self.run, 'console.log'))
+
+        url = '/projects/local-1/builds/1/runs/run1/console.log'
+        r = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, r.status_code)
+        self.assertEqual('gzip', r.headers['Content-Encoding'])
+        self.assertEqual(b'line 1\nline 2\n', gzip.decompress(r.data))
+
+        r = self.client.get(url)
+        self.assertEqual(200, r.status_code)
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEqual(b'line 1\nline 2\n', r.data)
+
+    def test_compress_log(self):
+        path = self.storage._get_run_path(self.run, 'console.log')
+        self.storage._create_from_string(path, 'line 1\n')
+        self.assertTrue(self.storage.compress_log(self.run))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, path)))
+        gz = self.storage._get_run_path(self.run, '.console.log.gz')
+        with open(os.path.join(self.tmpdir, gz), 'rb') as f:
+            self.assertEqual(b'line 1\n', gzip.decompress(f.read()))
+        self.assertEqual('line 1\n', self.storage._get_as_string(path))
+
+        # don't compress it twice
+        self.assertFalse(self.storage.compress_log(self.run))
+        self.assertEqual('line 1\n', self.storage._get_as_string(path))
+
+    def test_compress_log_missing(self):
+        self.assertFalse(self.storage.compress_log(self.run))
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_gzip_magic_not_compressed(self, storage):
+        # data that happens to start like gzip isn't mistaken for it
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run, 'console.log')
+        with open(self.storage._get_local(path), 'wb') as f:
+            f.write(b'\x1f\x8bfoo')
+        self.assertEqual(b'\x1f\x8bfoo', self.storage._get_as_bytes(path))
+
+        url = '/projects/local-1/builds/1/runs/run1/console.log'
+        r = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, r.status_code)
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEqual(b'\x1f\x8bfoo', r.data)
+        self.assertTrue(self.storage.compress_log(self.run))
+
     @mock.patch('jobserv.api.run.Storage')
     def test_download(self, storage):
         storage.return_value = self.storage
@@ -59,6 +206,53 @@ class LocalStorageTest(JobServTest):
         r = self.client.get('/projects/local-1/builds/1/runs/run1/file1.txt')
         self.assertEqual((200, b'a1'), (r.status_code, r.data))
 
+    @mock.patch('jobserv.api.run.Storage')
+    def test_download_range(self, storage):
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(
+            os.path.join(path, 'file1.txt'), '0123456789')
+        url = '/projects/local-1/builds/1/runs/run1/file1.txt'
+
+        r = self.client.get(url, headers={'Range': 'bytes=2-4'})
+        self.assertEqual((206, b'234'), (r.status_code, r.data))
+        self.assertEqual('bytes 2-4/10', r.headers['Content-Range'])
+
+        r = self.client.get(url, headers={'Range': 'bytes=20-'})
+        self.assertEqual(416, r.status_code)
+        self.assertEqual('bytes */10', r.headers['Content-Range'])
+
+        r = self.client.get(url)
+        self.assertEqual('bytes', r.headers['Accept-Ranges'])
+        r = self.client.get(
+            url, headers={'If-None-Match': r.headers['ETag']})
+        self.assertEqual(304, r.status_code)
+
+    @mock.patch('jobserv.storage.base.SENDFILE_MODE', 'x-accel-redirect')
+    @mock.patch('jobserv.api.run.Storage')
+    def test_download_accel_redirect(self, storage):
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'file 1'), 'a')
+        r = self.client.get('/projects/local-1/builds/1/runs/run1/file 1')
+        self.assertEqual((200, b''), (r.status_code, r.data))
+        expected = '/_sendfile' + os.path.join(self.tmpdir, path, 'file%201')
+        self.assertEqual(expected, r.headers['X-Accel-Redirect'])
+
+        r = self.client.get('/projects/local-1/builds/1/runs/run1/file 2')
+        self.assertEqual(404, r.status_code)
+
+    @mock.patch('jobserv.storage.base.SENDFILE_MODE', 'x-sendfile')
+    @mock.patch('jobserv.api.run.Storage')
+    def test_download_sendfile(self, storage):
+        storage.return_value = self.storage
+        path = self.storage._get_run_path(self.run)
+        self.storage._create_from_string(os.path.join(path, 'f.txt'), 'a')
+        r = self.client.get('/projects/local-1/builds/1/runs/run1/f.txt')
+        self.assertEqual((200, b''), (r.status_code, r.data))
+        self.assertEqual(os.path.join(self.tmpdir, path, 'f.txt'),
+                         r.headers['X-Sendfile'])
+
     @mock.patch('jobserv.api.run.Storage')
     def test_upload(self, storage):
         self.run.status = BuildStatus.RUNNING
@@ -95,3 +289,91 @@ class LocalStorageTest(JobServTest):
         db.session.commit()
         r = self.client.get('/projects/local-1/builds/1/runs/run1/foo.txt')
         self.assertEqual((200, b'foo-content'), (r.status_code, r.data))
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_upload_checksums(self, storage):
+        self.run.status = BuildStatus.RUNNING
+        db.session.commit()
+        storage.return_value = self.storage
+        urls = self.storage.generate_signed(self.run, ['a.txt'], 60)
+        url = urls['a.txt']['url']
+        dst = os.path.join(
+            self.tmpdir, self.storage._get_run_path(self.run), 'a.txt')
+
+        md5 = base64.b64encode(hashlib.md5(b'content').digest()).decode()
+        sha = hashlib.sha256(b'content').hexdigest()
+        headers = {
+            'Content-type': 'text/plain',
+            'Content-MD5': md5,
+            'X-Content-SHA256': sha,
+        }
+        r = self.client.put(url, data=b'content', headers=headers)
+        self.assertEqual(200, r.status_code, r.data)
+        with open(dst, 'rb') as f:
+            self.assertEqual(b'content', f.read())
+
+        # a bad upload leaves the existing file alone
+        r = self.client.put(url, data=b'corrupted', headers=headers)
+        self.assertEqual((400, b'MD5 mismatch'), (r.status_code, r.data))
+        with open(dst, 'rb') as f:
+            self.assertEqual(b'content', f.read())
+
+        del headers['Content-MD5']
+        r = self.client.put(url, data=b'corrupted', headers=headers)
+        self.assertEqual((400, b'SHA256 mismatch'), (r.status_code, r.data))
+
+        headers['Content-MD5'] = 'not base64!'
+        r = self.client.put(url, data=b'content', headers=headers)
+        self.assertEqual(400, r.status_code)
+
+        # temp files have all been cleaned up
+        self.assertEqual(
+            [], os.listdir(os.path.join(self.tmpdir, '.uploads')))
+
+    @mock.patch('jobserv.api.run.Storage')
+    def test_upload_resumable(self, storage):
+        self.run.status = BuildStatus.RUNNING
+        db.session.commit()
+        storage.return_value = self.storage
+        urls = self.storage.generate_signed(
+            self.run, [{'path': 'a.img', 'size': 10, 'resumable': True}], 60)
+        self.assertTrue(urls['a.img']['resumable'])
+        url = urls['a.img']['url']
+        dst = os.path.join(
+            self.tmpdir, self.storage._get_run_path(self.run), 'a.img')
+
+        def put(content_range, data=b''):
+            headers = {
+                'Content-type': urls['a.img']['content-type'],
+                'Content-Range': content_range,
+            }
+            return self.client.put(url, data=data, headers=headers)
+
+        r = put('bytes */10')
+        self.assertEqual(308, r.status_code)
+        self.assertNotIn('Range', r.headers)
+
+        r = put('bytes 0-3/10', b'0123')
+        self.assertEqual(308, r.status_code)
+        self.assertEqual('bytes=0-3', r.headers['Range'])
+
+        # out of sync, we're told where to resume from
+        r = put('bytes 6-9/10', b'6789')
+        self.assertEqual(
+            (308, 'bytes=0-3'), (r.status_code, r.headers['Range']))
+        r = put('bytes */10')
+        self.assertEqual(
+            (308, 'bytes=0-3'), (r.status_code, r.headers['Range']))
+
+        # readers don't see the partial upload
+        self.assertFalse(os.path.exists(dst))
+
+        r = put('bytes 4-9/10', b'456789')
+        self.assertEqual((200, b'ok'), (r.status_code, r.data))
+        with open(dst, 'rb') as f:
+            self.assertEqual(b'0123456789', f.read())
+        r = put('bytes */10')
+        self.assertEqual(200, r.status_code)
+
+        r = put('bytes 0-3')
+        self.assertEqual(400, r.status_code)
@@ -1,17 +1,25 @@
 # Copyright (C) 2017 Linaro Limited
 # Author: Andy Doan <andy.doan@linaro.org>
 
+import os
+import shutil
+import tempfile
 import unittest.mock
+
 from sqlalchemy.exc import IntegrityError
 
+import jobserv.models
+
 from jobserv.models import (
     db,
     Build,
+    BuildRunCounts,
     BuildStatus,
     Project,
     Run,
     Test,
     TestResult,
+    Worker,
 )
 
 from tests import JobServTest
@@ -86,6 +94,43 @@ class BuildTest(JobServTest):
         b = Build.create(self.proj)
         self.assertEqual(['QUEUED'], [x.status.name for x in b.status_events])
 
+    def _test_locked(self):
+        b = Build.create(self.proj)
+        with b.locked():
+            b.name = 'locked'
+            b.status = BuildStatus.PASSED
+        db.session.rollback()
+        self.assertEqual('locked', Build.query.get(b.id).name)
+
+    def test_locked_file(self):
+        jobserv.models.JOBS_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobserv.models.JOBS_DIR)
+        self._test_locked()
+        # lock files are removed once the build is complete
+        self.assertEqual([], os.listdir(jobserv.models.JOBS_DIR))
+
+    @unittest.mock.patch('jobserv.models.LOCK_PROVIDER', 'db')
+    def test_locked_db(self):
+        self._test_locked()
+
+    @unittest.mock.patch('jobserv.models.LOCK_PROVIDER', 'db')
+    def test_locked_db_error(self):
+        b = Build.create(self.proj)
+        with self.assertRaises(RuntimeError):
+            with b.locked():
+                b.name = 'locked'
+                raise RuntimeError()
+        # the row lock's transaction was rolled back rather than left open
+        self.assertFalse(db.session.dirty)
+        self.assertIsNone(Build.query.get(b.id).name)
+
+    @unittest.mock.patch('jobserv.models.LOCK_PROVIDER', 'bad')
+    def test_locked_invalid(self):
+        b = Build.create(self.proj)
+        with self.assertRaises(ValueError):
+            with b.locked():
+                pass
+
 
 class RunTest(JobServTest):
     def setUp(self):
@@ -164,6 +209,102 @@ class RunTest(JobServTest):
         self.assertEqual(['QUEUED', 'FAILED'],
                          [x.status.name for x in self.build.status_events])
 
+    def test_pop_queued(self):
+        Run.in_test_mode = True
+        w = Worker('w"1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, 'amd64, arm')
+        db.session.add(w)
+        r = Run(self.build, 'name')
+        r.host_tag = 'arm'
+        db.session.add(r)
+        db.session.commit()
+
+        # the worker name is quoted to make sure its not put into the SQL raw
+        popped = Run.pop_queued(w)
+        self.assertEqual([r.id], [x.id for x in popped])
+        self.assertEqual('w"1', popped[0].worker_name)
+        self.assertEqual(BuildStatus.RUNNING, popped[0].status)
+        self.assertEqual([], Run.pop_queued(w))
+
+    def test_pop_queued_count(self):
+        Run.in_test_mode = True
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, 'arm')
+        db.session.add(w)
+        for x in range(5):
+            r = Run(self.build, 'name%d' % x)
+            r.host_tag = 'arm'
+            db.session.add(r)
+        r = Run(self.build, 'amd64')
+        r.host_tag = 'amd64'
+        db.session.add(r)
+        db.session.commit()
+
+        popped = Run.pop_queued(w, 3)
+        self.assertEqual(['name0', 'name1', 'name2'], [x.name for x in popped])
+        for r in popped:
+            self.assertEqual('w1', r.worker_name)
+            self.assertEqual(BuildStatus.RUNNING, r.status)
+            self.assertEqual(
+                ['RUNNING'], [x.status.name for x in r.status_events])
+
+        popped = Run.pop_queued(w, 3)
+        self.assertEqual(['name3', 'name4'], [x.name for x in popped])
+
+    def test_run_counts(self):
+        Run.in_test_mode = True
+        w = Worker('w1', 'ubuntu', 12, 2, 'aarch64', 'key', 2, 'arm')
+        db.session.add(w)
+        for x in range(3):
+            db.session.add(Run(self.build, 'name%d' % x))
+        db.session.commit()
+        self.assertEqual({BuildStatus.QUEUED},
+                         BuildRunCounts.states(self.build.id))
+
+        r = Run.query.filter_by(name='name0').one()
+        r.set_status(BuildStatus.RUNNING)
+        self.assertEqual({BuildStatus.QUEUED, BuildStatus.RUNNING},
+                         BuildRunCounts.states(self.build.id))
+        self.assertEqual(BuildStatus.RUNNING, self.build.status)
+
+        # pop_queued updates runs outside the ORM
+        for r in Run.query.filter_by(_status=BuildStatus.QUEUED.value):
+            r.host_tag = 'arm'
+        db.session.commit()
+        Run.pop_queued(w, 2)
+        self.assertEqual({BuildStatus.RUNNING},
+                         BuildRunCounts.states(self.build.id))
+
+        # status changes to objects that were expired by a commit
+        for r in Run.query.all():
+            r.status = BuildStatus.PASSED
+            db.session.commit()
+        r = Run.query.filter_by(name='name2').one()
+        r.set_status(BuildStatus.FAILED)
+        db.session.commit()
+        self.assertEqual({BuildStatus.PASSED, BuildStatus.FAILED},
+                         BuildRunCounts.states(self.build.id))
+        self.assertEqual(BuildStatus.FAILED, self.build.status)
+
+        counts = BuildRunCounts.query.get(self.build.id)
+        db.session.refresh(counts)
+        self.assertEqual((0, 0, 2, 1), (counts.queued, counts.running,
+                                        counts.passed, counts.failed))
+
+    def test_run_counts_rebuild(self):
+        db.session.add(Run(self.build, 'name0'))
+        r = Run(self.build, 'name1')
+        r.status = BuildStatus.FAILED
+        db.session.add(r)
+        empty = Build.create(self.proj)
+        db.session.commit()
+
+        BuildRunCounts.query.delete()
+        db.session.commit()
+        BuildRunCounts.rebuild()
+        db.session.commit()
+        self.assertEqual({BuildStatus.QUEUED, BuildStatus.FAILED},
+                         BuildRunCounts.states(self.build.id))
+        self.assertEqual(set(), BuildRunCounts.states(empty.id))
+
 
 class TestsTest(JobServTest):
     def setUp(self):
@@ -0,0 +1,40 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import threading
+
+from unittest.mock import patch
+
+from jobserv.models import db
+from jobserv.queue_notify import notify_on_commit, runs_queued, wait_for_runs
+
+from tests import JobServTest
+
+
+class QueueNotifyTest(JobServTest):
+    def test_wait_timeout(self):
+        self.assertFalse(wait_for_runs(0.1))
+
+    def test_wait_notified(self):
+        t = threading.Timer(0.1, runs_queued)
+        t.start()
+        self.assertTrue(wait_for_runs(5))
+        t.join()
+
+    @patch('jobserv.queue_notify.runs_queued')
+    def test_notify_on_commit(self, runs_queued):
+        notify_on_commit(db.session)
+        self.assertFalse(runs_queued.called)
+        db.session.commit()
+        self.assertEqual(1, runs_queued.call_count)
+
+        # only once per transaction
+        db.session.commit()
+        self.assertEqual(1, runs_queued.call_count)
+
+    @patch('jobserv.queue_notify.runs_queued')
+    def test_notify_rollback(self, runs_queued):
+        notify_on_commit(db.session)
+        db.session.rollback()
+        db.session.commit()
+        self.assertFalse(runs_queued.called)
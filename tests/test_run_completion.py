@@ -0,0 +1,155 @@
+# Copyright (C) 2018 Linaro Limited
+# Author: Andy Doan <andy.doan@linaro.org>
+
+import datetime
+import json
+import shutil
+import tempfile
+
+from unittest.mock import Mock, patch
+
+import jobserv.models
+import jobserv.storage.base
+
+from jobserv.jsend import response_cache
+from jobserv.models import Build, BuildStatus, Project, Run, RunCompletion, db
+from jobserv.run_completion import process_completions
+
+from tests import JobServTest
+
+
+@patch('jobserv.api.run.ASYNC_RUN_COMPLETION', True)
+class RunCompletionTest(JobServTest):
+    def setUp(self):
+        super().setUp()
+        self.create_projects('proj-1')
+        p = Project.query.all()[0]
+        self.build = Build.create(p)
+        self.urlbase = '/projects/proj-1/builds/1/runs/'
+
+        jobserv.storage.base.JOBS_DIR = tempfile.mkdtemp()
+        jobserv.models.JOBS_DIR = jobserv.storage.base.JOBS_DIR
+        self.addCleanup(shutil.rmtree, jobserv.storage.base.JOBS_DIR)
+
+        self.storage = Mock()
+        self.storage.get_project_definition.return_value = json.dumps({
+            'timeout': 5,
+            'triggers': [
+                {
+                    'name': 'github',
+                    'type': 'github_pr',
+                    'runs': [{
+                        'name': 'run0',
+                        'triggers': [
+                            {'name': 'triggered', 'run-names': '{name}-run0'}
+                        ]
+                    }],
+                },
+                {
+                    'name': 'triggered',
+                    'type': 'simple',
+                    'runs': [{
+                        'name': 'test',
+                        'container': 'container-foo',
+                        'host-tag': 'foo',
+                        'script': 'test',
+                    }],
+                },
+            ],
+            'scripts': {
+                'test': '#test#',
+            }
+        })
+        self.storage.get_run_definition.return_value = json.dumps({})
+        for target in ('jobserv.api.run.Storage',
+                       'jobserv.run_completion.Storage'):
+            p = patch(target, return_value=self.storage)
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.run = Run(self.build, 'run0')
+        self.run.trigger = 'github'
+        self.run.status = BuildStatus.RUNNING
+        db.session.add(self.run)
+        db.session.commit()
+
+    def _complete(self, status='PASSED'):
+        headers = [
+            ('Authorization', 'Token %s' % self.run.api_key),
+            ('X-RUN-STATUS', status),
+        ]
+        resp = self.client.post(self.urlbase + 'run0/', headers=headers)
+        self.assertEqual(200, resp.status_code, resp.data)
+
+    def test_queued(self):
+        self._complete()
+        # a retry by the runner shouldn't queue it again
+        self._complete()
+        self.assertEqual(1, RunCompletion.query.count())
+        self.assertEqual(BuildStatus.RUNNING, self.run.status)
+        self.assertFalse(self.storage.copy_log.called)
+
+    def test_process(self):
+        self._complete()
+        self.assertEqual(1, process_completions(self.app))
+        self.assertEqual(0, RunCompletion.query.count())
+
+        db.session.refresh(self.run)
+        self.assertEqual(BuildStatus.PASSED, self.run.status)
+        self.assertTrue(self.storage.copy_log.called)
+        triggered = Run.query.filter_by(name='test-run0').one()
+        self.assertEqual(BuildStatus.QUEUED, triggered.status)
+
+        # triggered runs get the URL the status was posted to
+        args = self.storage.set_run_definition.call_args[0]
+        rundef = json.loads(args[1])
+        self.assertEqual('http://localhost' + self.urlbase + 'run0/',
+                         rundef['env']['H_TRIGGER_URL'])
+
+    @patch('jobserv.run_completion.log')
+    def test_retry(self, log):
+        failed_at = []
+
+        def copy_log(run):
+            failed_at.append(datetime.datetime.utcnow())
+            raise RuntimeError('storage is down')
+        self.storage.copy_log.side_effect = copy_log
+        self._complete()
+        self.assertEqual(1, process_completions(self.app))
+
+        c = RunCompletion.query.one()
+        self.assertEqual(1, c.attempts)
+        self.assertFalse(c.failed_tests)
+        self.assertIn('storage is down', c.last_error)
+        # the retry is scheduled from when it failed, not when the batch began
+        self.assertGreaterEqual(
+            c.next_attempt, failed_at[0] + datetime.timedelta(seconds=60))
+        db.session.refresh(self.run)
+        self.assertEqual(BuildStatus.RUNNING, self.run.status)
+
+        # not due yet
+        self.assertEqual(0, process_completions(self.app))
+
+        # storage comes back
+        self.storage.copy_log.side_effect = None
+        c.next_attempt = datetime.datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(1, process_completions(self.app))
+        db.session.refresh(self.run)
+        self.assertEqual(BuildStatus.PASSED, self.run.status)
+
+    @patch('jobserv.run_completion.RUN_COMPLETION_MAX_ATTEMPTS', 1)
+    @patch('jobserv.run_completion.log')
+    def test_give_up(self, log):
+        self.storage.copy_log.side_effect = RuntimeError('storage is down')
+        self._complete()
+        response_cache.put(('Run', self.run.id), {})
+        response_cache.put(('Build', self.build.id), {})
+        self.assertEqual(1, process_completions(self.app))
+        self.assertEqual(0, RunCompletion.query.count())
+        db.session.refresh(self.run)
+        self.assertEqual(BuildStatus.FAILED, self.run.status)
+        # the log is still archived if it can be, and caches are cleared
+        self.assertEqual(2, self.storage.copy_log.call_count)
+        self.assertIsNone(response_cache.get(('Run', self.run.id)))
+        self.assertIsNone(response_cache.get(('Build', self.build.id)))
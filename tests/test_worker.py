@@ -6,6 +6,8 @@ import shutil
 import tempfile
 import time
 
+from unittest.mock import patch
+
 import jobserv.models
 import jobserv.worker
 
@@ -37,24 +39,15 @@ class TestWorkerMonitor(JobServTest):
 
     def test_offline(self):
         self.worker.ping()
-        offline = time.time() - 81  # 81 seconds old
-        os.utime(self.worker.pings_log, (offline, offline))
-        _check_workers()
+        with patch('jobserv.worker.time') as t:
+            t.time.return_value = time.time() + 81  # 81 seconds old
+            _check_workers()
         db.session.refresh(self.worker)
         self.assertFalse(self.worker.online)
 
-    def test_rotate(self):
-        # create a big file
+    def test_online(self):
         self.worker.ping()
-        with open(self.worker.pings_log, 'a') as f:
-            f.write('1' * 1024 * 1024)
         _check_workers()
-        self.assertEqual(0, os.stat(self.worker.pings_log).st_size)
-        # there should be two files now
-        self.assertEqual(2, len(
-            os.listdir(os.path.dirname(self.worker.pings_log))))
-
-        # we should still be online
         db.session.refresh(self.worker)
         self.assertTrue(self.worker.online)
 